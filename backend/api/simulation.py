@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request
 from typing import List, Optional
 from pydantic import BaseModel
 
@@ -47,3 +47,28 @@ async def update_weather(request: Request, condition: str):
         engine.set_weather(condition)
         return {"status": "updated", "weather": condition}
     return {"error": "Engine not running"}
+
+@router.post("/config/clock")
+async def update_clock(request: Request, time_multiplier: Optional[float] = None, fast_forward: Optional[bool] = None, policy: Optional[str] = None):
+    """
+    Update the simulation clock: time multiplier (e.g. 10x / 60x),
+    unthrottled fast-forward, and catch-up policy (skip / catch_up).
+    """
+    engine = request.app.state.simulation_engine
+    if engine:
+        try:
+            engine.set_clock(time_multiplier=time_multiplier, fast_forward=fast_forward, policy=policy)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"status": "updated", "clock": engine.scheduler.stats.dict()}
+    return {"error": "Engine not running"}
+
+@router.get("/clock")
+async def get_clock(request: Request):
+    """
+    Tick scheduler stats: overruns, lag, skipped ticks and simulated time.
+    """
+    engine = request.app.state.simulation_engine
+    if engine:
+        return engine.scheduler.stats.dict()
+    return {"error": "Engine not running"}
@@ -1,24 +1,145 @@
+import json
 from fastapi import APIRouter, HTTPException, Request
-from simulation.scenarios import ScenarioConfig, SimulationResult
-from simulation.what_if_engine import WhatIfEngine
+from fastapi.responses import StreamingResponse
+from simulation.scenarios import ScenarioConfig, SimulationResult, EnsembleResult
+from simulation.sweep import SweepRequest, expand_variants, run_sweep, rank
+from simulation.ensemble import EnsembleRequest
+from what_if_jobs import WhatIfJob, JobStatus, JobQueueFull
 
 router = APIRouter(prefix="/api/what-if", tags=["what-if"])
 
+def _jobs(request: Request):
+    jobs = getattr(request.app.state, "what_if_jobs", None)
+    if not jobs:
+        raise HTTPException(status_code=503, detail="What-if job queue not ready")
+    return jobs
+
+def _queue_full(e: JobQueueFull):
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "10"})
+
+class SlotStreamingResponse(StreamingResponse):
+    # Gives the queue slot back however the response ends: finished, client gone
+    # mid-stream, or the body never started (disconnect / failed header send)
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
 @router.post("/simulate", response_model=SimulationResult)
 async def run_what_if_simulation(config: ScenarioConfig, request: Request):
     simulation_engine = getattr(request.app.state, "simulation_engine", None)
-    
+
+    if not simulation_engine:
+        raise HTTPException(status_code=503, detail="Simulation Engine not ready or not initialized")
+
+    # Runs on the what-if pool against a snapshot of the live state, under the job
+    # queue's admission control (long horizons should still use /jobs for progress)
+    try:
+        return await _jobs(request).simulate(simulation_engine.trains, simulation_engine.blocks, config)
+    except JobQueueFull as e:
+        raise _queue_full(e)
+
+@router.post("/jobs", status_code=202, response_model=WhatIfJob)
+async def submit_what_if_job(config: ScenarioConfig, request: Request):
+    """Queue a what-if run; progress is streamed as Socket.IO "what_if_job" events."""
+    simulation_engine = getattr(request.app.state, "simulation_engine", None)
     if not simulation_engine:
         raise HTTPException(status_code=503, detail="Simulation Engine not ready or not initialized")
-        
-    # 1. Create What-If Engine instance with CLONED state
-    # simulation_engine.trains and simulation_engine.blocks are the live state
-    what_if = WhatIfEngine(simulation_engine.trains, simulation_engine.blocks)
-    
-    # 2. Apply Scenario Modifiers
-    what_if.apply_scenario(config)
-    
-    # 3. Run Simulation
-    result = what_if.run(horizon_minutes=config.simulation_horizon_minutes)
-    
-    return result
+    try:
+        return await _jobs(request).submit(simulation_engine.trains, simulation_engine.blocks, config)
+    except JobQueueFull as e:
+        raise _queue_full(e)
+
+@router.get("/jobs")
+async def list_what_if_jobs(request: Request):
+    jobs = _jobs(request)
+    return {"stats": jobs.stats(), "jobs": list(jobs.jobs.values())}
+
+@router.get("/jobs/{job_id}", response_model=WhatIfJob)
+async def get_what_if_job(job_id: str, request: Request):
+    job = _jobs(request).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@router.get("/jobs/{job_id}/result", response_model=SimulationResult)
+async def get_what_if_job_result(job_id: str, request: Request):
+    jobs = _jobs(request)
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if job.status != JobStatus.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status.value}")
+    return jobs.result(job_id)
+
+@router.post("/jobs/{job_id}/cancel", response_model=WhatIfJob)
+async def cancel_what_if_job(job_id: str, request: Request):
+    job = await _jobs(request).cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@router.post("/ensemble", response_model=EnsembleResult)
+async def run_what_if_ensemble(ensemble: EnsembleRequest, request: Request):
+    """Monte Carlo run: delay percentiles, pair conflict probabilities, utilization spread."""
+    simulation_engine = getattr(request.app.state, "simulation_engine", None)
+    if not simulation_engine:
+        raise HTTPException(status_code=503, detail="Simulation Engine not ready or not initialized")
+    if any(not 0 <= p <= 100 for p in ensemble.percentiles):
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+
+    # NumPy-heavy; runs on the what-if pool so the event loop (and the live broadcast) stays responsive
+    try:
+        return await _jobs(request).ensemble(simulation_engine.trains, simulation_engine.blocks, ensemble)
+    except JobQueueFull as e:
+        raise _queue_full(e)
+
+@router.post("/sweep")
+async def run_what_if_sweep(sweep: SweepRequest, request: Request, stream: bool = True):
+    """
+    Run every variant of a base scenario (parameter grid and / or explicit list) in
+    parallel. Streams NDJSON: one {"event": "result"} line per variant as it
+    completes, then {"event": "ranking"} with all variants ranked by `rank_by`.
+    With stream=false, returns the ranking only. A running sweep holds one what-if
+    queue slot (429 when the queue is full).
+    """
+    simulation_engine = getattr(request.app.state, "simulation_engine", None)
+    if not simulation_engine:
+        raise HTTPException(status_code=503, detail="Simulation Engine not ready or not initialized")
+    try:
+        variants = expand_variants(sweep)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    jobs = _jobs(request)
+    try:
+        release = jobs.reserve()
+    except JobQueueFull as e:
+        raise _queue_full(e)
+
+    results = run_sweep(simulation_engine.trains, simulation_engine.blocks, variants,
+                        include_results=sweep.include_results, workers=sweep.workers)
+
+    if not stream:
+        try:
+            return {"variants": len(variants), "ranked": rank([entry async for entry in results], sweep.rank_by)}
+        finally:
+            release()
+
+    async def lines():
+        try:
+            completed = []
+            async for entry in results:
+                completed.append(entry)
+                yield json.dumps({"event": "result", **entry}) + "\n"
+            # Ranking repeats the KPIs only; full results were already streamed
+            ranked = rank([{k: v for k, v in e.items() if k != "result"} for e in completed], sweep.rank_by)
+            yield json.dumps({"event": "ranking", "rank_by": sweep.rank_by, "ranked": ranked}) + "\n"
+        finally:
+            release() # as soon as the sweep is done; the response releases again as a no-op
+
+    return SlotStreamingResponse(lines(), release, media_type="application/x-ndjson")
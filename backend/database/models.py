@@ -22,6 +22,9 @@ class ConflictLog(BaseModel):
     location: str
     time: datetime
     severity: str
+    event: str = "raised" # alert lifecycle transition: raised / updated / cleared
+    alert_id: Optional[int] = None
+    message: Optional[str] = None
 
 class AISuggestionLog(BaseModel):
     suggestion_id: str
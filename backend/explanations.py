@@ -0,0 +1,124 @@
+import itertools
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Memoized SHAP explanations.
+# Inputs are quantized (weather / priority / track / direction are already discrete;
+# delays and time gaps are bucketed), so nearby requests share one cache entry. Misses
+# in a batch are deduplicated and explained with a single SHAP call on the "explain"
+# pool. The common grid is precomputed at startup, so the Copilot can attach an
+# explanation to every suggestion without SHAP showing up in the tick.
+
+DELAY_BUCKET_MIN = 0.5
+GAP_BUCKET_MIN = 0.5
+MAX_DELAY_MIN = 60.0
+MAX_GAP_MIN = 30.0
+
+# Explainable models: MLService batch method + per-feature quantizers
+EXPLAIN_METHODS = {
+    "delay": "explain_delay_batch",
+    "conflict": "explain_conflict_batch",
+}
+
+def _bucket(value: float, step: float, upper: float) -> float:
+    return round(min(max(float(value), 0.0), upper) / step) * step
+
+def quantize(model: str, row: Sequence[float]) -> Tuple[float, ...]:
+    if model == "delay":
+        weather, priority, current_delay = row
+        return (float(round(weather)), float(round(priority)), _bucket(current_delay, DELAY_BUCKET_MIN, MAX_DELAY_MIN))
+    if model == "conflict":
+        track_id, time_gap, opposite_dir = row
+        return (float(round(track_id)), _bucket(time_gap, GAP_BUCKET_MIN, MAX_GAP_MIN), float(round(opposite_dir)))
+    raise ValueError(f"Unknown explanation model: {model}")
+
+def common_grid(model: str) -> List[Tuple[float, ...]]:
+    # Ranges seen in the training data (historical_movements / conflict_cases)
+    if model == "delay":
+        delays = np.arange(0.0, 20.0 + DELAY_BUCKET_MIN, DELAY_BUCKET_MIN)
+        return [quantize("delay", r) for r in itertools.product(range(3), range(2), delays)]
+    if model == "conflict":
+        gaps = np.arange(0.0, 20.0 + GAP_BUCKET_MIN, GAP_BUCKET_MIN)
+        return [quantize("conflict", r) for r in itertools.product(range(1, 5), gaps, range(2))]
+    return []
+
+class ExplanationCache:
+    """LRU of quantized input -> explanation, with hit/miss counters."""
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[float, ...], dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[float, ...]) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Tuple[float, ...], value: dict):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+class ExplanationService:
+    def __init__(self, inference, cache_size: int = 4096):
+        self.inference = inference
+        self.caches: Dict[str, ExplanationCache] = {model: ExplanationCache(cache_size) for model in EXPLAIN_METHODS}
+        self.shap_calls = 0
+
+    async def explain_batch(self, model: str, rows: List[Sequence[float]]) -> List[dict]:
+        """Explain many rows; cache misses go to SHAP together in one call."""
+        cache = self.caches[model]
+        keys = [quantize(model, row) for row in rows]
+        results: List[Optional[dict]] = [cache.get(key) for key in keys]
+
+        missing = list(dict.fromkeys(key for key, result in zip(keys, results) if result is None))
+        if missing:
+            self.shap_calls += 1
+            explained = await self.inference.run("explain", EXPLAIN_METHODS[model], np.array(missing, dtype=np.float64))
+            fresh = dict(zip(missing, explained))
+            for key, explanation in fresh.items():
+                # Empty dicts mean the explainer is not loaded; don't pin them in the cache
+                if explanation:
+                    cache.put(key, explanation)
+            results = [result if result is not None else fresh[key] for key, result in zip(keys, results)]
+        return results
+
+    async def explain(self, model: str, row: Sequence[float]) -> dict:
+        return (await self.explain_batch(model, [row]))[0]
+
+    async def precompute(self):
+        # Warm the cache with the common input grid (one SHAP call per model)
+        for model in EXPLAIN_METHODS:
+            grid = common_grid(model)
+            try:
+                await self.explain_batch(model, grid)
+                print(f"Precomputed {len(grid)} {model} explanations")
+            except Exception as e:
+                print(f"Explanation precompute failed ({model}): {e}")
+
+    def clear(self):
+        for cache in self.caches.values():
+            cache.clear()
+
+    def stats(self) -> dict:
+        return {"shap_calls": self.shap_calls, **{model: cache.stats() for model, cache in self.caches.items()}}
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+# Precomputed congestion forecasts.
+# Prophet.predict rebuilds the history frame and samples uncertainty intervals on
+# every call, so instead of running it per request the forecast for the maximum
+# horizon is computed in the background on a schedule; requests slice the cached
+# rows. The cache expires after `ttl_s` and is invalidated when the model file on
+# disk changes (the model is reloaded and the forecast recomputed).
+
+MAX_HORIZON_HOURS = 168 # one week, hourly
+REFRESH_INTERVAL_S = 600.0
+CACHE_TTL_S = 1800.0
+MODEL_POLL_INTERVAL_S = 30.0
+
+class CachedForecast(BaseModel):
+    horizon: int # hours precomputed
+    generated_at: datetime
+    model_mtime: Optional[float] = None
+    rows: List[dict] = []
+
+class ForecastCache:
+    def __init__(self, inference, max_horizon: int = MAX_HORIZON_HOURS,
+                 refresh_interval_s: float = REFRESH_INTERVAL_S, ttl_s: float = CACHE_TTL_S,
+                 poll_interval_s: float = MODEL_POLL_INTERVAL_S, model_path: str = None):
+        self.inference = inference
+        self.max_horizon = max_horizon
+        self.refresh_interval_s = refresh_interval_s
+        self.ttl_s = ttl_s
+        self.poll_interval_s = poll_interval_s
+        self.model_path = model_path # None: follow the active MLService's model file
+        self.forecast: Optional[CachedForecast] = None
+        self.hits = 0
+        self.misses = 0
+        self._generated_mono = 0.0
+        self._lock = asyncio.Lock()
+        self._running = False
+
+    def _model_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.model_path or self.inference.ml_service.congestion_model_path)
+        except OSError:
+            return None
+
+    def is_fresh(self) -> bool:
+        if self.forecast is None:
+            return False
+        if time.monotonic() - self._generated_mono > self.ttl_s:
+            return False
+        return self.forecast.model_mtime == self._model_mtime()
+
+    async def refresh(self, reload_model: bool = False, only_if_stale: bool = False):
+        async with self._lock:
+            # Concurrent cold requests queue on the lock; only the first one recomputes
+            if only_if_stale and self.is_fresh():
+                return
+            mtime = self._model_mtime()
+            if reload_model:
+                await self.inference.run("congestion", "reload_congestion_model")
+            rows = await self.inference.run("congestion", "predict_congestion", self.max_horizon)
+            self.forecast = CachedForecast(
+                horizon=self.max_horizon,
+                generated_at=datetime.now(),
+                model_mtime=mtime,
+                rows=rows,
+            )
+            self._generated_mono = time.monotonic()
+
+    async def get(self, hours: int = 24) -> dict:
+        """First `hours` rows of the cached forecast (recomputed first if stale)."""
+        if self.is_fresh():
+            self.hits += 1
+        else:
+            self.misses += 1
+            stale_model = self.forecast is not None and self.forecast.model_mtime != self._model_mtime()
+            await self.refresh(reload_model=stale_model, only_if_stale=True)
+
+        hours = max(0, min(int(hours), self.forecast.horizon))
+        return {
+            "forecast": self.forecast.rows[:hours],
+            "horizon": self.forecast.horizon,
+            "generated_at": self.forecast.generated_at.isoformat(),
+        }
+
+    async def run(self):
+        # Background loop: scheduled refresh, plus a cheap mtime poll for model swaps
+        self._running = True
+        last_refresh = 0.0
+        while self._running:
+            try:
+                model_changed = self.forecast is not None and self.forecast.model_mtime != self._model_mtime()
+                due = self.forecast is None or time.monotonic() - last_refresh >= self.refresh_interval_s
+                if model_changed or due:
+                    if model_changed:
+                        print("Congestion model changed on disk, recomputing forecast...")
+                    await self.refresh(reload_model=model_changed)
+                    last_refresh = time.monotonic()
+            except Exception as e:
+                print(f"Congestion forecast refresh failed: {e}")
+                last_refresh = time.monotonic()
+            await asyncio.sleep(self.poll_interval_s)
+
+    def stop(self):
+        self._running = False
+
+    def invalidate(self):
+        # Model version swapped: the next request / loop pass recomputes
+        self.forecast = None
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "horizon": self.forecast.horizon if self.forecast else None,
+            "generated_at": self.forecast.generated_at.isoformat() if self.forecast else None,
+        }
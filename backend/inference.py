@@ -0,0 +1,234 @@
+import asyncio
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Inference executor layer: every MLService call runs off the asyncio loop, on a pool
+# per model, so a slow model (Prophet, SHAP, the LSTM) never stalls Socket.IO
+# broadcasts or other HTTP requests.
+#
+# Each model can use a thread pool (default; sklearn / torch release the GIL in their
+# kernels) or a process pool, whose workers load their own MLService.
+
+DEFAULT_POOLS = {
+    "eta": "thread",
+    "delay": "thread",
+    "conflict": "thread",
+    "congestion": "thread",
+    "explain": "thread",
+}
+
+# Row-batched MLService methods used by the request coalescer and batch endpoints
+BATCH_METHODS = {
+    "eta": "predict_eta_batch",
+    "delay": "predict_delay_batch",
+    "conflict": "predict_conflict_batch",
+}
+
+# Feature row width per model (eta: speed, dist, delay, hour; delay: weather, priority,
+# current_delay; conflict: track_id, time_gap, opposite_dir)
+FEATURE_COUNTS = {
+    "eta": 4,
+    "delay": 3,
+    "conflict": 3,
+}
+
+def validate_row(row, n_features: int = None) -> List[float]:
+    """Coerce a feature row to floats; raises ValueError for a malformed row."""
+    try:
+        values = [float(v) for v in row]
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Feature row must be numeric: {e}")
+    if n_features is not None and len(values) != n_features:
+        raise ValueError(f"Expected {n_features} features, got {len(values)}")
+    return values
+
+_worker_service = None
+
+def _init_worker(models_dir: str = None, version: str = None):
+    global _worker_service
+    from ml_service import MLService, MODELS_DIR
+    _worker_service = MLService(models_dir or MODELS_DIR, version)
+
+def _call_in_worker(method: str, args: tuple):
+    return getattr(_worker_service, method)(*args)
+
+class InferenceExecutor:
+    def __init__(self, ml_service, pools: Dict[str, str] = None, workers_per_model: int = 2):
+        self.ml_service = ml_service
+        self.kinds = dict(DEFAULT_POOLS)
+        self.kinds.update(pools or {})
+        self.workers_per_model = workers_per_model
+        self._pools: Dict[str, Executor] = {}
+        self._batchers: Dict[str, "MicroBatcher"] = {}
+
+    def _pool(self, model: str) -> Executor:
+        pool = self._pools.get(model)
+        if pool is None:
+            if self.kinds.get(model, "thread") == "process":
+                pool = ProcessPoolExecutor(
+                    max_workers=self.workers_per_model, initializer=_init_worker,
+                    initargs=(self.ml_service.models_dir, self.ml_service.version),
+                )
+            else:
+                pool = ThreadPoolExecutor(max_workers=self.workers_per_model, thread_name_prefix=f"ml-{model}")
+            self._pools[model] = pool
+        return pool
+
+    async def run(self, model: str, method: str, *args):
+        """Await MLService.<method>(*args) on the pool configured for `model`."""
+        loop = asyncio.get_running_loop()
+        pool = self._pool(model)
+        if isinstance(pool, ProcessPoolExecutor):
+            return await loop.run_in_executor(pool, _call_in_worker, method, args)
+        return await loop.run_in_executor(pool, getattr(self.ml_service, method), *args)
+
+    async def predict(self, model: str, row: list) -> float:
+        """Single-row prediction, coalesced with concurrent requests for the same model."""
+        batcher = self._batchers.get(model)
+        if batcher is None:
+            batcher = self._batchers[model] = MicroBatcher(self, model, BATCH_METHODS[model], FEATURE_COUNTS.get(model))
+        return await batcher.submit(row)
+
+    async def predict_batch(self, model: str, rows: list) -> list:
+        """Explicit batch: one model call for all rows."""
+        if not rows:
+            return []
+        rows = [validate_row(row, FEATURE_COUNTS.get(model)) for row in rows]
+        result = await self.run(model, BATCH_METHODS[model], np.array(rows, dtype=np.float64))
+        return np.asarray(result).tolist()
+
+    def swap_service(self, ml_service):
+        """
+        Point new calls at another MLService (a new model version).
+        Calls already running keep their bound method and finish on the old service;
+        process pools are retired (their queued work completes) and respawn on demand.
+        """
+        old_pools = {m: p for m, p in self._pools.items() if isinstance(p, ProcessPoolExecutor)}
+        self.ml_service = ml_service
+        for model, pool in old_pools.items():
+            del self._pools[model]
+            pool.shutdown(wait=False)
+
+    def batch_stats(self) -> dict:
+        return {model: batcher.stats() for model, batcher in self._batchers.items()}
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools = {}
+
+class DeadlineScorer:
+    """
+    Batch scoring with a per-tick deadline.
+    If the model misses the deadline the tick proceeds with the last known score for
+    each key (marked stale); the in-flight call keeps running and refreshes the cache
+    when it lands. At most one call is in flight, so slow models never pile up.
+    Last known scores are kept for the `max_keys` most recently scored keys.
+    """
+    def __init__(self, executor: InferenceExecutor, model: str, method: str, deadline_s: float = 0.2,
+                 default: float = 0.0, max_keys: int = 10000):
+        self.executor = executor
+        self.model = model
+        self.method = method
+        self.deadline_s = deadline_s
+        self.default = default
+        self.max_keys = max_keys
+        self.last: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.misses = 0
+        self._pending: Optional[asyncio.Task] = None
+        self._pending_keys: List[Hashable] = []
+
+    def _harvest(self):
+        task, self._pending = self._pending, None
+        if task.cancelled() or task.exception() is not None:
+            if not task.cancelled():
+                print(f"ML scoring failed ({self.method}): {task.exception()}")
+            return
+        for key, score in zip(self._pending_keys, np.asarray(task.result()).tolist()):
+            self.last[key] = score
+            self.last.move_to_end(key)
+        # Keys (train pairs) that have not been scored for a while are dropped
+        while len(self.last) > self.max_keys:
+            self.last.popitem(last=False)
+
+    async def score(self, X: np.ndarray, keys: List[Hashable]) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (scores, stale mask). Keys never scored before get `default` and stale=True."""
+        fresh_call = self._pending is None
+        if fresh_call:
+            self._pending_keys = list(keys)
+            self._pending = asyncio.ensure_future(self.executor.run(self.model, self.method, X))
+
+        await asyncio.wait({self._pending}, timeout=self.deadline_s)
+        if self._pending.done():
+            self._harvest()
+            if fresh_call:
+                scores = np.array([self.last.get(k, self.default) for k in keys])
+                return scores, np.zeros(len(keys), dtype=bool)
+        else:
+            self.misses += 1
+
+        scores = np.array([self.last.get(k, self.default) for k in keys])
+        return scores, np.ones(len(keys), dtype=bool)
+
+class MicroBatcher:
+    """
+    Request coalescer: single-row predictions arriving within `window_s` of each other
+    (or until `max_batch` rows) are stacked into one batched model call and the results
+    fanned back out to each caller. Rows are validated on submit, so a malformed row
+    fails its own request only, never the batch it would have joined.
+    """
+    def __init__(self, executor: InferenceExecutor, model: str, batch_method: str, n_features: int = None,
+                 window_s: float = 0.003, max_batch: int = 256):
+        self.executor = executor
+        self.model = model
+        self.batch_method = batch_method
+        self.n_features = n_features
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self.batches = 0
+        self.rows = 0
+        self._queue: List[Tuple[list, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, row: list) -> float:
+        row = validate_row(row, self.n_features) # raises ValueError for this caller only
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((row, future))
+        if len(self._queue) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue = self._queue, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[list, asyncio.Future]]):
+        self.batches += 1
+        self.rows += len(batch)
+        try:
+            X = np.array([row for row, _ in batch], dtype=np.float64)
+            results = np.asarray(await self.executor.run(self.model, self.batch_method, X)).tolist()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_size": round(self.rows / self.batches, 2) if self.batches else 0.0,
+        }
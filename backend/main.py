@@ -3,15 +3,24 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import asyncio
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import socketio
 from contextlib import asynccontextmanager
 
+from pydantic import ValidationError
 from simulation.engine import SimulationEngine
+from simulation.spatial import Subscription
 from database.service import DatabaseService
-from ml_service import MLService
+from model_registry import ModelRegistry
+from ml_service import configure_torch
+from inference import InferenceExecutor
+from forecast_cache import ForecastCache
+from explanations import ExplanationService
+from what_if_jobs import WhatIfJobQueue
+from simulation.sweep import shutdown_pool as shutdown_sweep_pool
 from datetime import datetime
 from api.what_if import router as what_if_router
 from api.analytics import router as analytics_router
@@ -24,26 +33,65 @@ sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
 simulation_engine = None
 db_service = None
 ml_service = None
+inference = None
+forecast_cache = None
+explainer = None
+registry = None
+what_if_jobs = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global simulation_engine, db_service, ml_service
+    global simulation_engine, db_service, ml_service, inference, forecast_cache, explainer, registry, what_if_jobs
     
     # DB Init
     db_service = DatabaseService(db)
-    # ML Init
-    ml_service = MLService()
+    # ML Init (all model calls go through the executor, off the event loop).
+    # Models load lazily; a background thread warms them up so startup doesn't wait.
+    # The registry picks the pinned model version and hot-swaps new ones in.
+    configure_torch()
+    registry = ModelRegistry()
+    ml_service = registry.open()
+    warmup_task = asyncio.create_task(asyncio.to_thread(ml_service.warm_up))
+    inference = InferenceExecutor(ml_service)
+    # Congestion forecasts are precomputed in the background and served from cache
+    forecast_cache = ForecastCache(inference)
+    forecast_task = asyncio.create_task(forecast_cache.run())
+    # SHAP explanations are memoized on quantized inputs; warm the common grid
+    explainer = ExplanationService(inference)
+    precompute_task = asyncio.create_task(explainer.precompute())
     
     print("Initializing Simulation Engine...")
-    simulation_engine = SimulationEngine(sio, db_service, ml_service)
+    simulation_engine = SimulationEngine(sio, db_service, ml_service, inference=inference, explainer=explainer)
     app.state.simulation_engine = simulation_engine # Expose to API routers
     task = asyncio.create_task(simulation_engine.run())
+    # What-if runs are queued onto a bounded, niced process pool
+    what_if_jobs = WhatIfJobQueue(sio)
+    app.state.what_if_jobs = what_if_jobs
+    registry.on_swap(_on_model_swap)
+    watch_task = asyncio.create_task(registry.watch())
     yield
     # Shutdown
     print("Shutting down Simulation Engine...")
     simulation_engine.stop()
     await task
+    forecast_cache.stop()
+    forecast_task.cancel()
+    precompute_task.cancel()
+    registry.stop()
+    watch_task.cancel()
+    what_if_jobs.stop()
+    shutdown_sweep_pool()
+    inference.shutdown()
+
+def _on_model_swap(new_service):
+    # Everything that holds the service switches over; cached model outputs are dropped
+    global ml_service
+    ml_service = new_service
+    inference.swap_service(new_service)
+    simulation_engine.ml_service = new_service
+    explainer.clear()
+    forecast_cache.invalidate()
 
 app = FastAPI(lifespan=lifespan)
 socket_app = socketio.ASGIApp(sio, app)
@@ -66,47 +114,164 @@ db = client.rail_nova
 async def root():
     return {"message": "Rail-Nova Backend Operational"}
 
+@app.get("/health/ready")
+async def health_ready():
+    # Per-model load state; 503 until every model has finished loading (or failed)
+    models = {name: status.dict() for name, status in ml_service.status.items()} if ml_service else {}
+    ready = bool(ml_service and ml_service.is_ready() and simulation_engine and simulation_engine.running)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "simulation": bool(simulation_engine and simulation_engine.running),
+            "model_version": ml_service.version if ml_service else None,
+            "models": models,
+        },
+    )
+
 app.include_router(what_if_router)
 app.include_router(analytics_router)
 app.include_router(simulation_router)
 
 # API Endpoints
 # ML Endpoints
+# Request fields per model, in feature order
+PREDICT_FIELDS = {
+    "eta": ["speed", "dist", "delay", "hour"],
+    "delay": ["weather", "priority", "current_delay"],
+    "conflict": ["track_id", "time_gap", "opposite_dir"],
+}
+
+def _features(data, model: str) -> list:
+    try:
+        return [data[field] for field in PREDICT_FIELDS[model]]
+    except KeyError as e:
+        raise HTTPException(status_code=422, detail=f"Missing field: {e.args[0]}")
+    except TypeError:
+        raise HTTPException(status_code=422, detail="Expected an object with " + ", ".join(PREDICT_FIELDS[model]))
+
+async def _predict(model: str, data: dict):
+    row = _features(data, model)
+    try:
+        return await inference.predict(model, row)
+    except ValueError as e: # malformed or non-numeric row (validate_row)
+        raise HTTPException(status_code=422, detail=str(e))
+
+async def _predict_batch(model: str, data: dict):
+    rows = data.get('rows', [])
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=422, detail="rows must be a list")
+    rows = [_features(r, model) for r in rows]
+    try:
+        return await inference.predict_batch(model, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
 @app.post("/ml/predict/eta")
 async def predict_eta(data: dict):
     if ml_service:
-        return {"eta": ml_service.predict_eta(data['speed'], data['dist'], data['delay'], data['hour'])}
+        return {"eta": await _predict("eta", data)}
     return {"error": "ML Service Unavailable"}
 
 @app.post("/ml/predict/delay")
 async def predict_delay(data: dict):
     if ml_service:
-        return {"predicted_delay": ml_service.predict_delay(data['weather'], data['priority'], data['current_delay'])}
+        return {"predicted_delay": await _predict("delay", data)}
     return {"error": "ML Service Unavailable"}
 
 @app.post("/ml/predict/conflict")
 async def predict_conflict(data: dict):
     if ml_service:
-        return {"conflict_prob": ml_service.predict_conflict(data['track_id'], data['time_gap'], data['opposite_dir'])}
+        return {"conflict_prob": await _predict("conflict", data)}
+    return {"error": "ML Service Unavailable"}
+
+# Batch endpoints: {"rows": [{...same fields as the single endpoint...}, ...]}
+@app.post("/ml/predict/eta/batch")
+async def predict_eta_batch(data: dict):
+    if ml_service:
+        return {"eta": await _predict_batch("eta", data)}
+    return {"error": "ML Service Unavailable"}
+
+@app.post("/ml/predict/delay/batch")
+async def predict_delay_batch(data: dict):
+    if ml_service:
+        return {"predicted_delay": await _predict_batch("delay", data)}
+    return {"error": "ML Service Unavailable"}
+
+@app.post("/ml/predict/conflict/batch")
+async def predict_conflict_batch(data: dict):
+    if ml_service:
+        return {"conflict_prob": await _predict_batch("conflict", data)}
+    return {"error": "ML Service Unavailable"}
+
+@app.get("/ml/stats")
+async def get_ml_stats():
+    # Request coalescer stats per model (batches run, rows served, average batch size)
+    if inference:
+        return {"coalescer": inference.batch_stats(), "congestion_cache": forecast_cache.stats(),
+                "explanations": explainer.stats()}
+    return {"error": "ML Service Unavailable"}
+
+# Model registry: versions, hot reload and rollback
+@app.get("/ml/models")
+async def get_model_versions():
+    if registry:
+        return registry.status()
+    return {"error": "ML Service Unavailable"}
+
+@app.post("/ml/models/reload")
+async def reload_models(data: dict = None):
+    # {"version": "..."} to load a specific version; default is the pinned (ACTIVE) one
+    if registry:
+        try:
+            version = await registry.load((data or {}).get("version"))
+        except ValueError as e:
+            return {"error": str(e)}
+        return {"status": "active", "version": version.version}
+    return {"error": "ML Service Unavailable"}
+
+@app.post("/ml/models/rollback")
+async def rollback_models():
+    if registry:
+        try:
+            version = await registry.rollback()
+        except ValueError as e:
+            return {"error": str(e)}
+        return {"status": "rolled_back", "version": version.version}
     return {"error": "ML Service Unavailable"}
 
 @app.post("/ml/predict/congestion")
 async def predict_congestion(data: dict):
     if ml_service:
         hours = data.get('hours', 24)
-        return {"forecast": ml_service.predict_congestion(hours)}
+        return await forecast_cache.get(hours)
     return {"error": "ML Service Unavailable"}
 
 @app.post("/ml/explain/delay")
 async def explain_delay(data: dict):
     if ml_service:
-        return {"explanation": ml_service.explain_delay(data['weather'], data['priority'], data['current_delay'])}
+        return {"explanation": await explainer.explain("delay", [data['weather'], data['priority'], data['current_delay']])}
     return {"error": "ML Service Unavailable"}
 
 @app.post("/ml/explain/conflict")
 async def explain_conflict(data: dict):
     if ml_service:
-        return {"explanation": ml_service.explain_conflict(data['track_id'], data['time_gap'], data['opposite_dir'])}
+        return {"explanation": await explainer.explain("conflict", [data['track_id'], data['time_gap'], data['opposite_dir']])}
+    return {"error": "ML Service Unavailable"}
+
+# Batch explanations: {"rows": [{...same fields as the single endpoint...}, ...]}; cache misses share one SHAP call
+@app.post("/ml/explain/delay/batch")
+async def explain_delay_batch(data: dict):
+    if ml_service:
+        rows = [[r['weather'], r['priority'], r['current_delay']] for r in data.get('rows', [])]
+        return {"explanations": await explainer.explain_batch("delay", rows)}
+    return {"error": "ML Service Unavailable"}
+
+@app.post("/ml/explain/conflict/batch")
+async def explain_conflict_batch(data: dict):
+    if ml_service:
+        rows = [[r['track_id'], r['time_gap'], r['opposite_dir']] for r in data.get('rows', [])]
+        return {"explanations": await explainer.explain_batch("conflict", rows)}
     return {"error": "ML Service Unavailable"}
 
 @app.get("/history/replay")
@@ -132,6 +297,13 @@ async def get_live_blocks():
         return [b.dict() for b in simulation_engine.blocks.values()]
     return []
 
+@app.get("/alerts/live")
+async def get_live_alerts():
+    # Raised alerts with first/last seen times (lifecycle events go out on "alert_events")
+    if simulation_engine:
+        return simulation_engine.alert_store.history()
+    return []
+
 @app.get("/suggestions/latest")
 async def get_suggestions():
     if simulation_engine:
@@ -145,18 +317,37 @@ async def apply_scenario(data: dict):
 
 # WebSocket Events
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
     print("Client connected:", sid)
-    # Send initial state immediately
+    # Send initial state immediately (full state or delta keyframe, per negotiated protocol)
     if simulation_engine:
-        state = {
-            "trains": [t.dict() for t in simulation_engine.trains.values()],
-            "alerts": [a.dict() for a in simulation_engine.alerts],
-            "suggestions": [s.dict() for s in simulation_engine.suggestions]
-        }
-        await sio.emit('state_update', state, to=sid)
+        await simulation_engine.broadcaster.connect(sid, auth)
+
+@sio.event
+async def resync(sid, data=None):
+    # Delta clients ask for a fresh keyframe when they detect a sequence gap
+    if simulation_engine:
+        await simulation_engine.broadcaster.resync(sid)
+
+@sio.event
+async def subscribe(sid, data=None):
+    # Viewport subscription: {"bbox": [south, west, north, east], "route_ids": [...], "train_ids": [...]}
+    if simulation_engine:
+        try:
+            subscription = Subscription(**(data or {}))
+        except ValidationError as e:
+            return {"error": str(e)}
+        await simulation_engine.broadcaster.subscribe(sid, subscription)
+        return {"status": "subscribed", "room": subscription.key()}
+
+@sio.event
+async def unsubscribe(sid, data=None):
+    if simulation_engine:
+        await simulation_engine.broadcaster.subscribe(sid, None)
+        return {"status": "unsubscribed"}
 
 @sio.event
 async def disconnect(sid):
     print("Client disconnected:", sid)
-
+    if simulation_engine:
+        simulation_engine.broadcaster.disconnect(sid)
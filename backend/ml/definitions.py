@@ -1,18 +1,34 @@
 import torch
 import torch.nn as nn
 
+# Canonical ETA architecture: the single definition imported by both the training
+# script (ml/train.py) and the inference runtime, which checks eta_lstm.pth against
+# it at load time.
+ETA_ARCH = {"input_size": 4, "hidden_size": 16, "num_layers": 1, "output_size": 1}
+
 class ETALSTM(nn.Module):
-    def __init__(self, input_size=4, hidden_size=64, num_layers=2, output_size=1):
+    def __init__(self, input_size=4, hidden_size=16, num_layers=1, output_size=1):
         super(ETALSTM, self).__init__()
         self.hidden_size = hidden_size
         self.num_layers = num_layers
         self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True)
-        self.fc = nn.Linear(hidden_size, output_size)
+        self.fc = nn.Linear(hidden_size, output_size) # Output: Minutes remaining
 
     def forward(self, x):
-        h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
-        c0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
-        
-        out, _ = self.lstm(x, (h0, c0))
+        # x shape: (batch, seq_len, input_size)
+        # No explicit h0/c0: nn.LSTM starts from zero states without allocating them here
+        out, _ = self.lstm(x)
+        # Take last time step
         out = self.fc(out[:, -1, :])
         return out
+
+def arch_from_state_dict(state_dict) -> dict:
+    """Recover the architecture a checkpoint was trained with from its weight shapes."""
+    num_layers = sum(1 for k in state_dict if k.startswith("lstm.weight_ih_l"))
+    hidden_size = state_dict["lstm.weight_hh_l0"].shape[1]
+    return {
+        "input_size": state_dict["lstm.weight_ih_l0"].shape[1],
+        "hidden_size": hidden_size,
+        "num_layers": num_layers,
+        "output_size": state_dict["fc.weight"].shape[0],
+    }
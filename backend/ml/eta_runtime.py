@@ -0,0 +1,41 @@
+import threading
+import warnings
+import numpy as np
+import torch
+from ml.definitions import ETALSTM, ETA_ARCH, arch_from_state_dict
+
+# CPU inference runtime for the ETA LSTM:
+#   - the checkpoint is checked against the canonical architecture before loading
+#   - the model is traced + frozen to TorchScript once at load time
+#   - calls run under inference_mode (torch's intra-op thread count is process-wide;
+#     the app opts into a cap once at startup, see ml_service.configure_torch)
+#   - predict() takes a whole batch, so every live train is scored in one forward pass
+
+# Tracing is not thread-safe (two versions may load concurrently during a hot reload)
+_TRACE_LOCK = threading.Lock()
+
+class ETARuntime:
+    def __init__(self, checkpoint_path: str, script: bool = True):
+        state_dict = torch.load(checkpoint_path, map_location="cpu")
+        arch = arch_from_state_dict(state_dict)
+        if arch != ETA_ARCH:
+            raise ValueError(f"ETA checkpoint architecture {arch} does not match canonical ETALSTM {ETA_ARCH}")
+
+        model = ETALSTM(**arch)
+        model.load_state_dict(state_dict, strict=True)
+        model.eval()
+        self.model = model
+
+        self.module = model
+        if script:
+            example = torch.zeros(1, 1, arch["input_size"])
+            with _TRACE_LOCK, warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                self.module = torch.jit.freeze(torch.jit.trace(model, example, check_trace=False))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """X: (n, 4) rows of [speed, dist, delay, hour] -> (n,) minutes remaining."""
+        X = np.ascontiguousarray(X, dtype=np.float32).reshape(-1, 1, 4)
+        with torch.inference_mode():
+            out = self.module(torch.from_numpy(X))
+        return out.reshape(-1).numpy().astype(np.float64)
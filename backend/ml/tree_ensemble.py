@@ -0,0 +1,56 @@
+import numpy as np
+
+# NumPy evaluator for tree ensembles exported by ml/export_trees.py.
+# All trees are walked together for the whole batch: one gather per depth level over
+# a (trees, rows) node-index matrix, so no sklearn import or per-call validation.
+
+class TreeEnsemble:
+    def __init__(self, path: str):
+        data = np.load(path, allow_pickle=False)
+        self.kind = str(data["kind"])
+        self.base = float(data["base"])
+        self.scale = float(data["scale"])
+        self.n_features = int(data["n_features"])
+        self.max_depth = int(data["max_depth"])
+        self.feature = data["feature"].astype(np.int64)
+        self.threshold = data["threshold"]
+        self.left = data["left"]
+        self.right = data["right"]
+        self.value = data["value"]
+        self.roots = data["roots"]
+        # Leaves loop onto themselves so finished trees can keep "walking"
+        leaves = self.left < 0
+        idx = np.arange(len(self.left))
+        self.left = np.where(leaves, idx, self.left)
+        self.right = np.where(leaves, idx, self.right)
+        self.feature = np.where(leaves, 0, self.feature)
+
+    def _leaf_values(self, X: np.ndarray) -> np.ndarray:
+        # sklearn evaluates trees on float32 inputs; cast the same way so splits agree
+        X = np.asarray(X, dtype=np.float32).astype(np.float64).reshape(-1, self.n_features)
+        n = len(X)
+        # Feature-major flat copy: the value a node tests is Xf[feature * n + row]
+        Xf = X.T.ravel()
+        feature_offset = self.feature * n
+        rows = np.arange(n)
+        node = np.repeat(self.roots[:, None], n, axis=1) # (trees, rows)
+        for _ in range(self.max_depth):
+            go_left = Xf.take(feature_offset.take(node) + rows) <= self.threshold.take(node)
+            node = np.where(go_left, self.left.take(node), self.right.take(node))
+        return self.value.take(node)
+
+    def _score(self, X: np.ndarray) -> np.ndarray:
+        # Regressor: base + learning_rate * sum of trees. Classifier: mean positive-class probability.
+        if not len(X):
+            return np.zeros(0)
+        return self.base + self.scale * self._leaf_values(X).sum(axis=0)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        score = self._score(X)
+        if self.kind == "classifier":
+            return (score > 0.5).astype(np.int64)
+        return score
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        p = self._score(X)
+        return np.column_stack([1.0 - p, p])
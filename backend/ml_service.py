@@ -1,72 +1,209 @@
-import torch
-import joblib
+import os
+import threading
+import time
 import numpy as np
-import pandas as pd
-from ml.definitions import ETALSTM
-from typing import List
+from enum import Enum
+from pydantic import BaseModel
+from ml.tree_ensemble import TreeEnsemble
+from typing import Any, Callable, Dict, List, Optional
+
+# Heavy dependencies (torch, joblib -> sklearn / Prophet / SHAP) are imported inside
+# the loaders, so importing this module is cheap. Each model loads lazily on first
+# use, or ahead of time via warm_up() from a background task; per-model state and
+# load times are reported by /health/ready.
 
 MODELS_DIR = "ml/models"
+# Cap on torch intra-op threads, applied once at startup (None: torch default).
+# ETA batches are small, so extra threads mostly add scheduling overhead.
+TORCH_NUM_THREADS: Optional[int] = None
+
+def configure_torch(num_threads: Optional[int] = TORCH_NUM_THREADS):
+    """Process-wide torch setting; call at startup, never as a side effect of a model load."""
+    if num_threads is None:
+        return
+    import torch
+    torch.set_num_threads(num_threads)
+
+class LoadState(str, Enum):
+    NOT_LOADED = "not_loaded"
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+class ModelStatus(BaseModel):
+    state: LoadState = LoadState.NOT_LOADED
+    load_time_s: Optional[float] = None
+    error: Optional[str] = None
+
+# Warm-up order: models the simulation tick needs first
+MODEL_NAMES = ["conflict", "eta", "delay", "congestion", "delay_explainer", "conflict_explainer"]
+
+def _joblib_load(path: str):
+    import joblib
+    return joblib.load(path)
+
+def _model_property(name: str):
+    return property(
+        lambda self: self._get(name),
+        lambda self, value: self._set(name, value),
+    )
 
 class MLService:
-    def __init__(self):
-        self.eta_model = None
-        self.delay_model = None
-        self.conflict_model = None
-        self.congestion_model = None
-        self.delay_explainer = None
-        self.conflict_explainer = None
-        
-        try:
-            self._load_models()
-        except Exception as e:
-            print(f"Error loading ML models: {e}")
+    eta_model = _model_property("eta")
+    delay_model = _model_property("delay")
+    conflict_model = _model_property("conflict")
+    congestion_model = _model_property("congestion")
+    delay_explainer = _model_property("delay_explainer")
+    conflict_explainer = _model_property("conflict_explainer")
 
-    def _load_models(self):
-        # Load ETA LSTM
-        self.eta_model = ETALSTM()
-        try:
-            self.eta_model.load_state_dict(torch.load(f"{MODELS_DIR}/eta_lstm.pth"))
-            self.eta_model.eval()
-        except:
-             print("ETA model not found, skipping.")
+    def __init__(self, models_dir: str = MODELS_DIR, version: str = None, eager: bool = False,
+                 verify: Callable[[], None] = None):
+        # One MLService per model version; the registry swaps whole services on reload.
+        # `verify` (artifact checksums) runs once, before the first model load, so it is
+        # off the startup path like the loads themselves; if it raises ValueError no
+        # model is loaded from this directory.
+        self.models_dir = models_dir
+        self.version = version
+        self.congestion_model_path = os.path.join(models_dir, "congestion_prophet.pkl")
+        self._models: Dict[str, Any] = {}
+        self.status: Dict[str, ModelStatus] = {name: ModelStatus() for name in MODEL_NAMES}
+        self._locks = {name: threading.Lock() for name in MODEL_NAMES}
+        self._verify = verify
+        self._verify_lock = threading.Lock()
+        self._verify_error: Optional[str] = None
+        self._loaders = {
+            "eta": self._load_eta,
+            "delay": lambda: self._load_tree_model("delay_gb"),
+            "conflict": lambda: self._load_tree_model("conflict_rf"),
+            "congestion": lambda: _joblib_load(self.congestion_model_path),
+            "delay_explainer": lambda: _joblib_load(f"{self.models_dir}/delay_shap.pkl"),
+            "conflict_explainer": lambda: _joblib_load(f"{self.models_dir}/conflict_shap.pkl"),
+        }
+        if eager:
+            self.warm_up()
+
+    def _get(self, name: str):
+        if self.status[name].state not in (LoadState.READY, LoadState.FAILED):
+            self._load(name)
+        return self._models.get(name)
+
+    def _set(self, name: str, value):
+        with self._locks[name]:
+            self._models[name] = value
+            self.status[name] = ModelStatus(
+                state=LoadState.READY if value is not None else LoadState.FAILED,
+                load_time_s=self.status[name].load_time_s,
+            )
+
+    def _load(self, name: str):
+        # Concurrent first users wait on the lock instead of loading twice
+        with self._locks[name]:
+            if self.status[name].state in (LoadState.READY, LoadState.FAILED):
+                return
+            self.status[name] = ModelStatus(state=LoadState.LOADING)
+            start = time.perf_counter()
+            try:
+                self._check_artifacts()
+                model = self._loaders[name]()
+                error = None
+            except FileNotFoundError as e:
+                model, error = None, f"not found: {e.filename or e}"
+            except Exception as e:
+                model, error = None, str(e)
+            elapsed = round(time.perf_counter() - start, 3)
+            if model is None:
+                print(f"ML model {name} unavailable: {error}")
+            self._models[name] = model
+            self.status[name] = ModelStatus(
+                state=LoadState.READY if model is not None else LoadState.FAILED,
+                load_time_s=elapsed,
+                error=error,
+            )
+
+    def _check_artifacts(self):
+        with self._verify_lock:
+            if self._verify is not None:
+                try:
+                    self._verify()
+                except ValueError as e:
+                    self._verify_error = str(e)
+                self._verify = None
+        if self._verify_error:
+            raise ValueError(self._verify_error)
+
+    def warm_up(self, names: List[str] = None):
+        """Load models now (called from a background thread at startup)."""
+        for name in names or MODEL_NAMES:
+            self._get(name)
 
-        # Load Sklearn Models & Explainers
+    def is_ready(self) -> bool:
+        # Ready once every model has settled (missing artifacts count as settled)
+        return all(s.state in (LoadState.READY, LoadState.FAILED) for s in self.status.values())
+
+    def _load_eta(self):
+        # ETA LSTM: checked against the canonical architecture, TorchScript-compiled
+        from ml.eta_runtime import ETARuntime
+        return ETARuntime(f"{self.models_dir}/eta_lstm.pth")
+
+    def _load_tree_model(self, name: str):
+        # Prefer the NumPy-compiled export (no sklearn at serve time), else the pickle
+        path = f"{self.models_dir}/{name}.npz"
+        if os.path.exists(path):
+            try:
+                return TreeEnsemble(path)
+            except Exception as e:
+                print(f"Compiled model {name} failed to load, falling back to sklearn: {e}")
+        return _joblib_load(f"{self.models_dir}/{name}.pkl")
+
+    def reload_congestion_model(self) -> bool:
+        # Called by the forecast cache when the Prophet model file changes on disk
         try:
-            self.delay_model = joblib.load(f"{MODELS_DIR}/delay_gb.pkl")
-            self.conflict_model = joblib.load(f"{MODELS_DIR}/conflict_rf.pkl")
-            self.congestion_model = joblib.load(f"{MODELS_DIR}/congestion_prophet.pkl")
-            
-            self.delay_explainer = joblib.load(f"{MODELS_DIR}/delay_shap.pkl")
-            self.conflict_explainer = joblib.load(f"{MODELS_DIR}/conflict_shap.pkl")
+            self.congestion_model = _joblib_load(self.congestion_model_path)
+            return True
         except Exception as e:
-            print(f"Sklearn/Prophet/SHAP models not found: {e}")
+            print(f"Congestion model reload failed: {e}")
+            return False
 
     def predict_eta(self, speed, dist, delay, hour):
         if not self.eta_model:
             return -1
         
-        input_tensor = torch.tensor([[speed, dist, delay, hour]], dtype=torch.float32)
-        input_tensor = input_tensor.reshape(1, 1, 4)
-        
-        with torch.no_grad():
-            output = self.eta_model(input_tensor)
-        
-        return float(output.item())
+        return float(self.predict_eta_batch([[speed, dist, delay, hour]])[0])
+
+    def predict_eta_batch(self, X: np.ndarray) -> np.ndarray:
+        """ETA (minutes) for every row of [speed, dist, delay, hour] in one forward pass."""
+        X = np.asarray(X, dtype=np.float32).reshape(-1, 4)
+        if not self.eta_model or not len(X):
+            return np.full(len(X), -1.0)
+
+        return self.eta_model.predict(X)
 
     def predict_delay(self, weather, priority, current_delay):
         if not self.delay_model:
             return -1
         
-        X = np.array([[weather, priority, current_delay]])
-        return float(self.delay_model.predict(X)[0])
+        return float(self.predict_delay_batch([[weather, priority, current_delay]])[0])
+
+    def predict_delay_batch(self, X: np.ndarray) -> np.ndarray:
+        """Predicted delay for every row of [weather, priority, current_delay] in one call."""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 3)
+        if not self.delay_model or not len(X):
+            return np.full(len(X), -1.0)
+        return np.asarray(self.delay_model.predict(X), dtype=np.float64)
 
     def predict_conflict(self, track_id, time_gap, opposite_dir):
         if not self.conflict_model:
             return 0.0
             
-        X = np.array([[track_id, time_gap, opposite_dir]])
         # Return probability of class 1
-        return float(self.conflict_model.predict_proba(X)[0][1])
+        return float(self.predict_conflict_batch([[track_id, time_gap, opposite_dir]])[0])
+
+    def predict_conflict_batch(self, X: np.ndarray) -> np.ndarray:
+        """Conflict probability for every row of [track_id, time_gap, opposite_dir] in one call."""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 3)
+        if not self.conflict_model or not len(X):
+            return np.zeros(len(X))
+        return self.conflict_model.predict_proba(X)[:, 1]
 
     def predict_congestion(self, periods=24):
         if not self.congestion_model:
@@ -82,41 +219,63 @@ class MLService:
     def explain_delay(self, weather, priority, current_delay):
         if not self.delay_explainer:
             return {}
-            
-        X = np.array([[weather, priority, current_delay]])
+
+        return self.explain_delay_batch([[weather, priority, current_delay]])[0]
+
+    def explain_delay_batch(self, X: np.ndarray) -> List[dict]:
+        """SHAP explanations for every row of [weather, priority, current_delay] in one call."""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 3)
+        if not self.delay_explainer or not len(X):
+            return [{} for _ in range(len(X))]
+
         # Calculate SHAP values
         shap_values = self.delay_explainer(X)
-        
+        base_values = np.broadcast_to(np.asarray(shap_values.base_values, dtype=np.float64).reshape(-1), (len(X),))
+
         # Structure output
-        explanation = {
-            "base_value": float(shap_values.base_values[0]),
-            "features": {
-                "weather": float(shap_values.values[0][0]),
-                "priority": float(shap_values.values[0][1]),
-                "current_delay": float(shap_values.values[0][2])
+        return [
+            {
+                "base_value": float(base),
+                "features": {
+                    "weather": float(sv[0]),
+                    "priority": float(sv[1]),
+                    "current_delay": float(sv[2])
+                }
             }
-        }
-        return explanation
+            for base, sv in zip(base_values, np.asarray(shap_values.values))
+        ]
 
     def explain_conflict(self, track_id, time_gap, opposite_dir):
         if not self.conflict_explainer:
             return {}
-            
-        X = np.array([[track_id, time_gap, opposite_dir]])
+
+        return self.explain_conflict_batch([[track_id, time_gap, opposite_dir]])[0]
+
+    def explain_conflict_batch(self, X: np.ndarray) -> List[dict]:
+        """SHAP explanations for every row of [track_id, time_gap, opposite_dir] in one call."""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 3)
+        if not self.conflict_explainer or not len(X):
+            return [{} for _ in range(len(X))]
+
         shap_values = self.conflict_explainer.shap_values(X)
-        
-        # For classification, shap_values is a list of arrays (one for each class)
+
+        # For classification, shap_values is a list of arrays (one for each class) in
+        # older SHAP and an (n, features, classes) array in newer releases.
         # We usually care about the positive class (1)
         if isinstance(shap_values, list):
-            sv = shap_values[1][0]
+            sv = np.asarray(shap_values[1])
         else:
-            sv = shap_values[0] # Regression or binary generic
-            
-        explanation = {
-            "features": {
-                "track_id": float(sv[0]),
-                "time_gap": float(sv[1]),
-                "opposite_dir": float(sv[2])
+            sv = np.asarray(shap_values)
+            if sv.ndim == 3:
+                sv = sv[:, :, 1]
+
+        return [
+            {
+                "features": {
+                    "track_id": float(row[0]),
+                    "time_gap": float(row[1]),
+                    "opposite_dir": float(row[2])
+                }
             }
-        }
-        return explanation
+            for row in sv
+        ]
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from pydantic import BaseModel
+from ml_service import MLService, MODELS_DIR, LoadState
+
+# Versioned model registry.
+# ml/train.py writes each training run to ml/models/<version>/ with a manifest.json
+# (sha256 + size per artifact, plus metadata) and then points ml/models/ACTIVE at it.
+# The backend loads the pinned version; a reload (endpoint or the ACTIVE watcher)
+# builds and warms a new MLService in the background, verifies it, and swaps it in
+# with a single reference assignment. Calls already running finish on the old
+# service. A flat ml/models directory without versions still loads as "legacy".
+
+MANIFEST_FILE = "manifest.json"
+ACTIVE_FILE = "ACTIVE"
+WATCH_INTERVAL_S = 5.0
+
+class ModelVersion(BaseModel):
+    version: str
+    path: str
+    created_at: Optional[datetime] = None
+    files: Dict[str, dict] = {}
+    metadata: dict = {}
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ModelRegistry:
+    def __init__(self, root: str = MODELS_DIR, watch_interval_s: float = WATCH_INTERVAL_S):
+        self.root = root
+        self.watch_interval_s = watch_interval_s
+        self.service: Optional[MLService] = None
+        self.active: Optional[str] = None
+        self.previous: Optional[str] = None
+        self.loaded_at: Optional[datetime] = None
+        self.rejected: Dict[str, str] = {} # version -> reason, so the watcher doesn't retry forever
+        self._listeners: List[Callable[[MLService], None]] = []
+        self._lock = asyncio.Lock()
+        self._running = False
+
+    def versions(self) -> List[ModelVersion]:
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for name in os.listdir(self.root):
+            manifest = os.path.join(self.root, name, MANIFEST_FILE)
+            if not os.path.isfile(manifest):
+                continue
+            try:
+                with open(manifest) as f:
+                    data = json.load(f)
+                found.append(ModelVersion(path=os.path.join(self.root, name), **{**data, "version": name}))
+            except (OSError, ValueError) as e:
+                print(f"Skipping model version {name}: bad manifest ({e})")
+        return sorted(found, key=lambda v: (v.created_at or datetime.min, v.version))
+
+    def get_version(self, version: str) -> Optional[ModelVersion]:
+        return next((v for v in self.versions() if v.version == version), None)
+
+    def pinned_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _pin(self, version: Optional[str]):
+        if version is None:
+            return
+        # Write-then-rename so readers never see a half-written pointer
+        path = os.path.join(self.root, ACTIVE_FILE)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(version)
+        os.replace(tmp, path)
+
+    def verify(self, version: ModelVersion):
+        """Raises ValueError if an artifact listed in the manifest is missing or altered."""
+        for name, info in version.files.items():
+            path = os.path.join(version.path, name)
+            if not os.path.isfile(path):
+                raise ValueError(f"{version.version}: missing artifact {name}")
+            if info.get("sha256") and sha256_file(path) != info["sha256"]:
+                raise ValueError(f"{version.version}: checksum mismatch for {name}")
+
+    def open(self) -> MLService:
+        """
+        Initial (lazy, not yet warmed) service for the pinned version, else legacy.
+        The pinned version's checksums are verified with its first model load, off
+        the startup path; a mismatch fails every model and marks the version rejected.
+        """
+        pinned = self.pinned_version()
+        version = self.get_version(pinned) if pinned else None
+        if version is not None:
+            self.service = MLService(version.path, version.version, verify=lambda: self._verify_pinned(version))
+        else:
+            self.service = MLService(self.root)
+        self.active = self.service.version
+        self.loaded_at = datetime.now()
+        return self.service
+
+    def _verify_pinned(self, version: ModelVersion):
+        try:
+            self.verify(version)
+        except ValueError as e:
+            print(f"Pinned model version rejected: {e}")
+            self.rejected[version.version] = str(e)
+            raise
+
+    def on_swap(self, callback: Callable[[MLService], None]):
+        self._listeners.append(callback)
+
+    async def load(self, version_name: Optional[str] = None) -> ModelVersion:
+        """Load, warm and verify a version in the background, then swap it in."""
+        async with self._lock:
+            version_name = version_name or self.pinned_version()
+            version = self.get_version(version_name) if version_name else None
+            if version is None:
+                raise ValueError(f"Unknown model version: {version_name}")
+            if version.version == self.active:
+                return version
+
+            try:
+                await asyncio.to_thread(self.verify, version)
+                candidate = MLService(version.path, version.version)
+                await asyncio.to_thread(candidate.warm_up)
+                # Refuse a version that loses a model the current one is serving
+                if self.service is not None:
+                    lost = [name for name, status in self.service.status.items()
+                            if status.state == LoadState.READY and candidate.status[name].state == LoadState.FAILED]
+                    if lost:
+                        raise ValueError(f"{version.version}: failed to load {', '.join(lost)}")
+            except ValueError as e:
+                self.rejected[version.version] = str(e)
+                raise
+
+            # Atomic swap: new calls see the new service, in-flight calls finish on the old one
+            self.service = candidate
+            self.previous, self.active = self.active, version.version
+            self.loaded_at = datetime.now()
+            self.rejected.pop(version.version, None)
+            self._pin(version.version)
+            for callback in self._listeners:
+                callback(candidate)
+            print(f"Model version {version.version} is now active (previous: {self.previous})")
+            return version
+
+    async def rollback(self) -> ModelVersion:
+        if not self.previous:
+            raise ValueError("No previous model version to roll back to")
+        return await self.load(self.previous)
+
+    async def watch(self):
+        # Pick up new versions published by ml/train.py (it rewrites ACTIVE)
+        self._running = True
+        while self._running:
+            await asyncio.sleep(self.watch_interval_s)
+            pinned = self.pinned_version()
+            if pinned and pinned != self.active and pinned not in self.rejected:
+                print(f"New model version pinned: {pinned}, loading in background...")
+                try:
+                    await self.load(pinned)
+                except Exception as e:
+                    print(f"Model version {pinned} rejected: {e}")
+                    self.rejected.setdefault(pinned, str(e))
+
+    def stop(self):
+        self._running = False
+
+    def status(self) -> dict:
+        return {
+            "active": self.active,
+            "previous": self.previous,
+            "pinned": self.pinned_version(),
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "rejected": self.rejected,
+            "versions": [v.dict() for v in self.versions()],
+        }
@@ -0,0 +1,109 @@
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+from pydantic import BaseModel
+from simulation.models import Alert, AlertType
+
+# Alert lifecycle.
+# Detectors rebuild their alerts every tick; the AlertStore matches them to live
+# alerts by a stable identity (kind + trains [+ location]) and only reports
+# transitions: raised, updated (severity changed, either direction) and cleared.
+# Message and look-ahead figures follow the latest detection every tick without an
+# event; clients read them from the state payload. Hysteresis keeps a flickering
+# condition from raising / clearing every tick: non-critical alerts must persist for
+# `raise_after` ticks before they are raised, and an alert is cleared only after it
+# has been missing for `clear_after` ticks. Critical alerts are raised immediately.
+
+SEVERITY_RANK = {
+    AlertType.INFO: 0,
+    AlertType.MINOR: 1,
+    AlertType.MAJOR: 2,
+    AlertType.CRITICAL: 3,
+}
+
+def alert_id(kind: str, train_ids: Sequence[str], location: str = None) -> int:
+    """Stable across ticks and processes (crc32, unlike the per-process randomized hash())."""
+    key = "|".join([kind, *train_ids, location or ""])
+    return zlib.crc32(key.encode()) & 0x7FFFFFFF
+
+class AlertEvent(BaseModel):
+    event: str # "raised", "updated", "cleared"
+    alert: Alert
+    previous_type: Optional[AlertType] = None # "updated": severity before the change
+    first_seen: str
+    last_seen: str
+
+class AlertRecord:
+    def __init__(self, alert: Alert, now: datetime):
+        self.alert = alert
+        self.first_seen = now
+        self.last_seen = now
+        self.seen_ticks = 1
+        self.missed_ticks = 0
+        self.raised = False
+
+class AlertStore:
+    def __init__(self, raise_after: int = 2, clear_after: int = 3):
+        self.raise_after = raise_after
+        self.clear_after = clear_after
+        self.records: Dict[int, AlertRecord] = {}
+
+    def _event(self, kind: str, record: AlertRecord, previous_type: AlertType = None) -> AlertEvent:
+        return AlertEvent(
+            event=kind,
+            alert=record.alert,
+            previous_type=previous_type,
+            first_seen=record.first_seen.isoformat(timespec="seconds"),
+            last_seen=record.last_seen.isoformat(timespec="seconds"),
+        )
+
+    def update(self, alerts: List[Alert], now: Optional[datetime] = None) -> List[AlertEvent]:
+        """Merge this tick's detections; returns the lifecycle transitions."""
+        now = now or datetime.now()
+        events = []
+        seen = set()
+        for alert in alerts:
+            if alert.id in seen:
+                continue
+            seen.add(alert.id)
+            record = self.records.get(alert.id)
+            if record is None:
+                record = self.records[alert.id] = AlertRecord(alert, now)
+            else:
+                record.last_seen = now
+                record.seen_ticks += 1
+                record.missed_ticks = 0
+                previous = record.alert
+                # Latest severity / message / figures; the first-detection time is kept
+                record.alert = alert.copy(update={"time": previous.time})
+                if record.raised and alert.type != previous.type:
+                    events.append(self._event("updated", record, previous_type=previous.type))
+
+            if not record.raised and (record.seen_ticks >= self.raise_after or record.alert.type == AlertType.CRITICAL):
+                record.raised = True
+                events.append(self._event("raised", record))
+
+        for key in [k for k in self.records if k not in seen]:
+            record = self.records[key]
+            record.missed_ticks += 1
+            if record.missed_ticks >= self.clear_after or not record.raised:
+                del self.records[key]
+                if record.raised:
+                    events.append(self._event("cleared", record))
+        return events
+
+    def active(self) -> List[Alert]:
+        """Raised alerts, most severe first, then oldest first."""
+        records = [r for r in self.records.values() if r.raised]
+        records.sort(key=lambda r: (-SEVERITY_RANK[r.alert.type], r.first_seen, r.alert.id))
+        return [r.alert for r in records]
+
+    def history(self) -> List[dict]:
+        return [
+            {
+                **r.alert.dict(),
+                "first_seen": r.first_seen.isoformat(timespec="seconds"),
+                "last_seen": r.last_seen.isoformat(timespec="seconds"),
+            }
+            for r in self.records.values() if r.raised
+        ]
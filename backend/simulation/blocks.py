@@ -0,0 +1,120 @@
+import csv
+import os
+import numpy as np
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+from simulation.models import Block, BlockStatus
+from simulation.routes import DATASETS_DIR, DEFAULT_ROUTE_ID, route_length_km, section_name
+
+# Block-section index: blocks sorted by chainage with their boundaries in arrays, so
+# km -> block is a bisect (or one searchsorted for every train at once), and live
+# occupancy is maintained incrementally as trains cross boundaries.
+
+BLOCK_SECTIONS_CSV = os.path.join(DATASETS_DIR, "block_sections.csv")
+
+class BlockIndex:
+    def __init__(self, blocks: Sequence[Block]):
+        self.blocks: List[Block] = sorted(blocks, key=lambda b: b.start_km)
+        self.by_id: Dict[str, Block] = {b.id: b for b in self.blocks}
+        self.starts = np.array([b.start_km for b in self.blocks], dtype=np.float64)
+        self.ends = np.array([b.end_km for b in self.blocks], dtype=np.float64)
+        self._ends_list = self.ends.tolist()
+        if np.any(self.starts[1:] < self.ends[:-1]):
+            raise ValueError("Block sections must not overlap")
+
+        # Occupancy state: block position -> train ids (entry order), train -> block position
+        self.occupants: Dict[int, List[str]] = {}
+        self._train_ids: List[str] = []
+        self._train_pos = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_csv(cls, path: str = BLOCK_SECTIONS_CSV, route_id: str = DEFAULT_ROUTE_ID,
+                 fit_to_route: bool = True) -> "BlockIndex":
+        """
+        Chain the block lengths from block_sections.csv along the route.
+        With fit_to_route the lengths are scaled so the blocks span the whole route.
+        """
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        lengths = np.array([float(r["length_km"]) for r in rows])
+        if fit_to_route and lengths.sum() > 0:
+            lengths *= route_length_km(route_id) / lengths.sum()
+        bounds = np.concatenate([[0.0], np.cumsum(lengths)])
+
+        blocks = []
+        for row, start, end in zip(rows, bounds[:-1], bounds[1:]):
+            blocks.append(Block(
+                id=row["block_id"],
+                section=section_name((start + end) / 2, route_id),
+                start_km=round(float(start), 3),
+                end_km=round(float(end), 3),
+                status=BlockStatus.FREE,
+                speed_limit=int(row["max_speed"]),
+            ))
+        return cls(blocks)
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def position(self, km: float) -> int:
+        # First block with end >= km, if it also starts at or before km (-1 otherwise)
+        i = bisect_left(self._ends_list, km)
+        if i < len(self.blocks) and self.blocks[i].start_km <= km:
+            return i
+        return -1
+
+    def lookup(self, km: float) -> Optional[Block]:
+        i = self.position(km)
+        return self.blocks[i] if i >= 0 else None
+
+    def lookup_many(self, kms: np.ndarray) -> np.ndarray:
+        """Block position for every km (-1 where no block covers it)."""
+        pos = np.searchsorted(self.ends, kms, side="left")
+        inside = pos < len(self.blocks)
+        pos = np.where(inside, pos, 0)
+        inside &= len(self.blocks) > 0
+        if len(self.blocks):
+            inside &= self.starts[pos] <= kms
+        return np.where(inside, pos, -1)
+
+    def _refresh_status(self, pos: int):
+        block = self.blocks[pos]
+        if block.status == BlockStatus.MAINTENANCE:
+            return
+        trains = self.occupants.get(pos)
+        block.status = BlockStatus.OCCUPIED if trains else BlockStatus.FREE
+        block.active_train_id = trains[0] if trains else None
+
+    def update_occupancy(self, train_ids: List[str], kms: np.ndarray) -> List[str]:
+        """
+        Move trains between blocks; only trains whose block changed are touched.
+        Returns the IDs of blocks whose occupancy changed.
+        """
+        pos = self.lookup_many(kms)
+        if train_ids != self._train_ids:
+            # Train set changed: rebuild from scratch
+            previous = set(self.occupants)
+            self.occupants = {}
+            for tid, p in zip(train_ids, pos.tolist()):
+                if p >= 0:
+                    self.occupants.setdefault(p, []).append(tid)
+            self._train_ids = list(train_ids)
+            self._train_pos = pos
+            touched = previous | set(self.occupants)
+        else:
+            touched = set()
+            for i in np.flatnonzero(pos != self._train_pos).tolist():
+                old, new, tid = int(self._train_pos[i]), int(pos[i]), train_ids[i]
+                if old >= 0:
+                    self.occupants[old].remove(tid)
+                    if not self.occupants[old]:
+                        del self.occupants[old]
+                    touched.add(old)
+                if new >= 0:
+                    self.occupants.setdefault(new, []).append(tid)
+                    touched.add(new)
+            self._train_pos = pos
+
+        for p in touched:
+            self._refresh_status(p)
+        return [self.blocks[p].id for p in sorted(touched)]
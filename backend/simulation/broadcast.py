@@ -0,0 +1,188 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Set
+from simulation.delta import DeltaEncoder
+from simulation.models import Train, Alert, Suggestion
+from simulation.train_table import TrainTable
+from simulation.spatial import GridIndex, Subscription
+from simulation.wire import pack_state, string_table
+
+# Socket.IO fan-out for the live state.
+# Clients negotiate a protocol at connect time (auth={"protocol": ...}):
+#   - "full"   (default): a full state_update every tick (legacy dashboards)
+#   - "delta":  a keyframe on connect and every N ticks, state_delta diffs in between.
+#               Clients that detect a sequence gap emit "resync" to get a fresh keyframe.
+#   - "packed": state_packed frames in the compact binary layout from simulation.wire,
+#               with train names and station codes sent once per session as a train_table
+#               string table.
+#
+# Clients may also "subscribe" to a viewport (bbox, route IDs, train IDs). Every
+# (protocol, subscription) pair is a Channel backed by one Socket.IO room, so identical
+# subscriptions share a single encode + emit per tick.
+
+PROTOCOLS = ("full", "delta", "packed")
+
+class Channel:
+    def __init__(self, protocol: str, subscription: Optional[Subscription], keyframe_interval: int):
+        self.protocol = protocol
+        self.subscription = subscription
+        self.room = self.room_for(protocol, subscription)
+        self.members: Set[str] = set()
+        self.encoder = DeltaEncoder(keyframe_interval=keyframe_interval) if protocol == "delta" else None
+        self.stale = True
+        self.last_payload: Optional[dict] = None
+
+    @staticmethod
+    def room_for(protocol: str, subscription: Optional[Subscription]) -> str:
+        return f"state:{protocol}" if subscription is None else f"state:{protocol}:{subscription.key()}"
+
+    def select(self, index: GridIndex, table: TrainTable) -> Optional[np.ndarray]:
+        # None means "every train"
+        if self.subscription is None:
+            return None
+        return self.subscription.select(index, table.ids, table.route_ids)
+
+class Broadcaster:
+    def __init__(self, sio, keyframe_interval: int = 30, cell_deg: float = 0.05):
+        self.sio = sio
+        self.keyframe_interval = keyframe_interval
+        self.index = GridIndex(cell_deg=cell_deg)
+        self.channels: Dict[str, Channel] = {}   # room -> channel
+        self.clients: Dict[str, Channel] = {}    # sid -> channel
+        self.protocols: Dict[str, str] = {}      # sid -> protocol
+        self.table: Optional[TrainTable] = None
+        self.tick = 0
+        self._latest = None
+        self._train_dicts: Dict[int, dict] = {} # index -> Train dict, for the latest tick
+        self._sent_ids: List[str] = []
+
+    def _train_dict_list(self, selected: Optional[np.ndarray]) -> List[dict]:
+        # Each train is serialized at most once per tick and shared by every JSON
+        # channel; viewport channels only pay for the trains they select
+        trains = self._latest[0]
+        cache = self._train_dicts
+        indices = range(len(trains)) if selected is None else selected.tolist()
+        out = []
+        for i in indices:
+            d = cache.get(i)
+            if d is None:
+                d = cache[i] = trains[i].dict()
+            out.append(d)
+        return out
+
+    def _state(self, selected: Optional[np.ndarray]) -> Optional[dict]:
+        if self._latest is None:
+            return None
+        _, alerts, suggestions, scalars = self._latest
+        return {
+            "trains": self._train_dict_list(selected),
+            "alerts": [a.dict() for a in alerts],
+            "suggestions": [s.dict() for s in suggestions],
+            **scalars
+        }
+
+    @property
+    def last_state(self) -> Optional[dict]:
+        # Full JSON state (all trains), only built when asked for
+        return self._state(None)
+
+    async def _join(self, sid: str, protocol: str, subscription: Optional[Subscription]):
+        old = self.clients.get(sid)
+        if old is not None:
+            await self._leave(sid, old)
+
+        room = Channel.room_for(protocol, subscription)
+        channel = self.channels.get(room)
+        if channel is None:
+            channel = self.channels[room] = Channel(protocol, subscription, self.keyframe_interval)
+        if subscription is not None and subscription.bbox is not None and self.table is not None:
+            self.index.rebuild(self.table.lat, self.table.lng)
+        channel.members.add(sid)
+        self.clients[sid] = channel
+        await self.sio.enter_room(sid, channel.room)
+        await self._send_initial(sid, channel)
+
+    async def _leave(self, sid: str, channel: Channel):
+        channel.members.discard(sid)
+        await self.sio.leave_room(sid, channel.room)
+        if not channel.members:
+            del self.channels[channel.room]
+
+    async def _send_initial(self, sid: str, channel: Channel):
+        if self._latest is None:
+            return
+        if channel.protocol == "delta":
+            await self.resync(sid)
+        elif channel.protocol == "packed":
+            await self.sio.emit('train_table', string_table(self.table), to=sid)
+            payload = channel.last_payload or self._packed_payload(channel)
+            await self.sio.emit('state_packed', payload, to=sid)
+        else:
+            await self.sio.emit('state_update', self._state(channel.select(self.index, self.table)), to=sid)
+
+    async def connect(self, sid: str, auth: Optional[dict] = None):
+        protocol = (auth or {}).get("protocol", "full")
+        if protocol not in PROTOCOLS:
+            protocol = "full"
+        self.protocols[sid] = protocol
+        # Send initial state immediately
+        await self._join(sid, protocol, None)
+
+    async def subscribe(self, sid: str, subscription: Optional[Subscription]):
+        """Restrict sid to a viewport; None goes back to the whole network."""
+        await self._join(sid, self.protocols.get(sid, "full"), subscription)
+
+    def disconnect(self, sid: str):
+        self.protocols.pop(sid, None)
+        channel = self.clients.pop(sid, None)
+        if channel is not None:
+            channel.members.discard(sid)
+            if not channel.members:
+                self.channels.pop(channel.room, None)
+
+    async def resync(self, sid: str):
+        channel = self.clients.get(sid)
+        if channel is None or channel.encoder is None:
+            return
+        if channel.stale and self._latest is not None:
+            # Encoder was idle (new channel); restart the stream with a keyframe
+            channel.encoder.encode(self._state(channel.select(self.index, self.table)), force_keyframe=True)
+            channel.stale = False
+        # The mirror (not the live state) is what subsequent deltas apply to
+        if channel.encoder.seq:
+            await self.sio.emit('state_update', channel.encoder.snapshot(), to=sid)
+
+    def _packed_payload(self, channel: Channel) -> dict:
+        _, alerts, suggestions, scalars = self._latest
+        return pack_state(self.table, alerts, suggestions, self.tick, scalars.get("weather"),
+                          idx=channel.select(self.index, self.table))
+
+    async def publish(self, table: TrainTable, trains: Sequence[Train], alerts: List[Alert],
+                      suggestions: List[Suggestion], **scalars):
+        self.tick += 1
+        self.table = table
+        self._latest = (trains, alerts, suggestions, scalars)
+        self._train_dicts = {}
+        if not self.sio or not self.channels:
+            return
+
+        if any(c.subscription is not None and c.subscription.bbox is not None for c in self.channels.values()):
+            self.index.rebuild(table.lat, table.lng)
+
+        # Re-send the string table only when the train set changes
+        if table.ids != self._sent_ids and any(c.protocol == "packed" for c in self.channels.values()):
+            self._sent_ids = list(table.ids)
+            for channel in self.channels.values():
+                if channel.protocol == "packed":
+                    await self.sio.emit('train_table', string_table(table), room=channel.room)
+
+        for channel in list(self.channels.values()):
+            if channel.protocol == "packed":
+                channel.last_payload = self._packed_payload(channel)
+                await self.sio.emit('state_packed', channel.last_payload, room=channel.room)
+            elif channel.protocol == "delta":
+                state = self._state(channel.select(self.index, table))
+                event, payload = channel.encoder.encode(state, force_keyframe=channel.stale)
+                channel.stale = False
+                await self.sio.emit(event, payload, room=channel.room)
+            else:
+                await self.sio.emit('state_update', self._state(channel.select(self.index, table)), room=channel.room)
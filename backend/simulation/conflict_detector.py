@@ -1,89 +1,277 @@
-from typing import List, Tuple
-from simulation.models import Train, Block, Alert, AlertType
-from datetime import datetime
+import numpy as np
+from typing import Dict, List, Tuple
+from simulation.models import Train, Block, Alert, AlertType, TrainDirection
+from simulation.routes import SINGLE_LINE_SECTIONS, section_name
+from simulation.alerts import alert_id
+from datetime import datetime, timedelta
 
 # We will need the MLService instance. 
 # Ideally passed in, but for this structure we might access via global or import in function scope to avoid circular deps if needed.
 # Better pattern: Pass ml_service to the check functions.
 
-def check_head_on(trains: List[Train]) -> List[Alert]:
+REAR_END_DISTANCE_KM = 2.0
+HEAD_ON_DISTANCE_KM = 5.0
+
+class ConflictPairs:
+    """Adjacent train pairs found by one sweep (indices into the train arrays)."""
+    def __init__(self, follower, leader, rear_gap, east, west, head_on_gap):
+        # Same direction: follower runs behind leader
+        self.follower = follower
+        self.leader = leader
+        self.rear_gap = rear_gap
+        # Opposing directions on a single-line section, closing on each other
+        self.east = east
+        self.west = west
+        self.head_on_gap = head_on_gap
+
+class ConflictDetector:
+    """
+    Direction-aware sweep-line detector.
+    Trains are bucketed by (route, direction); each bucket keeps its ordering between
+    ticks, and since trains rarely overtake that order is nearly sorted, so re-sorting
+    with an adaptive stable sort is close to linear.
+    """
+    def __init__(self, single_line_sections: Dict[str, List[Tuple[float, float]]] = None):
+        self.single_line_sections = SINGLE_LINE_SECTIONS if single_line_sections is None else single_line_sections
+        self._buckets: Dict[Tuple[str, int], np.ndarray] = {}
+        self._bucket_key = None
+
+    def _rebuild_buckets(self, route_ids: List[str], direction: np.ndarray, distance: np.ndarray):
+        self._buckets = {}
+        routes = np.array(route_ids, dtype=object)
+        for route_id in set(route_ids):
+            for sign in (1, -1):
+                idx = np.flatnonzero((routes == route_id) & (direction == sign))
+                self._buckets[(route_id, sign)] = idx[np.argsort(distance[idx], kind="stable")]
+        self._bucket_key = (tuple(route_ids), direction.tobytes())
+
+    def _ordered(self, key, distance: np.ndarray) -> np.ndarray:
+        order = self._buckets[key]
+        d = distance[order]
+        if np.any(d[1:] < d[:-1]):
+            order = order[np.argsort(d, kind="stable")]
+            self._buckets[key] = order
+        return order
+
+    def sweep(self, route_ids: List[str], direction: np.ndarray, distance: np.ndarray) -> ConflictPairs:
+        if self._bucket_key != (tuple(route_ids), direction.tobytes()):
+            self._rebuild_buckets(route_ids, direction, distance)
+
+        follower, leader, east, west = [], [], [], []
+        for route_id in sorted({key[0] for key in self._buckets}):
+            eb = self._ordered((route_id, 1), distance)
+            wb = self._ordered((route_id, -1), distance)
+
+            # Same direction: neighbours in km order. Eastbound leaders are further
+            # along (higher km); westbound leaders are closer to km 0.
+            follower += [eb[:-1], wb[1:]]
+            leader += [eb[1:], wb[:-1]]
+
+            # Opposing: merge both sorted buckets; an eastbound train immediately
+            # followed (in km) by a westbound one means the two are closing.
+            if len(eb) and len(wb):
+                merged = np.concatenate([eb, wb])
+                merged = merged[np.argsort(distance[merged], kind="stable")]
+                closing = np.flatnonzero((direction[merged[:-1]] > 0) & (direction[merged[1:]] < 0))
+                e, w = merged[closing], merged[closing + 1]
+                on_single = np.zeros(len(e), dtype=bool)
+                for start, end in self.single_line_sections.get(route_id, []):
+                    # They meet somewhere between their current positions
+                    on_single |= (distance[e] <= end) & (distance[w] >= start)
+                east.append(e[on_single])
+                west.append(w[on_single])
+
+        def cat(parts):
+            return np.concatenate(parts).astype(np.int64) if parts else np.empty(0, dtype=np.int64)
+        follower, leader, east, west = cat(follower), cat(leader), cat(east), cat(west)
+        return ConflictPairs(
+            follower, leader, np.abs(distance[leader] - distance[follower]),
+            east, west, distance[west] - distance[east],
+        )
+
+def _arrays(trains: List[Train]):
+    route_ids = [t.route_id for t in trains]
+    direction = np.array([1 if t.direction == TrainDirection.EASTBOUND else -1 for t in trains], dtype=np.int8)
+    distance = np.array([t.distance for t in trains], dtype=np.float64)
+    return route_ids, direction, distance
+
+def rear_end_alerts(trains: List[Train], pairs: ConflictPairs, safe_distance_km: float = REAR_END_DISTANCE_KM) -> List[Alert]:
     alerts = []
-    # Simplified logic: In this prototype, we assume single track (SC-KZJ main up/down simplified to 1 line for head-on check demo)
+    for i in np.flatnonzero((pairs.rear_gap < safe_distance_km) & (pairs.rear_gap > 0)).tolist():
+        t1, t2 = trains[pairs.follower[i]], trains[pairs.leader[i]]
+        distance_gap = float(pairs.rear_gap[i])
+        severity = AlertType.CRITICAL if distance_gap < 1.0 else AlertType.MAJOR
+
+        # Deterministic ID based on the alert kind and train pair, stable across ticks
+        alerts.append(Alert(
+            id=alert_id("rear-end", [t1.id, t2.id]),
+            type=severity,
+            message=f"Collision Risk: {t1.name} and {t2.name} are too close ({distance_gap:.2f}km)",
+            time=datetime.now().strftime("%H:%M:%S"),
+            kind="rear-end",
+            train_ids=[t1.id, t2.id],
+        ))
     return alerts
 
-def check_rear_end(trains: List[Train], safe_distance_km: float = 2.0) -> List[Alert]:
+def head_on_alerts(trains: List[Train], pairs: ConflictPairs, safe_distance_km: float = HEAD_ON_DISTANCE_KM) -> List[Alert]:
     alerts = []
-    sorted_trains = sorted(trains, key=lambda t: t.distance)
-    
-    for i in range(len(sorted_trains) - 1):
-        t1 = sorted_trains[i]
-        t2 = sorted_trains[i+1]
-        
-        distance_gap = t2.distance - t1.distance
-        
-        if distance_gap < safe_distance_km and distance_gap > 0:
-            severity = AlertType.CRITICAL if distance_gap < 1.0 else AlertType.MAJOR
-            
-            # Deterministic ID based on train IDs to prevent spamming new alerts
-            # Hash of t1.id + t2.id to int
-            # Simple hash logic to keep ID stable for the same pair
-            alert_id = abs(hash(t1.id + t2.id)) % 1000000
-            
-            alerts.append(Alert(
-                id=alert_id, 
-                type=severity,
-                message=f"Collision Risk: {t1.name} and {t2.name} are too close ({distance_gap:.2f}km)",
-                time=datetime.now().strftime("%H:%M:%S")
-            ))
-            
+    for i in np.flatnonzero(pairs.head_on_gap < safe_distance_km).tolist():
+        t1, t2 = trains[pairs.east[i]], trains[pairs.west[i]]
+        distance_gap = float(pairs.head_on_gap[i])
+        severity = AlertType.CRITICAL if distance_gap < REAR_END_DISTANCE_KM else AlertType.MAJOR
+        alerts.append(Alert(
+            id=alert_id("head-on", [t1.id, t2.id]),
+            type=severity,
+            message=f"Head-On Collision Risk: {t1.name} and {t2.name} closing on single line ({distance_gap:.2f}km)",
+            time=datetime.now().strftime("%H:%M:%S"),
+            kind="head-on",
+            train_ids=[t1.id, t2.id],
+        ))
     return alerts
 
+def _braking_km(speed_kmh: np.ndarray, decel_ms2: float) -> np.ndarray:
+    v = speed_kmh / 3.6
+    return (v * v) / (2 * decel_ms2) / 1000.0
+
+class ConflictForecast:
+    """Pairs predicted to lose separation within the horizon."""
+    def __init__(self, first, second, kind, time_s, location_km):
+        self.first = first            # follower (rear-end) / eastbound train (head-on)
+        self.second = second          # leader (rear-end) / westbound train (head-on)
+        self.kind = kind              # "rear-end" / "head-on"
+        self.time_s = time_s          # seconds until separation is lost
+        self.location_km = location_km
+
+def predict_conflicts(pairs: ConflictPairs, speed_kmh: np.ndarray, direction: np.ndarray, distance: np.ndarray,
+                      horizon_s: float = 600.0, decel_ms2: float = 0.5,
+                      safe_distance_km: float = REAR_END_DISTANCE_KM) -> ConflictForecast:
+    """
+    Closed-form time-to-conflict for every pair in one vectorized pass.
+    Separation is lost when gap - closing_speed * t <= safe distance + braking distance,
+    so t = (gap - safe - braking) / closing_speed for pairs that are closing.
+    """
+    # Rear-end: only the follower has to stop
+    rear_closing = speed_kmh[pairs.follower] - speed_kmh[pairs.leader]
+    rear_margin = pairs.rear_gap - safe_distance_km - _braking_km(speed_kmh[pairs.follower], decel_ms2)
+    # Head-on: both trains have to stop
+    head_closing = speed_kmh[pairs.east] + speed_kmh[pairs.west]
+    head_margin = pairs.head_on_gap - safe_distance_km - _braking_km(speed_kmh[pairs.east], decel_ms2) \
+        - _braking_km(speed_kmh[pairs.west], decel_ms2)
+
+    first = np.concatenate([pairs.follower, pairs.east])
+    second = np.concatenate([pairs.leader, pairs.west])
+    closing = np.concatenate([rear_closing, head_closing])
+    margin = np.concatenate([rear_margin, head_margin])
+    kind = np.array(["rear-end"] * len(pairs.follower) + ["head-on"] * len(pairs.east), dtype=object)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        time_s = np.where(closing > 0, margin / closing * 3600.0, np.inf)
+    # margin <= 0 on a closing pair: separation (incl. braking distance) is already
+    # lost, even when the gap is still outside the instantaneous alert distance
+    time_s = np.maximum(time_s, 0.0)
+    hit = (closing > 0) & (time_s <= horizon_s)
+
+    first, second, time_s = first[hit], second[hit], time_s[hit]
+    location_km = distance[first] + direction[first] * speed_kmh[first] * time_s / 3600.0
+    return ConflictForecast(first, second, kind[hit], time_s, location_km)
+
+def predicted_alerts(trains: List[Train], forecast: ConflictForecast) -> List[Alert]:
+    alerts = []
+    now = datetime.now()
+    for i in range(len(forecast.time_s)):
+        t1, t2 = trains[forecast.first[i]], trains[forecast.second[i]]
+        time_s = float(forecast.time_s[i])
+        location_km = float(forecast.location_km[i])
+        kind = forecast.kind[i]
+        severity = AlertType.MAJOR if time_s < 120 else AlertType.MINOR
+        at = (now + timedelta(seconds=time_s)).strftime("%H:%M:%S")
+        # The predicted section is part of the identity: a conflict moving elsewhere is a new one
+        section = section_name(location_km, t1.route_id)
+        alerts.append(Alert(
+            id=alert_id(f"predicted-{kind}", [t1.id, t2.id], section),
+            type=severity,
+            message=f"Predicted {kind} conflict: {t1.name} and {t2.name} in {int(time_s // 60)}m{int(time_s % 60):02d}s (at {at}) near km {location_km:.1f}",
+            time=now.strftime("%H:%M:%S"),
+            predicted_in_s=round(time_s, 1),
+            location_km=round(location_km, 2),
+            kind=f"predicted-{kind}",
+            train_ids=[t1.id, t2.id],
+        ))
+    return alerts
+
+def check_head_on(trains: List[Train], safe_distance_km: float = HEAD_ON_DISTANCE_KM) -> List[Alert]:
+    pairs = ConflictDetector().sweep(*_arrays(trains))
+    return head_on_alerts(trains, pairs, safe_distance_km)
+
+def check_rear_end(trains: List[Train], safe_distance_km: float = REAR_END_DISTANCE_KM) -> List[Alert]:
+    pairs = ConflictDetector().sweep(*_arrays(trains))
+    return rear_end_alerts(trains, pairs, safe_distance_km)
+
 def check_overspeed(train: Train, block: Block) -> Alert:
     if train.speed > block.speed_limit:
         excess = train.speed - block.speed_limit
         severity = AlertType.MAJOR if excess > 20 else AlertType.MINOR
         
         return Alert(
-            id=int(datetime.now().timestamp()),
+            id=alert_id("overspeed", [train.id]),
             type=severity,
             message=f"Overspeed: {train.name} at {train.speed}km/h (Limit: {block.speed_limit})",
-            time=datetime.now().strftime("%H:%M:%S")
+            time=datetime.now().strftime("%H:%M:%S"),
+            kind="overspeed",
+            train_ids=[train.id],
         )
     return None
 
-def check_ml_conflicts(trains: List[Train], ml_service) -> List[Alert]:
+def conflict_features(pairs: ConflictPairs, speed_kmh: np.ndarray, track_id: int = 1) -> np.ndarray:
+    """Feature matrix [track_id, time_gap, opposite_dir] for every candidate pair."""
+    gap = np.concatenate([pairs.rear_gap, pairs.head_on_gap])
+    first = np.concatenate([pairs.follower, pairs.east])
+    second = np.concatenate([pairs.leader, pairs.west])
+    # time_gap approx = gap / speed
+    avg_speed = (speed_kmh[first] + speed_kmh[second]) / 2
+    avg_speed = np.where(avg_speed == 0, 1, avg_speed)
+    opposite = np.concatenate([np.zeros(len(pairs.rear_gap)), np.ones(len(pairs.head_on_gap))])
+    return np.column_stack([np.full(len(gap), track_id, dtype=np.float64), gap / avg_speed, opposite])
+
+def ml_conflict_alerts(trains: List[Train], first: np.ndarray, second: np.ndarray, probs: np.ndarray,
+                       stale: np.ndarray = None) -> List[Alert]:
+    alerts = []
+    for i in np.flatnonzero(probs > 0.6).tolist():
+        t1, t2 = trains[first[i]], trains[second[i]]
+        prob = float(probs[i])
+        severity = AlertType.CRITICAL if prob > 0.8 else AlertType.MAJOR
+        alerts.append(Alert(
+            id=alert_id("ml-conflict", [t1.id, t2.id]),
+            type=severity,
+            message=f"AI Prediction: High conflict probability ({int(prob*100)}%) between {t1.name} and {t2.name}",
+            time=datetime.now().strftime("%H:%M:%S"),
+            stale=bool(stale[i]) if stale is not None else False,
+            kind="ml-conflict",
+            train_ids=[t1.id, t2.id],
+        ))
+    return alerts
+
+def check_ml_conflicts(trains: List[Train], ml_service, pairs: ConflictPairs = None,
+                       speed: np.ndarray = None) -> List[Alert]:
     alerts = []
     if not ml_service:
         return alerts
-        
-    # Check pairwise purely based on ML probability
-    # Mock usage: We check if "gap" is narrowing fast or similar based on whatever ML model expects
-    # Model expects: track_id, time_gap, opposite_dir
-    # We iterate pairs
-    sorted_trains = sorted(trains, key=lambda t: t.distance)
-    for i in range(len(sorted_trains) - 1):
-        t1 = sorted_trains[i]
-        t2 = sorted_trains[i+1]
-        
-        # Determine features
-        track_id = 1 # simplified
-        gap = t2.distance - t1.distance
-        # time_gap approx = gap / speed
-        avg_speed = (t1.speed + t2.speed) / 2 or 1
-        time_gap = gap / avg_speed
-        
-        try:
-            prob = ml_service.predict_conflict(track_id, time_gap, 0) # 0 = same dir
-            
-            if prob > 0.6:
-                severity = AlertType.CRITICAL if prob > 0.8 else AlertType.MAJOR
-                alerts.append(Alert(
-                    id=int(datetime.now().timestamp() + 100 + i),
-                    type=severity,
-                    message=f"AI Prediction: High conflict probability ({int(prob*100)}%) between {t1.name} and {t2.name}",
-                    time=datetime.now().strftime("%H:%M:%S")
-                ))
-        except Exception as e:
-            print(f"ML Conflict Check Failed: {e}")
-            
-    return alerts
+
+    # Score every candidate pair from the sweep in a single batched model call
+    if pairs is None:
+        pairs = ConflictDetector().sweep(*_arrays(trains))
+    if speed is None:
+        speed = np.array([t.speed for t in trains], dtype=np.float64)
+    X = conflict_features(pairs, speed)
+    if not len(X):
+        return alerts
+    first = np.concatenate([pairs.follower, pairs.east])
+    second = np.concatenate([pairs.leader, pairs.west])
+
+    try:
+        probs = ml_service.predict_conflict_batch(X)
+    except Exception as e:
+        print(f"ML Conflict Check Failed: {e}")
+        return alerts
+
+    return ml_conflict_alerts(trains, first, second, probs)
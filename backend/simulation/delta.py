@@ -0,0 +1,101 @@
+from typing import Dict, List, Optional, Tuple
+
+# Delta encoding for the state_update stream.
+# Keyframes carry the full state; deltas carry only fields that moved more than their
+# tolerance, plus added / removed entities. Deltas are computed against what was last
+# *sent* (the mirror), not the last true state, so tolerance error never accumulates
+# on the client.
+
+ENTITY_COLLECTIONS = ("trains", "alerts", "suggestions")
+
+DEFAULT_TOLERANCES = {
+    "lat": 1e-6,      # ~0.1 m
+    "lng": 1e-6,
+    "speed": 0.05,    # km/h
+    "distance": 0.001, # km
+    "predicted_in_s": 1.0, # look-ahead alerts
+    "location_km": 0.05,
+}
+
+def _changed(old, new, tol: float) -> bool:
+    if tol and isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return abs(new - old) > tol
+    return old != new
+
+class DeltaEncoder:
+    def __init__(self, keyframe_interval: int = 30, tolerances: Dict[str, float] = None):
+        self.keyframe_interval = keyframe_interval
+        self.tolerances = DEFAULT_TOLERANCES if tolerances is None else tolerances
+        self.seq = 0
+        self.ticks_since_keyframe = 0
+        # collection -> entity id -> last sent fields
+        self.mirror: Dict[str, Dict[str, dict]] = {name: {} for name in ENTITY_COLLECTIONS}
+        # scalar fields (weather, clock, ...) as last sent
+        self.scalars: Dict[str, object] = {}
+
+    def snapshot(self) -> dict:
+        """Keyframe of the mirrored state at the current sequence number."""
+        frame = {name: list(self.mirror[name].values()) for name in ENTITY_COLLECTIONS}
+        frame.update(self.scalars)
+        frame["seq"] = self.seq
+        frame["keyframe"] = True
+        return frame
+
+    def _keyframe(self, state: dict) -> dict:
+        for name in ENTITY_COLLECTIONS:
+            self.mirror[name] = {str(e["id"]): dict(e) for e in state.get(name, [])}
+        self.scalars = {k: v for k, v in state.items() if k not in ENTITY_COLLECTIONS}
+        self.ticks_since_keyframe = 0
+        return self.snapshot()
+
+    def _diff_collection(self, name: str, entities: List[dict]) -> Optional[dict]:
+        mirror = self.mirror[name]
+        seen = set()
+        added, changed = [], {}
+
+        for entity in entities:
+            eid = str(entity["id"])
+            seen.add(eid)
+            prev = mirror.get(eid)
+            if prev is None:
+                added.append(entity)
+                mirror[eid] = dict(entity)
+                continue
+            fields = {}
+            for key, value in entity.items():
+                if key not in prev or _changed(prev[key], value, self.tolerances.get(key, 0)):
+                    fields[key] = value
+                    prev[key] = value
+            if fields:
+                changed[eid] = fields
+
+        removed = [eid for eid in mirror if eid not in seen]
+        for eid in removed:
+            del mirror[eid]
+
+        if not (added or changed or removed):
+            return None
+        return {"added": added, "changed": changed, "removed": removed}
+
+    def encode(self, state: dict, force_keyframe: bool = False) -> Tuple[str, dict]:
+        """
+        Advance the sequence and encode `state` (same shape as a full state_update).
+        Returns (event_name, payload): ("state_update", keyframe) or ("state_delta", delta).
+        """
+        self.seq += 1
+        self.ticks_since_keyframe += 1
+        if force_keyframe or self.seq == 1 or self.ticks_since_keyframe >= self.keyframe_interval:
+            return "state_update", self._keyframe(state)
+
+        delta = {"seq": self.seq, "base_seq": self.seq - 1, "keyframe": False}
+        for name in ENTITY_COLLECTIONS:
+            diff = self._diff_collection(name, state.get(name, []))
+            if diff:
+                delta[name] = diff
+        for key, value in state.items():
+            if key in ENTITY_COLLECTIONS:
+                continue
+            if self.scalars.get(key) != value:
+                delta[key] = value
+                self.scalars[key] = value
+        return "state_delta", delta
@@ -1,135 +1,238 @@
 import asyncio
 import random
-from typing import List, Dict
+import numpy as np
+from typing import List, Dict, Set
 from datetime import datetime
-from simulation.models import Train, Block, Alert, Suggestion, TrainStatus
-from simulation.conflict_detector import check_rear_end, check_overspeed, check_ml_conflicts
-from simulation.suggestions import generate_suggestions
+from simulation.models import Train, Block, Alert, Suggestion, TrainStatus, TrainDirection
+from simulation.train_table import TrainTable, TrainView, WEATHER_FACTORS
+from simulation.scheduler import TickScheduler, CatchUpPolicy
+from simulation.broadcast import Broadcaster
+from simulation.blocks import BlockIndex
+from simulation.alerts import AlertStore, AlertEvent
+from simulation.routes import section_name
+from database.models import ConflictLog
+from inference import DeadlineScorer
+from simulation.conflict_detector import (
+    ConflictDetector, rear_end_alerts, head_on_alerts, predict_conflicts, predicted_alerts,
+    check_overspeed, check_ml_conflicts, conflict_features, ml_conflict_alerts,
+)
+from simulation.suggestions import SuggestionEngine, explanation_requests
 
 # ... (rest of imports)
 
+OFF_BLOCK_SPEED_LIMIT = 100 # km/h, for trains outside every block section
+
 class SimulationEngine:
-    def __init__(self, sio, db_service=None, ml_service=None):
+    def __init__(self, sio, db_service=None, ml_service=None, time_multiplier: float = 1.0,
+                 fast_forward: bool = False, catch_up_policy: CatchUpPolicy = CatchUpPolicy.SKIP,
+                 keyframe_interval: int = 30, prediction_horizon_s: float = 600.0,
+                 inference=None, ml_deadline_s: float = 0.2, explainer=None):
         self.sio = sio
+        self.broadcaster = Broadcaster(sio, keyframe_interval=keyframe_interval)
         self.db_service = db_service
         self.ml_service = ml_service
-        self.trains: Dict[str, Train] = {
-            "12723": Train(id="12723", name="Telangana Exp", speed=85.0, distance=10.0, lat=17.45, lng=78.55, status=TrainStatus.ON_TIME), # Eastbound
-            "20701": Train(id="20701", name="Vande Bharat", speed=110.0, distance=5.0, lat=17.44, lng=78.51, status=TrainStatus.ON_TIME), # Eastbound (Fast)
-            "17010": Train(id="17010", name="Intercity Exp", speed=60.0, distance=50.0, lat=17.65, lng=78.90, status=TrainStatus.DELAYED), # Westbound
-            "11019": Train(id="11019", name="Konark Exp", speed=75.0, distance=80.0, lat=17.72, lng=79.15, status=TrainStatus.ON_TIME), # Westbound
-            "GOODS-1": Train(id="GOODS-1", name="Freight I-20", speed=45.0, distance=30.0, lat=17.48, lng=78.65, status=TrainStatus.ON_TIME), # Eastbound (Slow)
+        # Optional InferenceExecutor: ML runs off the event loop with a per-tick deadline
+        self.ml_scorer = DeadlineScorer(inference, "conflict", "predict_conflict_batch", ml_deadline_s) if inference else None
+        self.explainer = explainer # ExplanationService: cached SHAP attributions for suggestions
+        self.eta_scorer = DeadlineScorer(inference, "eta", "predict_eta_batch", ml_deadline_s, default=np.nan) if inference else None
+        self.table = TrainTable([
+            Train(id="12723", name="Telangana Exp", speed=85.0, distance=10.0, lat=17.45, lng=78.55, status=TrainStatus.ON_TIME), # Eastbound
+            Train(id="20701", name="Vande Bharat", speed=110.0, distance=5.0, lat=17.44, lng=78.51, status=TrainStatus.ON_TIME), # Eastbound (Fast)
+            Train(id="17010", name="Intercity Exp", speed=60.0, distance=50.0, lat=17.65, lng=78.90, status=TrainStatus.DELAYED, direction=TrainDirection.WESTBOUND), # Westbound
+            Train(id="11019", name="Konark Exp", speed=75.0, distance=80.0, lat=17.72, lng=79.15, status=TrainStatus.ON_TIME, direction=TrainDirection.WESTBOUND), # Westbound
+            Train(id="GOODS-1", name="Freight I-20", speed=45.0, distance=30.0, lat=17.48, lng=78.65, status=TrainStatus.ON_TIME), # Eastbound (Slow)
             
             # Synthetic Data (Added based on User Request)
-            "12760": Train(id="12760", name="Charminar Exp", speed=70.0, distance=15.0, lat=17.46, lng=78.58, status=TrainStatus.DELAYED), # Eastbound
-            "17230": Train(id="17230", name="Sabari Exp", speed=80.0, distance=60.0, lat=17.68, lng=79.00, status=TrainStatus.ON_TIME), # Westbound
-            "12604": Train(id="12604", name="Chennai Exp", speed=95.0, distance=25.0, lat=17.49, lng=78.70, status=TrainStatus.ON_TIME), # Eastbound
-            "GOODS-2": Train(id="GOODS-2", name="Coal Heavy", speed=40.0, distance=70.0, lat=17.70, lng=79.10, status=TrainStatus.ON_TIME), # Westbound
-            "47155": Train(id="47155", name="Local MMTS", speed=55.0, distance=8.0, lat=17.445, lng=78.53, status=TrainStatus.ON_TIME), # Eastbound
-            "12862": Train(id="12862", name="Visakha Exp", speed=85.0, distance=40.0, lat=17.55, lng=78.85, status=TrainStatus.ON_TIME), # Eastbound
-            "17659": Train(id="17659", name="Kakatiya Pass", speed=50.0, distance=12.0, lat=17.455, lng=78.56, status=TrainStatus.ON_TIME), # Eastbound
-        }
-        self.blocks: Dict[str, Block] = {} 
+            Train(id="12760", name="Charminar Exp", speed=70.0, distance=15.0, lat=17.46, lng=78.58, status=TrainStatus.DELAYED), # Eastbound
+            Train(id="17230", name="Sabari Exp", speed=80.0, distance=60.0, lat=17.68, lng=79.00, status=TrainStatus.ON_TIME, direction=TrainDirection.WESTBOUND), # Westbound
+            Train(id="12604", name="Chennai Exp", speed=95.0, distance=25.0, lat=17.49, lng=78.70, status=TrainStatus.ON_TIME), # Eastbound
+            Train(id="GOODS-2", name="Coal Heavy", speed=40.0, distance=70.0, lat=17.70, lng=79.10, status=TrainStatus.ON_TIME, direction=TrainDirection.WESTBOUND), # Westbound
+            Train(id="47155", name="Local MMTS", speed=55.0, distance=8.0, lat=17.445, lng=78.53, status=TrainStatus.ON_TIME), # Eastbound
+            Train(id="12862", name="Visakha Exp", speed=85.0, distance=40.0, lat=17.55, lng=78.85, status=TrainStatus.ON_TIME), # Eastbound
+            Train(id="17659", name="Kakatiya Pass", speed=50.0, distance=12.0, lat=17.455, lng=78.56, status=TrainStatus.ON_TIME), # Eastbound
+        ])
+        # Block sections along the route; occupancy is tracked incrementally each tick
+        self.block_index = BlockIndex.from_csv()
+        self.blocks: Dict[str, Block] = self.block_index.by_id
+        self.detector = ConflictDetector()
+        self.prediction_horizon_s = prediction_horizon_s
         self.alerts: List[Alert] = []
+        # Live alerts keyed by stable identity; only lifecycle transitions are emitted
+        self.alert_store = AlertStore()
         self.suggestions: List[Suggestion] = []
+        self.suggestion_engine = SuggestionEngine() # rule table, cached per alert identity
+        self._background: Set[asyncio.Task] = set() # in-flight persistence writes
         self.running = False
+        self.weather_condition = "clear"
+        self.scheduler = TickScheduler(
+            tick_interval=1.0,
+            time_multiplier=time_multiplier,
+            fast_forward=fast_forward,
+            policy=catch_up_policy,
+        )
+
+    @property
+    def trains(self) -> Dict[str, Train]:
+        # Materialized view of the train table (API / serialization boundary)
+        return {t.id: t for t in self.table.to_models()}
 
     async def run(self):
         self.running = True
-        self.weather_condition = "clear" 
         
-        while self.running:
-             # 1. Update Positions (Simple Simulation)
-            train_list = list(self.trains.values())
-            
-            # Weather Effect Multiplier
-            weather_factor = 1.0
-            if self.weather_condition == "rain":
-                weather_factor = 0.8
-            elif self.weather_condition == "fog":
-                weather_factor = 0.7
-            elif self.weather_condition == "storm":
-                weather_factor = 0.5
-
-            for train in train_list:
-                # Calculate effective speed
-                # If DELAYED/STOPPED, effective speed is 0
-                if train.status in [TrainStatus.DELAYED, TrainStatus.STOPPED]:
-                    effective_speed = 0.0
-                else:
-                    effective_speed = train.speed * weather_factor
-                
-                if effective_speed > 0:
-                    # Move 0.001 deg lat/lng per tick approx (scaled by speed)
-                    # 100 km/h approx -> 0.001 deg/sec
-                    displacement = 0.0005 * (effective_speed / 100)
-                    
-                    # Directional Logic based on Train ID/Name (Mock)
-                    # Odd IDs / Goods -> Eastbound (+lng)
-                    # Even IDs -> Westbound (-lng) (Railway convention is usually Up/Down but mapping to ID works for demo)
-                    
-                    is_westbound = train.id in ["17010", "11019", "17230", "GOODS-2"] # Explicitly defined westbound trains
-                    
-                    if is_westbound:
-                        train.lng -= displacement
-                        # Naive Lat adjustment to follow line SC->KZJ (approx slope 0.5)
-                        train.lat -= (displacement * 0.4) 
-                    else:
-                        train.lng += displacement
-                        train.lat += (displacement * 0.4)
-                    
-                    # Reset if out of bounds (Loop Simulation)
-                    if train.lng > 79.5: train.lng = 78.5; train.lat = 17.43
-                    if train.lng < 78.5: train.lng = 79.5; train.lat = 17.97
-
-                    # Update internal distance metric
-                    train.distance += (effective_speed / 3600) # km per sec
+        # Ticks run on absolute deadlines; each tick covers tick.sim_dt simulated seconds
+        async for tick in self.scheduler.ticks():
+            # 1. Update Positions (vectorized over the whole train table)
+            weather_factor = WEATHER_FACTORS.get(self.weather_condition, 1.0)
+            self.table.advance(weather_factor, dt=tick.sim_dt)
+            self.block_index.update_occupancy(self.table.ids, self.table.distance)
+            # Per-train ETAs: one batched LSTM forward pass for the whole table
+            await self._refresh_etas()
+            # Lazy view: Train models are only built for trains that end up in alerts,
+            # suggestions or JSON payloads; detection itself runs on the table arrays
+            train_list = self.table.view()
             
             # 2. Detect Conflicts
             # Only check for new alerts if we don't have existing critical ones to avoid spam
             # Or better, just overwrite self.alerts but frontend needs to handle unique keys
-            current_alerts = check_rear_end(train_list)
+            # One direction-aware sweep finds rear-end and head-on candidate pairs
+            pairs = self.detector.sweep(self.table.route_ids, self.table.direction, self.table.distance)
+            current_alerts = rear_end_alerts(train_list, pairs) + head_on_alerts(train_list, pairs)
+
+            # Look-ahead: closed-form time-to-conflict for the same pairs
+            forecast = predict_conflicts(
+                pairs, self.table.effective_speed(weather_factor), self.table.direction, self.table.distance,
+                horizon_s=self.prediction_horizon_s,
+            )
+            current_alerts.extend(predicted_alerts(train_list, forecast))
             
-            # Check overspeed for each
-            for train in train_list:
-                limit = 100 * weather_factor # Limit also drops with weather
-                alert = check_overspeed(train, Block(id="temp", section="temp", start_km=0, end_km=0, status="free", speed_limit=int(limit)))
+            # Check overspeed against each train's block limit (only trains above it need an Alert built)
+            for i, block in self._overspeeding(weather_factor):
+                alert = check_overspeed(train_list[i], block)
                 if alert:
                     current_alerts.append(alert)
             
             # Check ML Conflicts
-            if self.ml_service:
-                ml_alerts = check_ml_conflicts(train_list, self.ml_service)
+            if self.ml_scorer:
+                # Off-loop with a per-tick deadline; falls back to last known (stale) scores
+                current_alerts.extend(await self._score_ml_conflicts(train_list, pairs))
+            elif self.ml_service:
+                ml_alerts = check_ml_conflicts(train_list, self.ml_service, pairs, speed=self.table.speed)
                 current_alerts.extend(ml_alerts)
                 
-            self.alerts = current_alerts
+            alert_events = self.alert_store.update(current_alerts)
+            self.alerts = self.alert_store.active()
+            if alert_events:
+                await self._publish_alert_events(alert_events)
 
             # 3. Generate Suggestions
-            self.suggestions = generate_suggestions(train_list, self.alerts)
+            self.suggestions = self.suggestion_engine.generate(train_list, self.alerts)
+            if self.explainer:
+                await self._explain_suggestions(train_list)
 
             # 4. Broadcast State
-            state = {
-                "trains": [t.dict() for t in train_list],
-                "alerts": [a.dict() for a in self.alerts],
-                "suggestions": [s.dict() for s in self.suggestions],
-                "weather": self.weather_condition
-            }
-            if self.sio:
-                await self.sio.emit('state_update', state)
-
-            # Wait for next tick
-            await asyncio.sleep(1)
+            await self.broadcaster.publish(
+                self.table, train_list, self.alerts, self.suggestions,
+                weather=self.weather_condition,
+                clock=self.scheduler.stats.dict(),
+            )
+
+    async def _publish_alert_events(self, events: List[AlertEvent]):
+        if self.sio:
+            await self.sio.emit("alert_events", [e.dict() for e in events])
+        if self.db_service:
+            # Persist in the background; a slow database must not stall the tick.
+            # Keep a reference until done so the task isn't garbage-collected mid-write
+            task = asyncio.ensure_future(self._log_alert_events(events))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def _log_alert_events(self, events: List[AlertEvent]):
+        for e in events:
+            alert = e.alert
+            location = section_name(alert.location_km) if alert.location_km is not None else ""
+            if not location and alert.train_ids and alert.train_ids[0] in self.table:
+                location = section_name(float(self.table.distance[self.table.index[alert.train_ids[0]]]))
+            try:
+                await self.db_service.log_conflict(ConflictLog(
+                    conflict_type=alert.kind or "unknown",
+                    trains=alert.train_ids,
+                    location=location,
+                    time=datetime.now(),
+                    severity=alert.type.value,
+                    event=e.event,
+                    alert_id=alert.id,
+                    message=alert.message,
+                ))
+            except Exception as ex:
+                # Log and keep going: one failed write must not drop the rest of the batch
+                print(f"Failed to persist alert event ({e.event} {alert.id}): {ex}")
+
+    async def _refresh_etas(self):
+        if not len(self.table) or not (self.eta_scorer or self.ml_service):
+            return
+        # Features: [speed, dist_remaining, current_delay, hour_of_day]
+        X = np.column_stack([
+            self.table.speed,
+            self.table.remaining_km(),
+            np.zeros(len(self.table)),
+            np.full(len(self.table), datetime.now().hour),
+        ])
+        if self.eta_scorer:
+            etas, _ = await self.eta_scorer.score(X, self.table.ids)
+        else:
+            etas = self.ml_service.predict_eta_batch(X)
+        # Models report -1 when unavailable
+        self.table.eta_min = np.where(etas >= 0, etas, np.nan)
+
+    async def _explain_suggestions(self, train_list: TrainView):
+        requests = explanation_requests(self.suggestions, self.alerts, train_list.by_id, self.weather_condition)
+        for model in {model for _, model, _ in requests}:
+            batch = [(i, row) for i, m, row in requests if m == model]
+            try:
+                explanations = await self.explainer.explain_batch(model, [row for _, row in batch])
+            except Exception as e:
+                print(f"Suggestion explanations failed ({model}): {e}")
+                continue
+            for (i, _), explanation in zip(batch, explanations):
+                self.suggestions[i].explanation = explanation or None
+
+    async def _score_ml_conflicts(self, train_list: TrainView, pairs) -> List[Alert]:
+        X = conflict_features(pairs, self.table.speed)
+        if not len(X):
+            return []
+        first = np.concatenate([pairs.follower, pairs.east])
+        second = np.concatenate([pairs.leader, pairs.west])
+        keys = [(self.table.ids[a], self.table.ids[b]) for a, b in zip(first.tolist(), second.tolist())]
+        probs, stale = await self.ml_scorer.score(X, keys)
+        return ml_conflict_alerts(train_list, first, second, probs, stale)
 
     def set_weather(self, condition: str):
         self.weather_condition = condition
 
     def inject_delay(self, train_id: str, minutes: int):
-        if train_id in self.trains:
-            train = self.trains[train_id]
+        if train_id in self.table:
             # Stop the train to simulate delay/holding
-            train.status = TrainStatus.DELAYED
-            train.speed = 0.0 
+            self.table.set_status(train_id, TrainStatus.DELAYED)
+            self.table.set_speed(train_id, 0.0)
             print(f"Injected {minutes}m delay for {train_id} (Train Stopped)")
 
+    def set_clock(self, time_multiplier: float = None, fast_forward: bool = None, policy: CatchUpPolicy = None):
+        self.scheduler.configure(time_multiplier=time_multiplier, fast_forward=fast_forward, policy=policy)
+
+    def _overspeeding(self, weather_factor: float):
+        """(train index, block with its weather-adjusted limit) for trains above their block's limit."""
+        blocks = self.block_index.blocks
+        # Trailing entry: trains outside every block keep the old flat 100 km/h limit
+        limits = np.array([b.speed_limit for b in blocks] + [OFF_BLOCK_SPEED_LIMIT], dtype=np.float64)
+        limits = np.floor(limits * weather_factor) # Limit also drops with weather
+        pos = self.block_index.lookup_many(self.table.distance)
+        pos = np.where(pos >= 0, pos, len(blocks))
+        for i in np.flatnonzero(self.table.speed > limits[pos]).tolist():
+            p = int(pos[i])
+            block = blocks[p] if p < len(blocks) else Block(id="none", section=section_name(float(self.table.distance[i])),
+                                                             start_km=0, end_km=0, status="free")
+            yield i, block.copy(update={"speed_limit": int(limits[p])})
+
     def stop(self):
         self.running = False
+        self.scheduler.stop()
@@ -0,0 +1,250 @@
+import csv
+import os
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from pydantic import BaseModel, Field
+from simulation.models import Train, Block, TrainStatus
+from simulation.routes import DATASETS_DIR, MAX_ROUTE_KM
+from simulation.scenarios import ScenarioConfig, EnsembleResult, PairConflictProbability, WeatherCondition
+from simulation.conflict_detector import REAR_END_DISTANCE_KM
+from simulation.what_if_engine import WhatIfEngine, WEATHER_SPEED_FACTORS, along_route
+
+# Monte Carlo what-if ensembles.
+# The deterministic engine halves speeds for delayed trains and applies one fixed
+# weather factor, so a single run says nothing about risk. Here K stochastic
+# realizations run at once with the realization as the first array axis: every
+# (K, N) array is stepped with the same 10 s signal / block logic as the step mode.
+# Per realization and train we draw
+#   - a speed multiplier around the weather factor (noisier in worse weather),
+#   - dwell overruns / incidents: Poisson arrivals over the horizon (at most one is
+#     simulated), each holding the train for a lognormal duration fitted to
+#     datasets/delay_logs.csv,
+# and scenario train_delays become a hold of that many minutes at the start.
+
+DELAY_LOGS_CSV = os.path.join(DATASETS_DIR, "delay_logs.csv")
+INCIDENT_RATE_PER_HOUR = 0.1 # per train, in clear weather
+MAX_REALIZATIONS = 5000
+
+# Weather -> (sigma of the lognormal speed multiplier, incident rate multiplier)
+WEATHER_NOISE = {
+    WeatherCondition.CLEAR: (0.03, 1.0),
+    WeatherCondition.RAIN: (0.08, 1.5),
+    WeatherCondition.FOG: (0.12, 2.0),
+    WeatherCondition.STORM: (0.20, 3.0),
+}
+
+class DelayModel(BaseModel):
+    """Lognormal fit of logged delay minutes."""
+    mu: float
+    sigma: float
+    samples: int = 0
+
+    def sample(self, rng: np.random.Generator, size) -> np.ndarray:
+        return rng.lognormal(self.mu, self.sigma, size)
+
+# Used when the log is missing: median 8 min, p90 ~ 18 min
+DEFAULT_DELAY_MODEL = DelayModel(mu=float(np.log(8.0)), sigma=0.6)
+
+@lru_cache(maxsize=4)
+def fit_delay_model(path: str = DELAY_LOGS_CSV) -> DelayModel:
+    try:
+        with open(path, newline="") as f:
+            minutes = np.array([float(row["delay_minutes"]) for row in csv.DictReader(f)], dtype=np.float64)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Delay log unavailable ({e}), using default delay distribution")
+        return DEFAULT_DELAY_MODEL
+    minutes = minutes[minutes > 0]
+    if len(minutes) < 2:
+        return DEFAULT_DELAY_MODEL
+    logs = np.log(minutes)
+    return DelayModel(mu=float(logs.mean()), sigma=float(logs.std(ddof=1)), samples=len(minutes))
+
+class EnsembleRequest(BaseModel):
+    scenario: ScenarioConfig
+    realizations: int = Field(1000, ge=1, le=MAX_REALIZATIONS)
+    seed: Optional[int] = None
+    incident_rate_per_hour: float = Field(INCIDENT_RATE_PER_HOUR, ge=0)
+    percentiles: List[float] = Field(default_factory=lambda: [50, 90, 95, 99])
+
+def _pct_key(p: float) -> str:
+    return f"p{p:g}"
+
+class EnsembleSimulation:
+    def __init__(self, current_trains: Dict[str, Train], current_blocks: Dict[str, Block], config: ScenarioConfig,
+                 realizations: int = 1000, seed: Optional[int] = None,
+                 incident_rate_per_hour: float = INCIDENT_RATE_PER_HOUR, delay_model: DelayModel = None):
+        # Blocks, reroutes and maintenance windows come from the deterministic engine;
+        # speeds are drawn here from the live (unmodified) trains
+        self.engine = WhatIfEngine(current_trains, current_blocks)
+        self.engine.apply_scenario(config)
+        self.config = config
+        self.models = [current_trains[tid] for tid in self.engine.trains]
+        self.realizations = realizations
+        self.rng = np.random.default_rng(seed)
+        self.incident_rate_per_hour = incident_rate_per_hour
+        self.delay_model = delay_model or fit_delay_model()
+
+    def _sample(self, horizon_seconds: float):
+        mods = self.config.modifiers
+        K, N = self.realizations, len(self.models)
+        rng = self.rng
+        sigma, incident_factor = WEATHER_NOISE.get(mods.weather, WEATHER_NOISE[WeatherCondition.CLEAR])
+
+        # Mean-preserving speed noise around the deterministic weather factor
+        speed0 = np.array([t.speed for t in self.models], dtype=np.float64) * WEATHER_SPEED_FACTORS.get(mods.weather, 1.0)
+        speed = speed0 * rng.lognormal(-sigma ** 2 / 2, sigma, (K, N))
+
+        # At most one incident per train and realization (P = 1 - exp(-rate * hours))
+        p_incident = 1 - np.exp(-self.incident_rate_per_hour * incident_factor * horizon_seconds / 3600.0)
+        hit = rng.random((K, N)) < p_incident
+        start = np.where(hit, rng.random((K, N)) * horizon_seconds, np.inf)
+        end = start + self.delay_model.sample(rng, (K, N)) * 60.0
+
+        # Scenario delays: hold for that many minutes from the start
+        scheduled = np.array([mods.train_delays.get(t.id, 0.0) * 60.0 for t in self.models], dtype=np.float64)
+        return speed, start, end, scheduled
+
+    def run(self, horizon_minutes: int, percentiles: Sequence[float] = (50, 90, 95, 99)) -> EnsembleResult:
+        started = time.perf_counter()
+        engine = self.engine
+        horizon_seconds = horizon_minutes * 60
+        step_size = 10
+        steps = horizon_seconds // step_size
+        K, N = self.realizations, len(self.models)
+        B = len(engine.block_index)
+        rows = np.arange(K)[:, None]
+
+        speed, incident_start, incident_end, scheduled_hold = self._sample(horizon_seconds)
+        bucket, direction = engine._conflict_buckets(self.models)
+        distance = np.tile(np.array([t.distance for t in self.models], dtype=np.float64), (K, 1))
+        progress = along_route(distance, direction) # travel direction, like the step mode
+        stopped = np.tile(np.array([t.status == TrainStatus.STOPPED for t in self.models], dtype=bool), (K, 1))
+        rerouted = np.array([t.id in engine.rerouted_trains for t in self.models], dtype=bool)
+        delay_min = np.zeros((K, N), dtype=np.float64)
+
+        block_maintenance = np.array([b.status == "maintenance" for b in engine.block_index.blocks] + [False])
+        block_limit = np.array([b.speed_limit for b in engine.block_index.blocks] + [np.inf], dtype=np.float64)
+        block_pos = engine.block_index.lookup_many(distance)
+        occupied_steps = np.zeros((K, B + 1), dtype=np.int64) # last column: outside every block
+        window_pos, window_start, window_end = engine._window_arrays()
+
+        sort_offset = bucket * (2 * MAX_ROUTE_KM + 1.0) # (bucket, km) order with one argsort
+        conflict_codes = [np.empty(0, dtype=np.int64)]
+        target = np.where(stopped, 0.0, speed)
+
+        for step in range(steps):
+            t = step * step_size
+            closed = block_maintenance
+            if len(window_pos):
+                closed = block_maintenance.copy()
+                closed[window_pos[(window_start <= t) & (t < window_end)]] = True
+            active = ~stopped
+            held = (t < scheduled_hold) | ((incident_start <= t) & (t < incident_end))
+
+            # Train ahead per realization and (route, direction): front to back, ties
+            # keep insertion order
+            order = np.argsort(sort_offset - progress, axis=1, kind="stable")
+            same = bucket[order[:, 1:]] == bucket[order[:, :-1]]
+            ahead = np.zeros((K, N), dtype=np.int64)
+            ahead[rows, order[:, 1:]] = np.where(same, order[:, :-1], 0)
+            has_ahead = np.zeros((K, N), dtype=bool)
+            has_ahead[rows, order[:, 1:]] = same
+            signalled = has_ahead & ~rerouted & ~rerouted[ahead]
+
+            blocked = (closed[block_pos] & ~rerouted) | held
+            base = np.where(blocked, 0.0, np.minimum(speed, block_limit[block_pos]))
+
+            # Same fixed point as the step mode; after the first pass only the
+            # realizations that have not settled are iterated again
+            new_progress = np.where(active, progress + np.minimum(target, base) / 3600.0 * step_size, progress)
+            target = target.copy()
+            todo = np.arange(K)
+            for _ in range(N + 1):
+                current, d = new_progress[todo], progress[todo]
+                new_ahead = np.take_along_axis(np.minimum(current, MAX_ROUTE_KM), ahead[todo], axis=1)
+                sub_target = engine._signal_targets(base[todo], d, new_ahead, signalled[todo])
+                updated = np.where(active[todo], d + sub_target / 3600.0 * step_size, d)
+                target[todo] = sub_target
+                unsettled = (updated != current).any(axis=1)
+                if not unsettled.any():
+                    break
+                new_progress[todo[unsettled]] = updated[unsettled]
+                todo = todo[unsettled]
+
+            delay_min += np.where(active & (target < 1) & (new_progress < MAX_ROUTE_KM), step_size / 60.0, 0.0)
+            done = active & (new_progress > MAX_ROUTE_KM)
+            new_progress[done] = MAX_ROUTE_KM
+            stopped |= done
+            speed[done] = 0
+            distance = np.where(new_progress != progress, along_route(new_progress, direction), distance)
+            progress = new_progress
+
+            # Rear-end proximity: neighbours within a (route, direction) bucket
+            pair_order = np.argsort(sort_offset + distance, axis=1)
+            lo, hi = pair_order[:, :-1], pair_order[:, 1:]
+            gap = np.take_along_axis(distance, hi, axis=1) - np.take_along_axis(distance, lo, axis=1)
+            hits = (bucket[lo] == bucket[hi]) & (gap < REAR_END_DISTANCE_KM) & (gap > 0)
+            if hits.any():
+                k = np.nonzero(hits)[0]
+                a, b = np.minimum(lo[hits], hi[hits]), np.maximum(lo[hits], hi[hits])
+                conflict_codes.append((k * N + a) * N + b)
+                if len(conflict_codes) > 64:
+                    conflict_codes = [np.unique(np.concatenate(conflict_codes))]
+
+            block_pos = engine.block_index.lookup_many(distance)
+            occupied_steps += np.bincount((rows * (B + 1) + np.where(block_pos >= 0, block_pos, B)).ravel(),
+                                          minlength=K * (B + 1)).reshape(K, B + 1)
+
+        return self._summarize(delay_min, occupied_steps[:, :B] * step_size, np.unique(np.concatenate(conflict_codes)),
+                               horizon_minutes, percentiles, time.perf_counter() - started)
+
+    def _summarize(self, delay_min: np.ndarray, occupied_s: np.ndarray, conflict_codes: np.ndarray,
+                   horizon_minutes: int, percentiles: Sequence[float], elapsed_s: float) -> EnsembleResult:
+        K, N = delay_min.shape
+        horizon_seconds = horizon_minutes * 60
+        ids = [t.id for t in self.models]
+        keys = [_pct_key(p) for p in percentiles]
+
+        train_pct = np.percentile(delay_min, percentiles, axis=0) if K else np.zeros((len(keys), N))
+        delay_percentiles = {
+            tid: {**{key: float(v) for key, v in zip(keys, train_pct[:, i])}, "mean": float(delay_min[:, i].mean())}
+            for i, tid in enumerate(ids)
+        }
+        total = delay_min.sum(axis=1)
+        total_delay_percentiles = {**{key: float(v) for key, v in zip(keys, np.percentile(total, percentiles))},
+                                   "mean": float(total.mean())}
+
+        # Conflict codes are unique (realization, pair) hits: count realizations per pair
+        pairs, counts = np.unique(conflict_codes % (N * N), return_counts=True)
+        conflict_probabilities = sorted(
+            (PairConflictProbability(train_ids=[ids[p // N], ids[p % N]], probability=c / K)
+             for p, c in zip(pairs.tolist(), counts.tolist())),
+            key=lambda c: -c.probability,
+        )
+        any_conflict = len(np.unique(conflict_codes // (N * N))) / K if K else 0.0
+
+        utilization = occupied_s / horizon_seconds * 100 if horizon_seconds else np.zeros_like(occupied_s, dtype=np.float64)
+        util_pct = np.percentile(utilization, [10, 50, 90], axis=0)
+        block_utilization = {
+            block.id: {"p10": float(util_pct[0, j]), "p50": float(util_pct[1, j]), "p90": float(util_pct[2, j]),
+                       "mean": float(utilization[:, j].mean())}
+            for j, block in enumerate(self.engine.block_index.blocks)
+        }
+
+        return EnsembleResult(
+            scenario_id=f"ens_{horizon_seconds}_{K}",
+            realizations=K,
+            delay_percentiles=delay_percentiles,
+            total_delay_percentiles=total_delay_percentiles,
+            conflict_probabilities=conflict_probabilities,
+            block_utilization=block_utilization,
+            metrics={
+                "duration_simulated_min": horizon_minutes,
+                "p_any_conflict": any_conflict,
+                "elapsed_s": round(elapsed_s, 3),
+                "delay_model_mu": self.delay_model.mu,
+                "delay_model_sigma": self.delay_model.sigma,
+            },
+        )
@@ -0,0 +1,283 @@
+import heapq
+from bisect import bisect_right
+from datetime import datetime
+from typing import List
+import numpy as np
+from simulation.models import TrainStatus
+from simulation.routes import MAX_ROUTE_KM
+
+# Discrete-event what-if simulation.
+# Between events every train runs at a constant speed, so instead of stepping the
+# clock in 10 s increments the run jumps straight to the next event: a block boundary
+# crossing, a signal aspect change (the gap to the train ahead crossing 5 km or 2 km),
+# an arrival at the end of the route, or a maintenance window opening / closing.
+# Pending events sit in a heapq keyed by time. When a train's speed changes its
+# pending events are invalidated (per-train version counter) and rescheduled, and the
+# change propagates to the trains behind it only. Cost scales with the number of
+# events, not horizon / step size x trains.
+#
+# Positions are progress along the direction of travel (what_if_engine.along_route),
+# so westbound trains run towards km 0 like in the step mode and the live table;
+# block boundaries are mirrored for them and chainage is only used for block lookups.
+#
+# Signals: main-line trains are signalled by the nearest main-line train ahead in the
+# same (route, direction), so they never pass each other and their order is fixed for
+# the whole run. Rerouted (loop-line) trains run free and do not signal the trains
+# behind them. (The fixed step mode re-sorts every step and lets a rerouted train hide
+# the train ahead of it; in continuous time that would make trains leapfrog with
+# zero-length events.)
+
+RED_GAP_KM = 2.0       # closer than this to the train ahead: stop
+YELLOW_GAP_KM = 5.0    # closer than this: approach at YELLOW_SPEED_KMH
+YELLOW_SPEED_KMH = 30.0
+EPS_KM = 1e-7          # positions this close count as "at" a boundary / signal threshold
+
+BLOCK, SIGNAL, ARRIVAL, MAINTENANCE_START, MAINTENANCE_END = range(5)
+
+def _along(km: float, direction: int) -> float:
+    # Scalar what_if_engine.along_route (chainage <-> progress, its own inverse)
+    return km if direction > 0 else MAX_ROUTE_KM - km
+
+class EventSimulation:
+    def __init__(self, engine):
+        # engine: a WhatIfEngine with the scenario already applied
+        self.engine = engine
+        self.models = list(engine.trains.values())
+        models = self.models
+        n = len(models)
+
+        # Per-train state: progress d0 at time t0, constant speed v since then
+        self.bucket, direction = engine._conflict_buckets(models)
+        self.direction: List[int] = direction.tolist()
+        self.d0: List[float] = [_along(t.distance, d) for t, d in zip(models, self.direction)]
+        self.start = list(self.d0)
+        self.t0: List[float] = [0.0] * n
+        self.v: List[float] = [0.0] * n
+        self.speed: List[float] = [t.speed for t in models] # unconstrained running speed
+        self.stopped: List[bool] = [t.status == TrainStatus.STOPPED for t in models]
+        self.ever_moved = ~np.array(self.stopped, dtype=bool)
+        self.rerouted: List[bool] = [t.id in engine.rerouted_trains for t in models]
+        self.block: List[int] = [-1] * n
+        self.version: List[int] = [0] * n
+        self.delay_s: List[float] = [0.0] * n
+        self.arrived_s: List[float] = [-1.0] * n
+
+        # Main-line trains per (route, direction), front to back (furthest along first);
+        # ties keep insertion order. order[k - 1] is the train ahead of order[k] unless
+        # order[k] leads its group
+        bucket = self.bucket.tolist()
+        self.order: List[int] = sorted((i for i in range(n) if not self.rerouted[i]),
+                                       key=lambda i: (bucket[i], -self.d0[i]))
+        self.rank: List[int] = [-1] * n # -1: loop line, not signalled
+        self.leads: List[bool] = []
+        for k, i in enumerate(self.order):
+            self.rank[i] = k
+            self.leads.append(k == 0 or bucket[self.order[k - 1]] != bucket[i])
+
+        index = engine.block_index
+        self.block_index = index
+        self.block_limit = [float(b.speed_limit) for b in index.blocks]
+        self.closed = [b.status == "maintenance" for b in index.blocks]
+        self.windows_open = [0] * len(index) # overlapping windows on one block count up
+        # Block boundaries as progress, per direction of travel
+        chainage = {*index.starts.tolist(), *index.ends.tolist()}
+        self.boundaries = {d: sorted(_along(km, d) for km in chainage) for d in (1, -1)}
+        self.occupied_s = np.zeros(len(index), dtype=np.float64)
+
+        self.queue = []
+        self._seq = 0
+        self.events = 0
+
+    def _push(self, time: float, kind: int, subject: int, version: int = 0, km: float = 0.0):
+        self._seq += 1
+        heapq.heappush(self.queue, (time, self._seq, kind, subject, version, km))
+
+    def _pos(self, i: int, t: float) -> float:
+        return self.d0[i] + self.v[i] * (t - self.t0[i]) / 3600.0
+
+    def _block(self, i: int, progress: float) -> int:
+        return self.block_index.position(_along(progress, self.direction[i]))
+
+    def _advance(self, i: int, t: float):
+        # Close the constant-speed interval [t0, t]: position, delay and occupancy
+        dt = t - self.t0[i]
+        if dt <= 0:
+            return
+        self.d0[i] = self._pos(i, t)
+        self.t0[i] = t
+        if not self.stopped[i] and self.v[i] < 1:
+            self.delay_s[i] += dt
+        if self.block[i] >= 0:
+            self.occupied_s[self.block[i]] += dt
+
+    def _base_speed(self, i: int, progress: float) -> float:
+        # Block cap for the block the train is about to run through
+        pos = self._block(i, progress + EPS_KM)
+        if pos < 0:
+            return self.speed[i]
+        if (self.closed[pos] or self.windows_open[pos]) and not self.rerouted[i]:
+            return 0.0
+        return min(self.speed[i], self.block_limit[pos])
+
+    def _signal_speed(self, i: int, t: float) -> float:
+        if self.stopped[i]:
+            return 0.0
+        km = self.d0[i]
+        base = self._base_speed(i, km)
+        k = self.rank[i]
+        if k < 0 or self.leads[k]:
+            return base
+        a = self.order[k - 1]
+        gap = self._pos(a, t) - km
+        v_ahead = self.v[a]
+        yellow = min(base, YELLOW_SPEED_KMH)
+        # Exactly at a threshold the train follows the one ahead if that keeps it
+        # there (otherwise the aspect would flip back and forth with zero-length events)
+        if gap < RED_GAP_KM - EPS_KM:
+            return 0.0
+        if gap <= RED_GAP_KM + EPS_KM:
+            return min(max(v_ahead, 0.0), yellow)
+        if gap < YELLOW_GAP_KM - EPS_KM:
+            return yellow
+        if gap <= YELLOW_GAP_KM + EPS_KM:
+            return min(max(v_ahead, yellow), base)
+        return base
+
+    def _schedule(self, i: int, t: float):
+        # Invalidate this train's pending events and queue the next ones
+        self.version[i] += 1
+        version = self.version[i]
+        km, v = self.d0[i], self.v[i]
+        if v > 0:
+            boundaries = self.boundaries[self.direction[i]]
+            j = bisect_right(boundaries, km + EPS_KM)
+            boundary = boundaries[j] if j < len(boundaries) else MAX_ROUTE_KM
+            if boundary >= MAX_ROUTE_KM:
+                self._push(t + max(MAX_ROUTE_KM - km, 0.0) / v * 3600.0, ARRIVAL, i, version, MAX_ROUTE_KM)
+            else:
+                self._push(t + (boundary - km) / v * 3600.0, BLOCK, i, version, boundary)
+
+        k = self.rank[i]
+        if k < 0 or self.leads[k]:
+            return
+        a = self.order[k - 1]
+        gap = self._pos(a, t) - km
+        closing = self.v[a] - v # km/h, negative while catching up
+        thresholds = (RED_GAP_KM, YELLOW_GAP_KM)
+        if closing < 0:
+            below = [g for g in thresholds if g < gap - EPS_KM]
+            if below:
+                self._push(t + (max(below) - gap) / closing * 3600.0, SIGNAL, i, version)
+        elif closing > 0:
+            above = [g for g in thresholds if g > gap + EPS_KM]
+            if above:
+                self._push(t + (min(above) - gap) / closing * 3600.0, SIGNAL, i, version)
+
+    def _update(self, i: int, t: float) -> bool:
+        self._advance(i, t)
+        previous = self.v[i]
+        self.v[i] = self._signal_speed(i, t)
+        km = self.d0[i]
+        # Moving: the block it runs into; held (e.g. at a closed block): the one it is in
+        self.block[i] = self._block(i, km + EPS_KM if self.v[i] > 0 else km - EPS_KM)
+        self._schedule(i, t)
+        return self.v[i] != previous
+
+    def _resolve(self, trains, t: float) -> bool:
+        # Recompute speeds, main-line trains front to back; a train whose speed
+        # changes also dirties the one behind it. Returns whether any speed changed.
+        changed = False
+        dirty = []
+        for i in set(trains):
+            if self.rank[i] < 0:
+                changed |= self._update(i, t)
+            else:
+                dirty.append(self.rank[i])
+        heapq.heapify(dirty)
+        queued = set(dirty)
+        while dirty:
+            k = heapq.heappop(dirty)
+            if self._update(self.order[k], t):
+                changed = True
+                if k + 1 < len(self.order) and not self.leads[k + 1] and k + 1 not in queued:
+                    queued.add(k + 1)
+                    heapq.heappush(dirty, k + 1)
+        return changed
+
+    def _handle(self, kind: int, subject: int, km: float, t: float) -> List[int]:
+        """Apply one event; returns the trains whose speed must be recomputed."""
+        if kind in (BLOCK, ARRIVAL):
+            i = subject
+            self._advance(i, t)
+            self.d0[i] = km # snap onto the boundary (as progress)
+            if kind == ARRIVAL:
+                # Trains reaching the end stop there (finished)
+                self.stopped[i] = True
+                self.speed[i] = 0.0
+                self.arrived_s[i] = t
+            return [i]
+        if kind == SIGNAL:
+            return [subject]
+        # Maintenance window on block `subject`: every train may be affected
+        self.windows_open[subject] += 1 if kind == MAINTENANCE_START else -1
+        return list(range(len(self.models)))
+
+    def _check_conflicts(self, t: float, bucket: np.ndarray, direction: np.ndarray, seen_messages: set):
+        # Gaps change linearly between speed changes, so checking at each change
+        # catches every pair that comes closer than the safe distance
+        distance = np.array([_along(self._pos(i, t), d) for i, d in enumerate(self.direction)], dtype=np.float64)
+        self.engine._record_alerts(self.engine._rear_end_conflicts(self.models, bucket, direction, distance), seen_messages)
+
+    def run(self, horizon_minutes: int):
+        engine = self.engine
+        horizon_seconds = float(horizon_minutes * 60)
+        sim_start_time = datetime.now()
+        delay_start = np.array([engine.max_delays.get(t.id, 0.0) for t in self.models], dtype=np.float64)
+
+        window_pos, window_start, window_end = engine._window_arrays()
+        for pos, start, end in zip(window_pos.tolist(), window_start.tolist(), window_end.tolist()):
+            if end > start:
+                self._push(max(start, 0.0), MAINTENANCE_START, pos)
+                self._push(end, MAINTENANCE_END, pos)
+
+        bucket, direction = self.bucket, np.array(self.direction, dtype=np.int8)
+        seen_messages = {a.message for a in engine.alerts}
+
+        if horizon_seconds > 0:
+            self._resolve(range(len(self.models)), 0.0)
+            self._check_conflicts(0.0, bucket, direction, seen_messages)
+
+        progress_every_s = max(engine.progress_every_min, 1e-3) * 60
+        next_progress = progress_every_s
+        while self.queue and self.queue[0][0] <= horizon_seconds:
+            t, _, kind, subject, version, km = heapq.heappop(self.queue)
+            if kind < MAINTENANCE_START and version != self.version[subject]:
+                continue # superseded by a later speed change
+            self.events += 1
+            if self._resolve(self._handle(kind, subject, km, t), t):
+                self._check_conflicts(t, bucket, direction, seen_messages)
+            if t >= next_progress:
+                # Delay so far (trains are only advanced when they change, so approximate)
+                engine._report_progress(t / 60, horizon_minutes, delay_start + np.array(self.delay_s) / 60.0)
+                next_progress = (t // progress_every_s + 1) * progress_every_s
+
+        for i in range(len(self.models)):
+            self._advance(i, horizon_seconds)
+
+        engine.time_elapsed += int(horizon_seconds)
+        engine.total_steps = self.events
+        return engine._finish(
+            self.models,
+            # Trains that never moved keep their exact chainage (no round trip)
+            np.array([_along(d0, d) if d0 != start else t.distance
+                      for d0, d, start, t in zip(self.d0, self.direction, self.start, self.models)], dtype=np.float64),
+            np.array(self.speed, dtype=np.float64),
+            np.array(self.stopped, dtype=bool),
+            delay_start + np.array(self.delay_s) / 60.0,
+            np.array(self.arrived_s),
+            self.ever_moved,
+            self.occupied_s,
+            horizon_minutes,
+            sim_start_time,
+            metrics={"events_processed": float(self.events)},
+        )
@@ -0,0 +1,42 @@
+import numpy as np
+from typing import Dict, List, Tuple
+from simulation.routes import ROUTE_STATIONS, DEFAULT_ROUTE_ID
+
+# Precomputed route geometry: per-route chainage / lat / lng arrays, so positions for
+# every train are interpolated with one searchsorted instead of a per-train loop.
+
+class RouteGeometry:
+    def __init__(self, route_id: str, stations: List[Tuple[str, float, float, float]]):
+        self.route_id = route_id
+        self.codes = [s[0] for s in stations]
+        self.lat = np.array([s[1] for s in stations], dtype=np.float64)
+        self.lng = np.array([s[2] for s in stations], dtype=np.float64)
+        self.km = np.array([s[3] for s in stations], dtype=np.float64)
+        self.length_km = float(self.km[-1])
+        # Per-segment slopes (deg per km), precomputed once
+        seg_len = np.diff(self.km)
+        self.dlat = np.diff(self.lat) / seg_len
+        self.dlng = np.diff(self.lng) / seg_len
+
+    def segment(self, kms: np.ndarray) -> np.ndarray:
+        """Index of the segment [km[i], km[i+1]] containing each km (clipped to the route)."""
+        seg = np.searchsorted(self.km, kms, side="right") - 1
+        return np.clip(seg, 0, len(self.km) - 2)
+
+    def interpolate(self, kms: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Vectorized km -> (lat, lng, segment index)."""
+        kms = np.clip(np.asarray(kms, dtype=np.float64), 0.0, self.length_km)
+        seg = self.segment(kms)
+        offset = kms - self.km[seg]
+        return self.lat[seg] + self.dlat[seg] * offset, self.lng[seg] + self.dlng[seg] * offset, seg
+
+    def next_station(self, seg: np.ndarray, direction: np.ndarray) -> np.ndarray:
+        """Station index a train in `seg` reaches next (+1 = increasing km)."""
+        return np.where(direction > 0, seg + 1, seg)
+
+GEOMETRIES: Dict[str, RouteGeometry] = {
+    route_id: RouteGeometry(route_id, stations) for route_id, stations in ROUTE_STATIONS.items()
+}
+
+def get_geometry(route_id: str = DEFAULT_ROUTE_ID) -> RouteGeometry:
+    return GEOMETRIES.get(route_id, GEOMETRIES[DEFAULT_ROUTE_ID])
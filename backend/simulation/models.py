@@ -7,6 +7,10 @@ class TrainStatus(str, Enum):
     DELAYED = "delayed"
     STOPPED = "stopped"
 
+class TrainDirection(str, Enum):
+    EASTBOUND = "eastbound" # SC -> KZJ
+    WESTBOUND = "westbound" # KZJ -> SC
+
 class Train(BaseModel):
     id: str
     name: str
@@ -15,8 +19,10 @@ class Train(BaseModel):
     lat: float
     lng: float
     status: TrainStatus
+    direction: TrainDirection = TrainDirection.EASTBOUND
     route_id: str = "SC-KZJ"
     next_station_id: Optional[str] = None
+    eta_minutes: Optional[float] = None # ML ETA to the end of the route
 
 class BlockStatus(str, Enum):
     FREE = "free"
@@ -43,6 +49,11 @@ class Alert(BaseModel):
     type: AlertType
     message: str
     time: str
+    predicted_in_s: Optional[float] = None # Look-ahead alerts: seconds until the predicted conflict
+    location_km: Optional[float] = None # Look-ahead alerts: where it is predicted to happen
+    stale: bool = False # ML alerts built from last known scores (model missed the tick deadline)
+    kind: Optional[str] = None # "rear-end", "head-on", "predicted-rear-end", "overspeed", "ml-conflict", ...
+    train_ids: List[str] = []
 
 class Suggestion(BaseModel):
     id: str
@@ -52,3 +63,6 @@ class Suggestion(BaseModel):
     confidence: float
     predicted_effect: str = "Unknown"
     actions: List[str] = [] # Multiple options
+    alert_id: Optional[int] = None # Alert that triggered the suggestion
+    rule: Optional[str] = None # Copilot rule that produced it
+    explanation: Optional[dict] = None # SHAP feature attributions from the backing model
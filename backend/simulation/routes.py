@@ -0,0 +1,43 @@
+import os
+
+# Route definitions shared by the live engine, the what-if engine and the block index.
+
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "datasets")
+
+DEFAULT_ROUTE_ID = "SC-KZJ"
+
+# (station code, lat, lng, km from origin)
+ROUTE_STATIONS = {
+    "SC-KZJ": [
+        ("SC", 17.4334, 78.5044, 0),
+        ("MJF", 17.4497, 78.5262, 5),
+        ("CHZ", 17.4721, 78.5910, 12),
+        ("GT", 17.4589, 78.6823, 22),
+        ("BN", 17.4744, 78.7902, 35),
+        ("BG", 17.5134, 78.8920, 50),
+        ("ALER", 17.6534, 79.0520, 75),
+        ("ZN", 17.7244, 79.1620, 95),
+        ("KZJ", 17.9784, 79.4890, 137),
+    ],
+}
+
+# Single-line stretches (km ranges) where opposing trains share one track.
+# Everything else is treated as double line (one track per direction).
+SINGLE_LINE_SECTIONS = {
+    "SC-KZJ": [(50.0, 95.0)], # BG - ALER - ZN
+}
+
+# (lat, lng, km) points, kept for callers that only need the polyline
+ROUTE_POINTS = [(lat, lng, km) for _, lat, lng, km in ROUTE_STATIONS[DEFAULT_ROUTE_ID]]
+MAX_ROUTE_KM = ROUTE_POINTS[-1][2]
+
+def route_length_km(route_id: str = DEFAULT_ROUTE_ID) -> float:
+    return ROUTE_STATIONS[route_id][-1][3]
+
+def section_name(km: float, route_id: str = DEFAULT_ROUTE_ID) -> str:
+    """Station-to-station section containing km, e.g. "SC-MJF"."""
+    stations = ROUTE_STATIONS[route_id]
+    for (code_a, _, _, km_a), (code_b, _, _, km_b) in zip(stations, stations[1:]):
+        if km_a <= km <= km_b:
+            return f"{code_a}-{code_b}"
+    return f"{stations[-2][0]}-{stations[-1][0]}"
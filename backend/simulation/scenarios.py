@@ -9,12 +9,22 @@ class WeatherCondition(str, Enum):
     FOG = "fog"
     STORM = "storm"
 
+class SimulationMode(str, Enum):
+    STEP = "step"   # fixed 10 s steps
+    EVENT = "event" # jump between discrete events (block / signal / arrival / maintenance)
+
+class MaintenanceWindow(BaseModel):
+    block_id: str
+    start_minute: float = Field(0, description="Minutes after the simulation start")
+    end_minute: float = Field(description="Minutes after the simulation start")
+
 class ScenarioModifier(BaseModel):
     train_delays: Dict[str, float] = Field(default_factory=dict, description="Train ID -> Added Delay in Minutes")
     block_maintenance: List[str] = Field(default_factory=list, description="List of Block IDs closed for maintenance")
     speed_limits: Dict[str, int] = Field(default_factory=dict, description="Block ID -> New Speed Limit")
     priorities: Dict[str, int] = Field(default_factory=dict, description="Train ID -> New Priority (1-5)")
     reroute_trains: List[str] = Field(default_factory=list, description="List of Train IDs to reroute via Loop Lines")
+    maintenance_windows: List[MaintenanceWindow] = Field(default_factory=list, description="Timed block closures")
     weather: WeatherCondition = WeatherCondition.CLEAR
 
 class ScenarioConfig(BaseModel):
@@ -22,6 +32,7 @@ class ScenarioConfig(BaseModel):
     modifiers: ScenarioModifier
     layout_name: str = "default"
     simulation_horizon_minutes: int = 60
+    mode: SimulationMode = SimulationMode.STEP
 
 class SimulationResult(BaseModel):
     scenario_id: str
@@ -30,3 +41,16 @@ class SimulationResult(BaseModel):
     block_utilization: Dict[str, float] = Field(description="Block ID -> % time occupied")
     max_delays: Dict[str, float] = Field(description="Train ID -> Max delay encountered")
     metrics: Dict[str, float] = Field(description="KPIs like avg_delay, throughput")
+
+class PairConflictProbability(BaseModel):
+    train_ids: List[str]
+    probability: float = Field(description="Share of realizations where the pair came within rear-end distance")
+
+class EnsembleResult(BaseModel):
+    scenario_id: str
+    realizations: int
+    delay_percentiles: Dict[str, Dict[str, float]] = Field(description="Train ID -> {p50, p90, ..., mean} delay minutes")
+    total_delay_percentiles: Dict[str, float] = Field(description="Percentiles of the summed delay over all trains")
+    conflict_probabilities: List[PairConflictProbability]
+    block_utilization: Dict[str, Dict[str, float]] = Field(description="Block ID -> {p10, p50, p90, mean} % time occupied")
+    metrics: Dict[str, float]
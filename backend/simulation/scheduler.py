@@ -0,0 +1,137 @@
+import asyncio
+from enum import Enum
+from pydantic import BaseModel
+
+# Drift-free tick scheduler for the live SimulationEngine.
+# Ticks are scheduled on absolute deadlines (epoch + n * period) so the time spent
+# on detection, ML and broadcasting does not accumulate into simulated-time drift.
+
+class CatchUpPolicy(str, Enum):
+    SKIP = "skip"          # Fold missed ticks into the next one (sim_dt grows)
+    CATCH_UP = "catch_up"  # Run missed ticks back-to-back (bounded)
+
+class Tick(BaseModel):
+    seq: int
+    sim_dt: float    # Simulated seconds covered by this tick
+    sim_time: float  # Simulated seconds since the scheduler started
+    lag: float       # Wall seconds behind the deadline when the tick started
+
+class ClockStats(BaseModel):
+    tick_interval: float
+    time_multiplier: float
+    fast_forward: bool
+    policy: CatchUpPolicy
+    ticks: int = 0
+    overruns: int = 0           # Ticks whose body took longer than the wall period
+    skipped_ticks: int = 0      # Missed deadlines folded into a later tick or dropped
+    last_tick_duration: float = 0.0
+    max_tick_duration: float = 0.0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    sim_time: float = 0.0
+
+class TickScheduler:
+    def __init__(self, tick_interval: float = 1.0, time_multiplier: float = 1.0,
+                 fast_forward: bool = False, policy: CatchUpPolicy = CatchUpPolicy.SKIP,
+                 max_catch_up_ticks: int = 5):
+        if tick_interval <= 0 or time_multiplier <= 0:
+            raise ValueError("tick_interval and time_multiplier must be positive")
+        self.tick_interval = tick_interval
+        self.time_multiplier = time_multiplier
+        self.fast_forward = fast_forward
+        self.policy = CatchUpPolicy(policy)
+        self.max_catch_up_ticks = max_catch_up_ticks
+        self.running = False
+        self.stats = self._new_stats()
+        self._epoch = None
+        self._slot = 0
+
+    @property
+    def period(self) -> float:
+        # Wall-clock seconds between ticks
+        return self.tick_interval / self.time_multiplier
+
+    def _new_stats(self) -> ClockStats:
+        return ClockStats(
+            tick_interval=self.tick_interval,
+            time_multiplier=self.time_multiplier,
+            fast_forward=self.fast_forward,
+            policy=self.policy,
+        )
+
+    def _rebase(self):
+        # Restart the deadline grid from "now" (used after a rate change)
+        if self._epoch is not None:
+            self._epoch = asyncio.get_running_loop().time()
+            self._slot = 0
+
+    def configure(self, time_multiplier: float = None, fast_forward: bool = None, policy: CatchUpPolicy = None):
+        if time_multiplier is not None:
+            if time_multiplier <= 0:
+                raise ValueError("time_multiplier must be positive")
+            self.time_multiplier = time_multiplier
+        if fast_forward is not None:
+            self.fast_forward = fast_forward
+        if policy is not None:
+            self.policy = CatchUpPolicy(policy)
+        self.stats.time_multiplier = self.time_multiplier
+        self.stats.fast_forward = self.fast_forward
+        self.stats.policy = self.policy
+        self._rebase()
+
+    async def ticks(self):
+        """Async iterator of Ticks; the loop body runs between yields."""
+        loop = asyncio.get_running_loop()
+        self.running = True
+        self._epoch = loop.time()
+        self._slot = 0
+        seq = 0
+
+        while self.running:
+            if self.fast_forward:
+                # Unthrottled: only yield to the event loop so I/O keeps flowing
+                await asyncio.sleep(0)
+                sim_dt, lag = self.tick_interval, 0.0
+                self._epoch = loop.time()
+                self._slot = 0
+            else:
+                deadline = self._epoch + self._slot * self.period
+                now = loop.time()
+                if now < deadline:
+                    await asyncio.sleep(deadline - now)
+                    now = loop.time()
+                lag = max(0.0, now - deadline)
+                behind = int(lag // self.period)
+
+                if behind and self.policy == CatchUpPolicy.SKIP:
+                    # Fold every missed tick into this one so sim time stays locked to wall time
+                    sim_dt = self.tick_interval * (1 + behind)
+                    self._slot += 1 + behind
+                    self.stats.skipped_ticks += behind
+                else:
+                    # Catch up one tick at a time; drop anything beyond the budget
+                    dropped = max(0, behind - self.max_catch_up_ticks)
+                    sim_dt = self.tick_interval
+                    self._slot += 1 + dropped
+                    self.stats.skipped_ticks += dropped
+
+            if not self.running:
+                break
+
+            self.stats.sim_time += sim_dt
+            self.stats.last_lag = lag
+            self.stats.max_lag = max(self.stats.max_lag, lag)
+            started = loop.time()
+
+            yield Tick(seq=seq, sim_dt=sim_dt, sim_time=self.stats.sim_time, lag=lag)
+
+            duration = loop.time() - started
+            seq += 1
+            self.stats.ticks = seq
+            self.stats.last_tick_duration = duration
+            self.stats.max_tick_duration = max(self.stats.max_tick_duration, duration)
+            if not self.fast_forward and duration > self.period:
+                self.stats.overruns += 1
+
+    def stop(self):
+        self.running = False
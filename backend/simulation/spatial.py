@@ -0,0 +1,92 @@
+import numpy as np
+from typing import List, Optional, Tuple
+from pydantic import BaseModel, Field, validator
+
+# Uniform grid index over live train positions, rebuilt once per tick with a single
+# argsort, so per-viewport queries only touch the occupied cells overlapping the
+# bounding box (never the empty ones, so a world-sized bbox costs the same).
+
+BBox = Tuple[float, float, float, float] # (south, west, north, east)
+
+class GridIndex:
+    def __init__(self, cell_deg: float = 0.05):
+        self.cell_deg = cell_deg
+        self.lat = np.empty(0)
+        self.lng = np.empty(0)
+        self._order = np.empty(0, dtype=np.int64)
+        self._cells = np.empty(0, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int64)
+        self._cols = np.empty(0, dtype=np.int64)
+        self._starts = np.empty(0, dtype=np.int64)
+        self._ends = np.empty(0, dtype=np.int64)
+
+    def _cell(self, lat, lng):
+        row = np.floor(np.asarray(lat) / self.cell_deg).astype(np.int64)
+        col = np.floor(np.asarray(lng) / self.cell_deg).astype(np.int64)
+        return row, col
+
+    @staticmethod
+    def _key(row, col):
+        # Pack (row, col) into one sortable int64 key
+        return (row << 32) + (col & 0xFFFFFFFF)
+
+    def rebuild(self, lat: np.ndarray, lng: np.ndarray):
+        self.lat = lat
+        self.lng = lng
+        keys = self._key(*self._cell(lat, lng))
+        self._order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[self._order]
+        self._cells, self._starts = np.unique(sorted_keys, return_index=True)
+        self._ends = np.append(self._starts[1:], len(sorted_keys))
+        # Occupied cells unpacked again, for range filtering in query()
+        self._rows = self._cells >> 32
+        self._cols = (self._cells & 0xFFFFFFFF).astype(np.int64)
+        self._cols[self._cols >= 1 << 31] -= 1 << 32
+
+    def query(self, bbox: BBox) -> np.ndarray:
+        """Indices of trains inside bbox, in ascending order."""
+        south, west, north, east = bbox
+        if not len(self._cells):
+            return np.empty(0, dtype=np.int64)
+        (r0, r1), (c0, c1) = self._cell([south, north], [west, east])
+        # Filter the occupied cells by row / col range: O(occupied cells), independent of bbox size
+        pos = np.flatnonzero((self._rows >= r0) & (self._rows <= r1) & (self._cols >= c0) & (self._cols <= c1))
+        if not len(pos):
+            return np.empty(0, dtype=np.int64)
+        candidates = np.concatenate([self._order[s:e] for s, e in zip(self._starts[pos], self._ends[pos])])
+
+        # Exact filter for trains in partially covered edge cells
+        lat, lng = self.lat[candidates], self.lng[candidates]
+        inside = (lat >= south) & (lat <= north) & (lng >= west) & (lng <= east)
+        return np.sort(candidates[inside])
+
+class Subscription(BaseModel):
+    bbox: Optional[BBox] = Field(default=None, description="(south, west, north, east) in degrees")
+    route_ids: List[str] = Field(default_factory=list)
+    train_ids: List[str] = Field(default_factory=list)
+
+    @validator("bbox")
+    def check_bbox(cls, bbox):
+        if bbox is None:
+            return bbox
+        south, west, north, east = bbox
+        if not (-90 <= south <= north <= 90):
+            raise ValueError("bbox latitudes must satisfy -90 <= south <= north <= 90")
+        if not (-180 <= west <= east <= 180):
+            raise ValueError("bbox longitudes must satisfy -180 <= west <= east <= 180")
+        return bbox
+
+    def key(self) -> str:
+        # Identical subscriptions share one Socket.IO room
+        bbox = "*" if self.bbox is None else ",".join(f"{v:.4f}" for v in self.bbox)
+        return f"{bbox}|{','.join(sorted(self.route_ids))}|{','.join(sorted(self.train_ids))}"
+
+    def select(self, index: GridIndex, ids: List[str], route_ids: List[str]) -> np.ndarray:
+        selected = index.query(self.bbox) if self.bbox is not None else np.arange(len(ids))
+        if self.route_ids:
+            routes = set(self.route_ids)
+            selected = selected[[route_ids[i] in routes for i in selected]] if len(selected) else selected
+        if self.train_ids:
+            wanted = set(self.train_ids)
+            selected = selected[[ids[i] in wanted for i in selected]] if len(selected) else selected
+        return selected
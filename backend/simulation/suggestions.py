@@ -1,55 +1,201 @@
-from typing import List
-from simulation.models import Train, Suggestion, Alert, AlertType
-import uuid
+import numpy as np
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from simulation.models import Train, Suggestion, Alert, AlertType, TrainStatus
+from simulation.train_table import WEATHER_CODES, STATUS_CODES, TrainTable, TrainView
+from simulation.alerts import SEVERITY_RANK
+
+# Rule engine for the AI Copilot.
+# Rules are registered per alert kind (or per train, for non-alert suggestions) with
+# the @alert_rule / @train_rule decorators, so new rules plug in without touching the
+# dispatcher. Suggestions are cached per alert identity: an alert whose severity is
+# unchanged keeps its suggestion object and ID (rules read the severity and trains,
+# not the per-tick message text), so generation work scales with alert changes, not
+# alert count, and clients see stable IDs.
+# Train rules may also give a vectorized `candidates` prefilter over the TrainTable
+# arrays; on the live table the rule then only sees (and builds models for) matches.
+
+class Rule:
+    def __init__(self, name: str, fn: Callable, min_severity: AlertType = AlertType.MAJOR, explain: str = None,
+                 candidates: Callable[[TrainTable], np.ndarray] = None):
+        self.name = name
+        self.fn = fn
+        self.min_severity = min_severity
+        self.explain = explain # ML model whose SHAP explanation backs the suggestion
+        self.candidates = candidates # table -> bool mask of trains the rule can fire for
+
+ALERT_RULES: Dict[str, List[Rule]] = {} # alert kind -> rules
+TRAIN_RULES: List[Rule] = []
+RULES: Dict[str, Rule] = {} # rule name -> rule
+
+def alert_rule(*kinds: str, min_severity: AlertType = AlertType.MAJOR, explain: str = None):
+    """Register fn(alert, trains_by_id) -> Optional[Suggestion] for the given alert kinds."""
+    def register(fn):
+        rule = Rule(fn.__name__, fn, min_severity, explain)
+        RULES[rule.name] = rule
+        for kind in kinds:
+            ALERT_RULES.setdefault(kind, []).append(rule)
+        return fn
+    return register
+
+def train_rule(explain: str = None, candidates: Callable[[TrainTable], np.ndarray] = None):
+    """Register fn(train) -> Optional[Suggestion], evaluated for every (candidate) train each tick."""
+    def register(fn):
+        rule = Rule(fn.__name__, fn, explain=explain, candidates=candidates)
+        RULES[rule.name] = rule
+        TRAIN_RULES.append(rule)
+        return fn
+    return register
+
+def _names(alert: Alert, trains: Dict[str, Train]) -> List[str]:
+    return [trains[tid].name if tid in trains else tid for tid in alert.train_ids]
+
+@alert_rule("rear-end", "head-on", explain="conflict")
+def emergency_stop(alert: Alert, trains: Dict[str, Train]) -> Optional[Suggestion]:
+    # Rear-end: the follower stops. Head-on: the eastbound train (first) stops.
+    names = _names(alert, trains)
+    return Suggestion(
+        id=f"emergency-stop-{alert.id}",
+        train_id=alert.train_ids[0],
+        action="EMERGENCY STOP",
+        reason=f"Imminent collision risk between {' and '.join(names)} detected by ML/Safety protocols.",
+        confidence=0.99,
+        predicted_effect="Prevents accident. Delay +10 mins.",
+        actions=["Emergency Stop", "Slow to 10km/h"],
+    )
+
+@alert_rule("overspeed")
+def apply_brakes(alert: Alert, trains: Dict[str, Train]) -> Optional[Suggestion]:
+    return Suggestion(
+        id=f"apply-brakes-{alert.id}",
+        train_id=alert.train_ids[0],
+        action="APPLY BRAKES",
+        reason="Train exceeds safety limits for this block.",
+        confidence=0.98,
+        predicted_effect="Speed normalized. Minor delay.",
+        actions=["Apply Brakes", "Coast"],
+    )
+
+@alert_rule("ml-conflict", explain="conflict")
+def reroute_to_loop(alert: Alert, trains: Dict[str, Train]) -> Optional[Suggestion]:
+    # Same thresholds as the ML alert severities (CRITICAL > 80%, MAJOR > 60%)
+    band = "80%+" if alert.type == AlertType.CRITICAL else "60%+"
+    return Suggestion(
+        id=f"reroute-to-loop-{alert.id}",
+        train_id=alert.train_ids[0],
+        action="REROUTE TO LOOP",
+        reason=f"ML Model predicts high conflict probability ({band}) between {' and '.join(_names(alert, trains))}.",
+        confidence=0.85,
+        predicted_effect="Avoids congestion. ETA impact: +5 mins.",
+        actions=["Reroute via Loop A", "Hold at Previous Station"],
+    )
+
+def _crawling_delayed(table: TrainTable) -> np.ndarray:
+    return (table.status == STATUS_CODES[TrainStatus.DELAYED]) & (table.speed > 0) & (table.speed < 40)
+
+@train_rule(explain="delay", candidates=_crawling_delayed)
+def priority_pass(train: Train) -> Optional[Suggestion]:
+    # General optimization: delayed trains still crawling forward
+    if train.status == TrainStatus.DELAYED and 0 < train.speed < 40:
+        return Suggestion(
+            id=f"priority-pass-{train.id}",
+            train_id=train.id,
+            action="PRIORITY PASS",
+            reason=f"Train {train.name} accumulating delay.",
+            confidence=0.75,
+            predicted_effect="Recovers 5 mins of schedule.",
+            actions=["Grant Signal Priority", "Skip minor stop"],
+        )
+    return None
+
+class SuggestionEngine:
+    def __init__(self):
+        # alert id -> (severity, suggestions)
+        self._by_alert: Dict[int, Tuple[AlertType, List[Suggestion]]] = {}
+        # (rule, train id) -> suggestion, so train suggestions keep their object too
+        self._by_train: Dict[Tuple[str, str], Suggestion] = {}
+        self.generated = 0
+        self.reused = 0
+
+    def _for_alert(self, alert: Alert, trains: Dict[str, Train]) -> List[Suggestion]:
+        fingerprint = alert.type
+        cached = self._by_alert.get(alert.id)
+        if cached is not None and cached[0] == fingerprint:
+            self.reused += len(cached[1])
+            return cached[1]
+
+        suggestions = []
+        for rule in ALERT_RULES.get(alert.kind, []):
+            if SEVERITY_RANK[alert.type] < SEVERITY_RANK[rule.min_severity] or not alert.train_ids:
+                continue
+            suggestion = rule.fn(alert, trains)
+            if suggestion is not None:
+                suggestions.append(suggestion.copy(update={"alert_id": alert.id, "rule": rule.name}))
+        self.generated += len(suggestions)
+        self._by_alert[alert.id] = (fingerprint, suggestions)
+        return suggestions
+
+    def generate(self, trains: Sequence[Train], alerts: List[Alert]) -> List[Suggestion]:
+        # A TrainView (live table) is indexed lazily; plain lists work as before
+        view = trains if isinstance(trains, TrainView) else None
+        trains_by_id = view.by_id if view is not None else {t.id: t for t in trains}
+        suggestions = []
+        for alert in alerts:
+            suggestions.extend(self._for_alert(alert, trains_by_id))
+        # Forget alerts that are gone
+        live = {a.id for a in alerts}
+        for key in [k for k in self._by_alert if k not in live]:
+            del self._by_alert[key]
+
+        by_train = {}
+        for rule in TRAIN_RULES:
+            if view is not None and rule.candidates is not None:
+                candidates = (trains[i] for i in np.flatnonzero(rule.candidates(view.table)).tolist())
+            else:
+                candidates = trains
+            for train in candidates:
+                suggestion = rule.fn(train)
+                if suggestion is None:
+                    continue
+                key = (rule.name, train.id)
+                cached = self._by_train.get(key)
+                if cached is not None and cached.reason == suggestion.reason:
+                    self.reused += 1
+                    suggestion = cached
+                else:
+                    self.generated += 1
+                    suggestion = suggestion.copy(update={"rule": rule.name})
+                by_train[key] = suggestion
+                suggestions.append(suggestion)
+        self._by_train = by_train
+        return suggestions
 
 def generate_suggestions(trains: List[Train], alerts: List[Alert]) -> List[Suggestion]:
-    suggestions = []
-    
-    for alert in alerts:
-        # CRITICAL / MAJOR handling
-        if alert.type in [AlertType.CRITICAL, AlertType.MAJOR]:
-            if "Collision" in alert.message:
-                suggestions.append(Suggestion(
-                    id=str(uuid.uuid4()),
-                    train_id="affected_train", # idealized, normally we parse IDs
-                    action="EMERGENCY STOP",
-                    reason="Imminent collision risk detected by ML/Safety protocols.",
-                    confidence=0.99,
-                    predicted_effect="Prevents accident. Delay +10 mins.",
-                    actions=["Emergency Stop", "Slow to 10km/h"]
-                ))
-            elif "Overspeed" in alert.message:
-                suggestions.append(Suggestion(
-                    id=str(uuid.uuid4()),
-                    train_id="overspeed_train",
-                    action="APPLY BRAKES",
-                    reason="Train exceeds safety limits for this block.",
-                    confidence=0.98,
-                    predicted_effect="Speed normalized. Minor delay.",
-                    actions=["Apply Brakes", "Coast"]
-                ))
-            elif "conflict probability" in alert.message:
-                suggestions.append(Suggestion(
-                    id=str(uuid.uuid4()),
-                    train_id="conflict_pair",
-                    action="REROUTE TO LOOP",
-                    reason=f"ML Model predicts high conflict probability ({'85%+' if 'High' in alert.message else '60%+'}).",
-                    confidence=0.85,
-                    predicted_effect="Avoids congestion. ETA impact: +5 mins.",
-                    actions=["Reroute via Loop A", "Hold at Previous Station"]
-                ))
-
-    # General Optimization Suggestions
-    for train in trains:
-        if train.status == "delayed" and train.speed < 40 and train.speed > 0:
-             suggestions.append(Suggestion(
-                id=str(uuid.uuid4()),
-                train_id=train.id,
-                action="PRIORITY PASS",
-                reason=f"Train {train.name} accumulating delay.",
-                confidence=0.75,
-                predicted_effect="Recovers 5 mins of schedule.",
-                actions=["Grant Signal Priority", "Skip minor stop"]
-            ))
-            
-    return suggestions
+    # Stateless entry point (IDs are still deterministic per alert / train)
+    return SuggestionEngine().generate(trains, alerts)
+
+def explanation_requests(suggestions: List[Suggestion], alerts: List[Alert], trains: Dict[str, Train],
+                         weather: str = "clear") -> List[Tuple[int, str, List[float]]]:
+    """
+    (suggestion index, model, feature row) for every suggestion whose rule is backed
+    by an ML model: conflict rules -> conflict model, delay recovery -> delay model.
+    """
+    alerts_by_id = {a.id: a for a in alerts}
+    requests = []
+    for i, suggestion in enumerate(suggestions):
+        rule = RULES.get(suggestion.rule)
+        if rule is None or rule.explain is None:
+            continue
+        alert: Optional[Alert] = alerts_by_id.get(suggestion.alert_id)
+        if rule.explain == "conflict" and alert is not None:
+            # [track_id, time_gap (min), opposite_dir]; current proximity alerts are imminent
+            time_gap = (alert.predicted_in_s or 0.0) / 60
+            opposite = 1.0 if alert.kind and "head-on" in alert.kind else 0.0
+            requests.append((i, "conflict", [1.0, time_gap, opposite]))
+        elif rule.explain == "delay" and suggestion.train_id in trains:
+            train = trains[suggestion.train_id]
+            # [weather_code, priority, current_delay]; freight runs at low priority
+            priority = 0.0 if train.id.startswith("GOODS") else 1.0
+            # Per-train delay is not tracked; delayed trains use the historical mean (~5 min)
+            delay = 0.0 if train.status == TrainStatus.ON_TIME else 5.0
+            requests.append((i, "delay", [float(WEATHER_CODES.get(weather, 0)), priority, delay]))
+    return requests
@@ -0,0 +1,195 @@
+import asyncio
+import copy
+import itertools
+import json
+import os
+import pickle
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import numpy as np
+from pydantic import BaseModel, Field
+from simulation.models import Train, Block, AlertType
+from simulation.routes import MAX_ROUTE_KM
+from simulation.scenarios import ScenarioConfig, SimulationResult
+from simulation.train_table import DIRECTION_SIGN
+from simulation.what_if_engine import WhatIfEngine, along_route
+
+# Scenario sweeps.
+# A sweep expands a base ScenarioConfig with parameter grids (cartesian product) and /
+# or an explicit list of variants, then fans the variants out over one process pool
+# shared by every sweep (SWEEP_WORKERS processes, whatever the clients ask for). Like
+# the what-if job pool it leaves a core free and its workers are niced, so a sweep
+# never outranks the live tick loop. A
+# sweep keeps at most `workers` variants in flight, so concurrent sweeps interleave
+# instead of one queueing hundreds of variants ahead of the others. The live state is
+# pickled once per sweep into an immutable snapshot; workers unpickle it on first use
+# and keep the last few by sweep key. Results stream back as they complete and are
+# ranked by the requested KPIs at the end.
+
+MAX_SWEEP_VARIANTS = 500
+SWEEP_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+SWEEP_WORKER_NICENESS = 10 # same as the what-if job pool
+KEEP_SNAPSHOTS = 4 # per worker process
+
+def _arrived(result: SimulationResult) -> int:
+    # Progress in the direction of travel: westbound trains finish at km 0
+    if not result.final_trains:
+        return 0
+    km = np.array([t.distance for t in result.final_trains], dtype=np.float64)
+    direction = np.array([DIRECTION_SIGN[t.direction] for t in result.final_trains])
+    return int(np.count_nonzero(along_route(km, direction) >= MAX_ROUTE_KM))
+
+# KPI name -> (function of the result, higher is better)
+KPIS = {
+    "total_delay": (lambda r: sum(r.max_delays.values()), False),
+    "max_delay": (lambda r: max(r.max_delays.values(), default=0.0), False),
+    "conflicts": (lambda r: len(r.predicted_conflicts), False),
+    "critical_conflicts": (lambda r: sum(a.type == AlertType.CRITICAL for a in r.predicted_conflicts), False),
+    "arrived": (_arrived, True),
+}
+
+class SweepRequest(BaseModel):
+    base: ScenarioConfig
+    grid: Dict[str, List[Any]] = Field(default_factory=dict, description="Dotted path (e.g. modifiers.weather) -> values")
+    variants: List[Dict[str, Any]] = Field(default_factory=list, description="Explicit overrides, dotted path -> value")
+    rank_by: List[str] = Field(default_factory=lambda: ["total_delay", "max_delay", "conflicts"])
+    include_results: bool = False # full SimulationResult per variant (large)
+    workers: Optional[int] = None # variants in flight at once, capped at SWEEP_WORKERS
+
+class SweepVariant(BaseModel):
+    index: int
+    name: str
+    overrides: Dict[str, Any]
+    config: ScenarioConfig
+
+def _set_path(data: dict, path: str, value: Any):
+    *parents, leaf = path.split(".")
+    for key in parents:
+        data = data.setdefault(key, {})
+        if not isinstance(data, dict):
+            raise ValueError(f"Cannot set {path}: {key} is not an object")
+    data[leaf] = value
+
+def expand_variants(request: SweepRequest) -> List[SweepVariant]:
+    """Grid combinations first (in grid order), then the explicit variants."""
+    paths = list(request.grid)
+    overrides = [dict(zip(paths, values)) for values in itertools.product(*request.grid.values())] if paths else []
+    overrides += request.variants
+    if not overrides:
+        overrides = [{}]
+    if len(overrides) > MAX_SWEEP_VARIANTS:
+        raise ValueError(f"Sweep has {len(overrides)} variants (limit {MAX_SWEEP_VARIANTS})")
+    for kpi in request.rank_by:
+        if kpi not in KPIS:
+            raise ValueError(f"Unknown KPI: {kpi} (expected one of {', '.join(KPIS)})")
+
+    base = request.base.dict()
+    variants = []
+    for i, override in enumerate(overrides):
+        data = copy.deepcopy(base)
+        for path, value in override.items():
+            _set_path(data, path, value)
+        label = ", ".join(f"{path}={value}" for path, value in override.items())
+        data["name"] = f"{request.base.name} [{label}]" if label else request.base.name
+        variants.append(SweepVariant(index=i, name=data["name"], overrides=override, config=ScenarioConfig(**data)))
+    return variants
+
+def kpis(result: SimulationResult) -> Dict[str, float]:
+    return {name: float(fn(result)) for name, (fn, _) in KPIS.items()}
+
+def rank(results: List[dict], rank_by: List[str]) -> List[dict]:
+    """Best first by the KPIs in order; failed variants last."""
+    def key(entry):
+        if "error" in entry:
+            return (1,)
+        return (0, *[-entry["kpis"][k] if KPIS[k][1] else entry["kpis"][k] for k in rank_by])
+    ranked = sorted(results, key=key)
+    for position, entry in enumerate(ranked, 1):
+        entry["rank"] = position
+    return ranked
+
+# --- Worker side ---
+def _init_sweep_worker(niceness: int):
+    try:
+        os.nice(niceness) # the live engine runs in the parent; yield the CPU to it
+    except (AttributeError, OSError):
+        pass
+
+_snapshots: "OrderedDict[str, Tuple[Dict[str, Train], Dict[str, Block]]]" = OrderedDict()
+
+def _snapshot(key: str, payload: bytes) -> Tuple[Dict[str, Train], Dict[str, Block]]:
+    snapshot = _snapshots.get(key)
+    if snapshot is None:
+        snapshot = _snapshots[key] = pickle.loads(payload)
+        while len(_snapshots) > KEEP_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    else:
+        _snapshots.move_to_end(key)
+    return snapshot
+
+def _run_variant(key: str, payload: bytes, config: ScenarioConfig, include_result: bool) -> dict:
+    trains, blocks = _snapshot(key, payload)
+    start = time.perf_counter()
+    engine = WhatIfEngine(trains, blocks) # copies, so the snapshot is never mutated
+    engine.apply_scenario(config)
+    result = engine.run(horizon_minutes=config.simulation_horizon_minutes)
+    entry = {"kpis": kpis(result), "elapsed_s": round(time.perf_counter() - start, 4)}
+    if include_result:
+        entry["result"] = json.loads(result.json()) # plain JSON types for the NDJSON stream
+    return entry
+
+# --- Event loop side ---
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _shared_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=SWEEP_WORKERS, initializer=_init_sweep_worker,
+                                    initargs=(SWEEP_WORKER_NICENESS,))
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+async def run_sweep(trains: Dict[str, Train], blocks: Dict[str, Block], variants: List[SweepVariant],
+                    include_results: bool = False, workers: Optional[int] = None) -> AsyncIterator[dict]:
+    """Yield one entry per variant, in completion order."""
+    # Immutable snapshot of the live state, taken (and pickled) once for the whole sweep
+    payload = pickle.dumps(({tid: t.copy() for tid, t in trains.items()},
+                            {bid: b.copy() for bid, b in blocks.items()}), protocol=pickle.HIGHEST_PROTOCOL)
+    key = uuid.uuid4().hex
+    workers = max(1, min(workers or SWEEP_WORKERS, SWEEP_WORKERS, len(variants)))
+    loop = asyncio.get_running_loop()
+    pool = _shared_pool()
+    queued = iter(variants)
+    futures: Dict[asyncio.Future, SweepVariant] = {}
+
+    def submit():
+        variant = next(queued, None)
+        if variant is not None:
+            futures[loop.run_in_executor(pool, _run_variant, key, payload, variant.config, include_results)] = variant
+
+    for _ in range(workers):
+        submit()
+    try:
+        while futures:
+            done, _ = await asyncio.wait(futures, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                variant = futures.pop(future)
+                submit()
+                entry = {"index": variant.index, "name": variant.name, "overrides": variant.overrides}
+                try:
+                    entry.update(future.result())
+                except Exception as e:
+                    entry["error"] = str(e)
+                yield entry
+    finally:
+        # Client gone or sweep finished: drop this sweep's variants that haven't started
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,173 @@
+import numpy as np
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterator, List, Optional
+from simulation.models import Train, TrainStatus, TrainDirection
+from simulation.geometry import get_geometry
+
+# Struct-of-arrays storage for the live train state.
+# The tick loop advances every train with a handful of NumPy operations;
+# pydantic Train models are only built at the API / serialization boundary.
+
+STATUSES = list(TrainStatus)
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+ON_TIME = STATUS_CODES[TrainStatus.ON_TIME]
+
+DIRECTION_SIGN = {TrainDirection.EASTBOUND: 1, TrainDirection.WESTBOUND: -1}
+
+WEATHER_FACTORS = {
+    "clear": 1.0,
+    "rain": 0.8,
+    "fog": 0.7,
+    "storm": 0.5,
+}
+
+# weather_code used by the delay model (historical_movements.csv: 0 clear, 1 rain, 2 severe)
+WEATHER_CODES = {
+    "clear": 0,
+    "rain": 1,
+    "fog": 2,
+    "storm": 2,
+}
+
+class TrainTable:
+    def __init__(self, trains: List[Train]):
+        self.ids: List[str] = [t.id for t in trains]
+        self.index: Dict[str, int] = {tid: i for i, tid in enumerate(self.ids)}
+
+        # Static / rarely changing attributes stay as Python lists
+        self.names: List[str] = [t.name for t in trains]
+        self.route_ids: List[str] = [t.route_id for t in trains]
+
+        # Hot attributes live in contiguous arrays
+        self.speed = np.array([t.speed for t in trains], dtype=np.float64)
+        self.distance = np.array([t.distance for t in trains], dtype=np.float64)
+        self.lat = np.array([t.lat for t in trains], dtype=np.float64)
+        self.lng = np.array([t.lng for t in trains], dtype=np.float64)
+        self.status = np.array([STATUS_CODES[t.status] for t in trains], dtype=np.int8)
+        self.direction = np.array([DIRECTION_SIGN[t.direction] for t in trains], dtype=np.int8)
+
+        # Trains grouped by route so positions are interpolated one route at a time
+        self.route_groups: Dict[str, np.ndarray] = {
+            route_id: np.array([i for i, r in enumerate(self.route_ids) if r == route_id], dtype=np.int64)
+            for route_id in set(self.route_ids)
+        }
+        self.eta_min = np.full(len(trains), np.nan) # refreshed by the ETA model each tick
+        self.next_station = np.zeros(len(trains), dtype=np.int64) # index into the route's stations
+        self.update_positions()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, train_id: str) -> bool:
+        return train_id in self.index
+
+    def effective_speed(self, weather_factor: float = 1.0) -> np.ndarray:
+        # DELAYED / STOPPED trains do not move
+        return np.where(self.status == ON_TIME, self.speed * weather_factor, 0.0)
+
+    def advance(self, weather_factor: float = 1.0, dt: float = 1.0):
+        """Move every train along its route by dt seconds of simulated time."""
+        eff = self.effective_speed(weather_factor)
+        # distance is chainage from the route origin; westbound trains run towards 0
+        self.distance += self.direction * (eff / 3600) * dt
+        self.update_positions(wrap=True)
+
+    def update_positions(self, wrap: bool = False):
+        for route_id, idx in self.route_groups.items():
+            geometry = get_geometry(route_id)
+            if wrap:
+                # Loop Simulation: trains that run off either end re-enter at the other
+                self.distance[idx] = np.mod(self.distance[idx], geometry.length_km)
+            lat, lng, seg = geometry.interpolate(self.distance[idx])
+            self.lat[idx] = lat
+            self.lng[idx] = lng
+            self.next_station[idx] = geometry.next_station(seg, self.direction[idx])
+
+    def remaining_km(self) -> np.ndarray:
+        # Distance left to the end of the route in the direction of travel
+        remaining = np.empty(len(self.ids))
+        for route_id, idx in self.route_groups.items():
+            length = get_geometry(route_id).length_km
+            remaining[idx] = np.where(self.direction[idx] > 0, length - self.distance[idx], self.distance[idx])
+        return remaining
+
+    def set_status(self, train_id: str, status: TrainStatus):
+        self.status[self.index[train_id]] = STATUS_CODES[status]
+
+    def set_speed(self, train_id: str, speed: float):
+        self.speed[self.index[train_id]] = speed
+
+    def model(self, i: int) -> Train:
+        return Train(
+            id=self.ids[i],
+            name=self.names[i],
+            speed=float(self.speed[i]),
+            distance=float(self.distance[i]),
+            lat=float(self.lat[i]),
+            lng=float(self.lng[i]),
+            status=STATUSES[self.status[i]],
+            direction=TrainDirection.EASTBOUND if self.direction[i] > 0 else TrainDirection.WESTBOUND,
+            route_id=self.route_ids[i],
+            next_station_id=get_geometry(self.route_ids[i]).codes[self.next_station[i]],
+            eta_minutes=None if np.isnan(self.eta_min[i]) else round(float(self.eta_min[i]), 1),
+        )
+
+    def get(self, train_id: str) -> Optional[Train]:
+        i = self.index.get(train_id)
+        return self.model(i) if i is not None else None
+
+    def to_models(self) -> List[Train]:
+        return [self.model(i) for i in range(len(self.ids))]
+
+    def view(self) -> "TrainView":
+        return TrainView(self)
+
+class TrainView(Sequence):
+    """
+    Lazy per-tick list of Train models over a TrainTable.
+    Indexing builds (and caches) only the models that are actually touched, so the
+    tick loop pays for the trains that appear in alerts, suggestions or JSON payloads,
+    not for the whole table. Take a new view after the table changes.
+    """
+    def __init__(self, table: TrainTable):
+        self.table = table
+        self._models: Dict[int, Train] = {}
+        self.by_id = _TrainsById(self)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def __getitem__(self, i) -> Train:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        model = self._models.get(i)
+        if model is None:
+            model = self._models[i] = self.table.model(i)
+        return model
+
+    def __iter__(self) -> Iterator[Train]:
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def built(self) -> int:
+        return len(self._models)
+
+class _TrainsById(Mapping):
+    # Dict[str, Train] interface over a TrainView
+    def __init__(self, view: TrainView):
+        self._view = view
+
+    def __getitem__(self, train_id: str) -> Train:
+        return self._view[self._view.table.index[train_id]]
+
+    def __contains__(self, train_id) -> bool:
+        return train_id in self._view.table.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._view.table.ids)
+
+    def __len__(self) -> int:
+        return len(self._view)
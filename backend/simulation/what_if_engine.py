@@ -1,24 +1,29 @@
-from typing import Dict, List, Optional
-import copy
-import logging
+from typing import Callable, Dict, List, Optional
+import numpy as np
 from datetime import datetime, timedelta
-from simulation.models import Train, Block, Alert, TrainStatus, Suggestion, AlertType
-from simulation.scenarios import ScenarioConfig, ScenarioModifier, SimulationResult, WeatherCondition
-from simulation.conflict_detector import check_rear_end, check_overspeed
-
-# Shared Constants (Should be in a config file ideally)
-MAX_ROUTE_KM = 137
-ROUTE_POINTS = [
-    (17.4334, 78.5044, 0),    # SC - 0km
-    (17.4497, 78.5262, 5),    # MJF
-    (17.4721, 78.5910, 12),   # CHZ
-    (17.4589, 78.6823, 22),   # GT
-    (17.4744, 78.7902, 35),   # BN
-    (17.5134, 78.8920, 50),   # BG
-    (17.6534, 79.0520, 75),   # ALER
-    (17.7244, 79.1620, 95),   # ZN
-    (17.9784, 79.4890, 137),  # KZJ
-]
+from simulation.models import Train, Block, Alert, TrainStatus, TrainDirection
+from simulation.scenarios import ScenarioConfig, SimulationResult, WeatherCondition, SimulationMode
+from simulation.conflict_detector import ConflictPairs, rear_end_alerts
+from simulation.blocks import BlockIndex
+from simulation.routes import MAX_ROUTE_KM
+from simulation.geometry import get_geometry
+from simulation.event_sim import EventSimulation, RED_GAP_KM, YELLOW_GAP_KM, YELLOW_SPEED_KMH
+
+WEATHER_SPEED_FACTORS = {
+    WeatherCondition.CLEAR: 1.0,
+    WeatherCondition.RAIN: 0.85,
+    WeatherCondition.FOG: 0.60,
+    WeatherCondition.STORM: 0.40,
+}
+
+def along_route(km, direction):
+    """
+    Chainage <-> distance covered towards the end of the route in the direction of
+    travel (eastbound runs to MAX_ROUTE_KM, westbound to km 0). Its own inverse.
+    The kernels run on this, so every train moves forward, signals look at the train
+    ahead in travel order and arrival is `>= MAX_ROUTE_KM`, like TrainTable.advance.
+    """
+    return np.where(direction > 0, km, MAX_ROUTE_KM - np.asarray(km))
 
 class WhatIfEngine:
     def __init__(self, current_trains: Dict[str, Train], current_blocks: Dict[str, Block]):
@@ -27,7 +32,8 @@ class WhatIfEngine:
         self.blocks = {bid: block.copy() for bid, block in current_blocks.items()}
         self.alerts: List[Alert] = []
         self.time_elapsed = 0 # seconds
-        self.block_utilization_counters = {bid: 0 for bid in self.blocks}
+        self.block_index = BlockIndex(list(self.blocks.values()))
+        self.block_utilization_counters = np.zeros(len(self.block_index), dtype=np.int64)
         self.total_steps = 0
         self.max_delays = {tid: 0.0 for tid in self.trains}
         self.etas = {tid: None for tid in self.trains} # Estimated Arrival Time (datetime string)
@@ -35,6 +41,12 @@ class WhatIfEngine:
         # Internal State for Logic
         self.rerouted_trains = set()
         self.train_priorities = {} # tid -> int
+        self.maintenance_windows = []
+        self.mode = SimulationMode.STEP
+        # Optional progress hook, called every `progress_every_min` simulated minutes
+        # with partial KPIs; an exception raised by the hook aborts the run
+        self.progress: Optional[Callable[[dict], None]] = None
+        self.progress_every_min = 5
 
     def apply_scenario(self, config: ScenarioConfig):
         mods = config.modifiers
@@ -42,16 +54,12 @@ class WhatIfEngine:
         # 0. Setup Priorities & Reroutes
         self.rerouted_trains = set(mods.reroute_trains)
         self.train_priorities = mods.priorities
+        self.maintenance_windows = list(mods.maintenance_windows)
+        self.mode = config.mode
 
         # 1. Apply Weather (Global Speed Impact)
-        speed_factor = 1.0
-        if mods.weather == WeatherCondition.RAIN:
-            speed_factor = 0.85
-        elif mods.weather == WeatherCondition.FOG:
-            speed_factor = 0.60
-        elif mods.weather == WeatherCondition.STORM:
-            speed_factor = 0.40
-            
+        speed_factor = WEATHER_SPEED_FACTORS.get(mods.weather, 1.0)
+
         # 2. Apply Custom Delays & Priorities
         for tid, train in self.trains.items():
             # Initial delays (Reduce speed temporarily or set status)
@@ -78,26 +86,22 @@ class WhatIfEngine:
                 block.speed_limit = mods.speed_limits[bid]
 
     def _get_block_for_km(self, km: float) -> Optional[Block]:
-        for block in self.blocks.values():
-            if block.start_km <= km <= block.end_km:
-                return block
-        return None
-
-    def _interpolate_position(self, train: Train):
-        for i in range(len(ROUTE_POINTS) - 1):
-            p1 = ROUTE_POINTS[i]
-            p2 = ROUTE_POINTS[i+1]
-            if p1[2] <= train.distance <= p2[2]:
-                segment_len = p2[2] - p1[2]
-                progress = (train.distance - p1[2]) / segment_len
-                train.lat = p1[0] + (p2[0] - p1[0]) * progress
-                train.lng = p1[1] + (p2[1] - p1[1]) * progress
-                break
+        return self.block_index.lookup(km)
+
+    def _interpolate_positions(self):
+        # One vectorized interpolation per route instead of a per-train loop every step
+        trains = list(self.trains.values())
+        for route_id in {t.route_id for t in trains}:
+            group = [t for t in trains if t.route_id == route_id]
+            lat, lng, _ = get_geometry(route_id).interpolate(np.array([t.distance for t in group]))
+            for train, train_lat, train_lng in zip(group, lat.tolist(), lng.tolist()):
+                train.lat = train_lat
+                train.lng = train_lng
                 
     def _calculate_eta(self, train: Train, current_sim_time: datetime) -> str:
         # Simple ETA: Distance Left / Current Speed
         # If speed is 0, return "Unknown" or heavily delayed
-        dist_left = MAX_ROUTE_KM - train.distance
+        dist_left = MAX_ROUTE_KM - train.distance if train.direction == TrainDirection.EASTBOUND else train.distance
         if dist_left <= 0:
             return current_sim_time.strftime("%H:%M:%S")
             
@@ -111,113 +115,206 @@ class WhatIfEngine:
         eta_time = current_sim_time + timedelta(hours=hours_left)
         return eta_time.strftime("%H:%M:%S")
 
+    def _signal_targets(self, base: np.ndarray, progress: np.ndarray, new_ahead: np.ndarray,
+                        signalled: np.ndarray) -> np.ndarray:
+        # Simulated signals from the gap to the train ahead (its progress after this step)
+        gap = new_ahead - progress
+        target = np.where(signalled & (gap < YELLOW_GAP_KM), np.minimum(base, YELLOW_SPEED_KMH), base) # YELLOW: slow approach
+        return np.where(signalled & (gap < RED_GAP_KM), 0.0, target)                                  # RED
+
+    def _window_arrays(self):
+        # Timed closures as (block position, start s, end s); unknown blocks are ignored
+        positions = {b.id: i for i, b in enumerate(self.block_index.blocks)}
+        windows = [(positions[w.block_id], w.start_minute * 60, w.end_minute * 60)
+                   for w in self.maintenance_windows if w.block_id in positions]
+        pos, start, end = zip(*windows) if windows else ((), (), ())
+        return np.array(pos, dtype=np.int64), np.array(start, dtype=np.float64), np.array(end, dtype=np.float64)
+
+    def _conflict_buckets(self, models: List[Train]):
+        # Rear-end pairs: one stable sort by (route, direction, km). Eastbound buckets
+        # come first within a route, matching ConflictDetector.sweep ordering
+        route_ids = [t.route_id for t in models]
+        route_names = sorted(set(route_ids))
+        route_code = np.array([route_names.index(r) for r in route_ids], dtype=np.int64)
+        direction = np.array([1 if t.direction == TrainDirection.EASTBOUND else -1 for t in models], dtype=np.int8)
+        return route_code * 2 + (direction < 0), direction
+
+    def _rear_end_conflicts(self, models: List[Train], bucket: np.ndarray, direction: np.ndarray,
+                            distance: np.ndarray) -> List[Alert]:
+        order = np.lexsort((distance, bucket))
+        same = bucket[order[1:]] == bucket[order[:-1]]
+        lo, hi = order[:-1][same], order[1:][same]
+        # Eastbound leaders are further along, westbound leaders closer to km 0
+        east = direction[lo] > 0
+        follower = np.where(east, lo, hi)
+        leader = np.where(east, hi, lo)
+        gap = np.abs(distance[leader] - distance[follower])
+        hits = (gap < 2.0) & (gap > 0)
+        if not hits.any():
+            return []
+        empty = np.empty(0, dtype=np.int64)
+        pairs = ConflictPairs(follower[hits], leader[hits], gap[hits], empty, empty, np.empty(0))
+        return rear_end_alerts(models, pairs)
+
+    def _report_progress(self, simulated_min: float, horizon_minutes: int, delay_min: np.ndarray):
+        if self.progress is None:
+            return
+        self.progress({
+            "simulated_min": round(simulated_min, 2),
+            "horizon_min": horizon_minutes,
+            "total_delay": float(delay_min.sum()),
+            "max_delay": float(delay_min.max(initial=0.0)),
+            "conflicts": len(self.alerts),
+        })
+
+    def _record_alerts(self, alerts: List[Alert], seen_messages: set):
+        for alert in alerts:
+            if alert.message not in seen_messages:
+                seen_messages.add(alert.message)
+                self.alerts.append(alert)
+
     def run(self, horizon_minutes: int = 60) -> SimulationResult:
+        if self.mode == SimulationMode.EVENT:
+            return EventSimulation(self).run(horizon_minutes)
+        return self._run_steps(horizon_minutes)
+
+    def _run_steps(self, horizon_minutes: int) -> SimulationResult:
         horizon_seconds = horizon_minutes * 60
         step_size = 10 
         steps = horizon_seconds // step_size
         self.total_steps = steps
         
         sim_start_time = datetime.now()
-        
-        # Sort trains by position (closest to destination first) for signal propagation
-        # We need to process trains from FRONT to BACK to handle rear-end stopping
-        
-        for _ in range(steps):
+
+        # Train state as arrays; the Train models are written back once at the end
+        models = list(self.trains.values())
+        ids = [t.id for t in models]
+        n = len(models)
+        bucket, direction = self._conflict_buckets(models)
+        distance = np.array([t.distance for t in models], dtype=np.float64)
+        progress = along_route(distance, direction)
+        speed = np.array([t.speed for t in models], dtype=np.float64)
+        stopped = np.array([t.status == TrainStatus.STOPPED for t in models], dtype=bool)
+        rerouted = np.array([tid in self.rerouted_trains for tid in ids], dtype=bool)
+        delay_min = np.array([self.max_delays.get(tid, 0.0) for tid in ids], dtype=np.float64)
+        finished_step = np.full(n, -1, dtype=np.int64) # step at which a train reached the end
+        ever_moved = ~stopped # trains STOPPED from the start never get an ETA
+
+        # Per-block caps (a trailing sentinel entry for "no block": no cap)
+        block_maintenance = np.array([b.status == "maintenance" for b in self.block_index.blocks] + [False])
+        block_limit = np.array([b.speed_limit for b in self.block_index.blocks] + [np.inf], dtype=np.float64)
+        block_pos = self.block_index.lookup_many(distance)
+        n_blocks = len(self.block_index)
+        occupied_steps = np.zeros(n_blocks + 1, dtype=np.int64) # last entry: outside every block
+        window_pos, window_start, window_end = self._window_arrays()
+
+        seen_messages = {a.message for a in self.alerts}
+        target = np.where(stopped, 0.0, speed) # warm start for the signal fixed point
+        positions_changed = True
+        progress_steps = max(1, int(self.progress_every_min * 60 // step_size))
+
+        for step in range(steps):
+            closed = block_maintenance
+            if len(window_pos):
+                t = step * step_size
+                closed = block_maintenance.copy()
+                closed[window_pos[(window_start <= t) & (t < window_end)]] = True
             self.time_elapsed += step_size
-            curr_time = sim_start_time + timedelta(seconds=self.time_elapsed)
-            
+            active = ~stopped
+
             # --- DELAY PROPAGATION LOGIC ---
-            # Sort trains by distance descending (Highest distance = closest to KZJ)
-            sorted_trains = sorted(self.trains.values(), key=lambda t: t.distance, reverse=True)
-            
-            for i, train in enumerate(sorted_trains):
-                if train.status == TrainStatus.STOPPED:
-                    continue
-                    
-                # 1. Check Train Ahead (if not rerouted)
-                # If I am NOT rerouted, I must respect train ahead
-                # If I am rerouted (loop line), I can arguably overtake (ignore train ahead close proximity)
-                
-                target_speed = train.speed
-                
-                # Check block limit
-                current_block = self._get_block_for_km(train.distance)
-                if current_block:
-                    if current_block.status == "maintenance" and train.id not in self.rerouted_trains:
-                         target_speed = 0 # Blocked
-                    else:
-                        target_speed = min(target_speed, current_block.speed_limit)
-
-                # Check Rear-End Safety (Simulated Signal)
-                # Look at immediate train ahead
-                if i > 0: # Because sorted desc, i-1 is AHEAD of i ?? 
-                    # WAIT. Sorted Descending: 
-                    # Index 0: 100km (Front)
-                    # Index 1: 90km (Behind)
-                    # So train ahead of 'train' is sorted_trains[i-1]
-                    
-                    train_ahead = sorted_trains[i-1]
-                    
-                    # If either is rerouted, ignore conflict (assume separate tracks)
-                    if train.id not in self.rerouted_trains and train_ahead.id not in self.rerouted_trains:
-                        gap = train_ahead.distance - train.distance
-                        if gap < 2.0: # < 2km Danger checks
-                             # RED SIGNAL
-                             target_speed = 0
-                        elif gap < 5.0:
-                             # YELLOW SIGNAL
-                             target_speed = min(target_speed, 30) # Slow approach
-                
-                # Update Distance
-                dist_change = (target_speed / 3600.0) * step_size
-                train.distance += dist_change
-                
-                # Metrics
-                if target_speed < 1 and train.distance < MAX_ROUTE_KM:
-                     self.max_delays[train.id] = self.max_delays.get(train.id, 0) + (step_size/60.0)
-
-                # Loop Logic
-                if train.distance > MAX_ROUTE_KM:
-                    train.distance = MAX_ROUTE_KM # Stop at destination for this sim or loop?
-                    # Let's say it stays at MAX_KM (Finished)
-                    train.status = TrainStatus.STOPPED
-                    train.speed = 0
-
-                # Interpolate
-                self._interpolate_position(train)
-                
-                # Update final ETA constantly
-                self.etas[train.id] = self._calculate_eta(train, curr_time)
-
-            # Check Conflicts (for recording)
-            new_alerts = check_rear_end(list(self.trains.values()))
-            # Filter rerouted conflicts
-            filtered_alerts = []
-            for a in new_alerts:
-                # Parse checking names is hard, let's rely on conflict detector returning IDs if possible
-                # But current detector returns formatted string.
-                # For now, just add them.
-                if not any(exist.message == a.message for exist in self.alerts):
-                    self.alerts.append(a)
-
-            # Check Utilization
-            for train in self.trains.values():
-                blk = self._get_block_for_km(train.distance)
-                if blk:
-                    self.block_utilization_counters[blk.id] += 1
-        
+            # Per (route, direction): front to back, furthest along first; ties keep insertion order
+            order = np.lexsort((-progress, bucket))
+            same = bucket[order[1:]] == bucket[order[:-1]]
+            ahead = np.zeros(n, dtype=np.int64)
+            ahead[order[1:][same]] = order[:-1][same]
+            has_ahead = np.zeros(n, dtype=bool)
+            has_ahead[order[1:][same]] = True
+            # If either train is rerouted (loop line), ignore the train ahead
+            signalled = has_ahead & ~rerouted & ~rerouted[ahead]
+
+            # Block limit: maintenance stops non-rerouted trains, otherwise cap at the limit
+            blocked = closed[block_pos] & ~rerouted
+            base = np.where(blocked, 0.0, np.minimum(speed, block_limit[block_pos]))
+
+            # Each train reacts to where the train ahead ends up this step. Iterate to the
+            # fixed point (exact: information moves at least one train back per pass);
+            # starting from last step's targets it usually holds after one pass
+            new_progress = np.where(active, progress + np.minimum(target, base) / 3600.0 * step_size, progress)
+            for _ in range(n + 1):
+                clamped = np.minimum(new_progress, MAX_ROUTE_KM)
+                target = self._signal_targets(base, progress, clamped[ahead], signalled)
+                updated = np.where(active, progress + target / 3600.0 * step_size, progress)
+                if np.array_equal(updated, new_progress):
+                    break
+                new_progress = updated
+
+            # Metrics
+            delayed = active & (target < 1) & (new_progress < MAX_ROUTE_KM)
+            delay_min += np.where(delayed, step_size / 60.0, 0.0)
+
+            # Trains reaching the end stop there (finished)
+            done = active & (new_progress > MAX_ROUTE_KM)
+            new_progress[done] = MAX_ROUTE_KM
+            stopped |= done
+            speed[done] = 0
+            finished_step[done] = step
+            moved = new_progress != progress
+            positions_changed = positions_changed or moved.any()
+            # Chainage of trains that did not move stays exact (no round trip)
+            distance = np.where(moved, along_route(new_progress, direction), distance)
+            progress = new_progress
+
+            # Check Conflicts (for recording). Unchanged positions give the same messages
+            if positions_changed:
+                positions_changed = False
+                self._record_alerts(self._rear_end_conflicts(models, bucket, direction, distance), seen_messages)
+
+            # Utilization: the same lookup drives next step's block caps
+            block_pos = self.block_index.lookup_many(distance)
+            occupied_steps += np.bincount(np.where(block_pos >= 0, block_pos, n_blocks), minlength=n_blocks + 1)
+
+            if (step + 1) % progress_steps == 0:
+                self._report_progress((step + 1) * step_size / 60, horizon_minutes, delay_min)
+
+        self.block_utilization_counters += occupied_steps[:n_blocks]
+
+        arrived_s = np.where(finished_step >= 0, (finished_step + 1) * step_size, -1)
+        return self._finish(models, distance, speed, stopped, delay_min, arrived_s, ever_moved,
+                            self.block_utilization_counters * step_size, horizon_minutes, sim_start_time)
+
+    def _finish(self, models: List[Train], distance: np.ndarray, speed: np.ndarray, stopped: np.ndarray,
+                delay_min: np.ndarray, arrived_s: np.ndarray, ever_moved: np.ndarray, occupied_s: np.ndarray,
+                horizon_minutes: int, sim_start_time: datetime, metrics: Dict[str, float] = None) -> SimulationResult:
+        horizon_seconds = horizon_minutes * 60
+
+        # Write the state back into the Train models
+        for i, train in enumerate(models):
+            train.distance = float(distance[i])
+            train.speed = float(speed[i])
+            if stopped[i]:
+                train.status = TrainStatus.STOPPED
+            self.max_delays[train.id] = float(delay_min[i])
+
+        # ETA once at the end (finished trains: when they arrived)
+        if self.time_elapsed:
+            final_time = sim_start_time + timedelta(seconds=self.time_elapsed)
+            for i, train in enumerate(models):
+                if arrived_s[i] >= 0:
+                    arrived = sim_start_time + timedelta(seconds=float(arrived_s[i]))
+                    self.etas[train.id] = arrived.strftime("%H:%M:%S")
+                elif ever_moved[i]:
+                    self.etas[train.id] = self._calculate_eta(train, final_time)
+
+        # Positions only matter in the result; interpolate once at the end
+        self._interpolate_positions()
+
         # Compile Results
         utilization_pct = {
-            bid: (count * step_size / horizon_seconds) * 100 
-            for bid, count in self.block_utilization_counters.items()
+            block.id: (float(seconds) / horizon_seconds) * 100 if horizon_seconds else 0.0
+            for block, seconds in zip(self.block_index.blocks, occupied_s)
         }
-        
-        # Build Trajectory (sampled every minute to reduce size, step_size is 10s)
-        # We collected snapshots during the loop in a real implementation.
-        # Since I didn't add the collection list in __init__ or loop, I need to add it now.
-        # WAIT: I can't easily add it to the loop with replace_file_content if I don't target the loop.
-        # I will use multi_replace to add init var and collection logic.
-        
+
         return SimulationResult(
             scenario_id="sim_" + str(int(self.time_elapsed)),
             final_trains=list(self.trains.values()),
@@ -226,6 +323,7 @@ class WhatIfEngine:
             max_delays=self.max_delays,
             metrics={
                 "duration_simulated_min": horizon_minutes,
+                **(metrics or {}),
             }
         )
 
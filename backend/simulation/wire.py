@@ -0,0 +1,119 @@
+import struct
+import numpy as np
+from typing import List, Optional
+from simulation.models import Alert, AlertType, Suggestion
+from simulation.train_table import TrainTable, STATUSES
+from simulation.geometry import get_geometry
+
+# Compact binary wire format for the live train state ("packed" protocol).
+#
+# Frame = header + N fixed-size little-endian records, built straight from the
+# TrainTable arrays (no pydantic models on this path):
+#   header:  magic b"RNP2", uint32 seq, uint16 record count
+#   record:  uint16 idx          -> index into the session string table (train_table event)
+#            int32  lat, lng     -> micro-degrees (~0.1 m)
+#            uint16 speed        -> 0.1 km/h
+#            uint32 distance     -> metres
+#            uint8  status       -> index into TRAIN_STATUS_CODES
+#            int8   direction    -> +1 eastbound / -1 westbound
+#            uint16 eta          -> 0.1 min to the end of the route, ETA_UNKNOWN if none
+#            uint16 next_station -> index into the string table's station_codes[route_id]
+# Alerts and suggestions are small and sent as positional lists with enum codes,
+# carrying every field of the full protocol (ALERT_FIELDS / SUGGESTION_FIELDS order).
+# RNP1 (no eta / next_station, short alert and suggestion lists) is no longer sent.
+
+MAGIC = b"RNP2"
+HEADER = struct.Struct("<4sIH")
+
+TRAIN_RECORD = np.dtype([
+    ("idx", "<u2"),
+    ("lat", "<i4"),
+    ("lng", "<i4"),
+    ("speed", "<u2"),
+    ("distance", "<u4"),
+    ("status", "u1"),
+    ("direction", "i1"),
+    ("eta", "<u2"),
+    ("next_station", "<u2"),
+])
+
+COORD_SCALE = 1e6
+SPEED_SCALE = 10.0
+DISTANCE_SCALE = 1000.0
+ETA_SCALE = 10.0
+ETA_UNKNOWN = 0xFFFF
+
+ALERT_FIELDS = ["id", "type", "message", "time", "kind", "train_ids", "predicted_in_s", "location_km", "stale"]
+SUGGESTION_FIELDS = ["id", "train_id", "action", "reason", "confidence", "predicted_effect", "actions",
+                     "alert_id", "rule", "explanation"]
+
+TRAIN_STATUS_CODES = [s.value for s in STATUSES]
+ALERT_TYPES = list(AlertType)
+ALERT_TYPE_CODES = {t: code for code, t in enumerate(ALERT_TYPES)}
+
+def string_table(table: TrainTable) -> dict:
+    """Sent once per session (and whenever the train set changes)."""
+    return {
+        "ids": list(table.ids),
+        "names": list(table.names),
+        "route_ids": list(table.route_ids),
+        "station_codes": {route_id: list(get_geometry(route_id).codes) for route_id in sorted(set(table.route_ids))},
+        "status_codes": TRAIN_STATUS_CODES,
+        "alert_type_codes": [t.value for t in ALERT_TYPES],
+        "alert_fields": ALERT_FIELDS,
+        "suggestion_fields": SUGGESTION_FIELDS,
+    }
+
+def pack_trains(table: TrainTable, seq: int, idx: Optional[np.ndarray] = None) -> bytes:
+    # idx selects a subset of trains (viewport subscriptions); records keep table indices
+    if idx is None:
+        idx = np.arange(len(table))
+    records = np.empty(len(idx), dtype=TRAIN_RECORD)
+    records["idx"] = idx
+    records["lat"] = np.rint(table.lat[idx] * COORD_SCALE)
+    records["lng"] = np.rint(table.lng[idx] * COORD_SCALE)
+    records["speed"] = np.rint(np.clip(table.speed[idx], 0, 6553.5) * SPEED_SCALE)
+    records["distance"] = np.rint(np.clip(table.distance[idx], 0, None) * DISTANCE_SCALE)
+    records["status"] = table.status[idx]
+    records["direction"] = table.direction[idx]
+    eta = table.eta_min[idx]
+    records["eta"] = np.where(np.isnan(eta), ETA_UNKNOWN, np.rint(np.clip(np.nan_to_num(eta), 0, 6553.4) * ETA_SCALE))
+    records["next_station"] = table.next_station[idx]
+    return HEADER.pack(MAGIC, seq & 0xFFFFFFFF, len(idx)) + records.tobytes()
+
+def unpack_trains(buf: bytes) -> dict:
+    """Reference decoder (mirrors what a dashboard client does)."""
+    magic, seq, count = HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError("Not a packed train frame")
+    records = np.frombuffer(buf, dtype=TRAIN_RECORD, count=count, offset=HEADER.size)
+    return {
+        "seq": seq,
+        "idx": records["idx"].astype(np.int64),
+        "lat": records["lat"] / COORD_SCALE,
+        "lng": records["lng"] / COORD_SCALE,
+        "speed": records["speed"] / SPEED_SCALE,
+        "distance": records["distance"] / DISTANCE_SCALE,
+        "status": records["status"].astype(np.int64),
+        "direction": records["direction"].astype(np.int64),
+        "eta": np.where(records["eta"] == ETA_UNKNOWN, np.nan, records["eta"] / ETA_SCALE),
+        "next_station": records["next_station"].astype(np.int64),
+    }
+
+def pack_alerts(alerts: List[Alert]) -> list:
+    return [[a.id, ALERT_TYPE_CODES[a.type], a.message, a.time, a.kind, a.train_ids, a.predicted_in_s, a.location_km,
+             a.stale] for a in alerts]
+
+def pack_suggestions(suggestions: List[Suggestion]) -> list:
+    return [[s.id, s.train_id, s.action, s.reason, round(s.confidence, 2), s.predicted_effect, s.actions, s.alert_id,
+             s.rule, s.explanation] for s in suggestions]
+
+def pack_state(table: TrainTable, alerts: List[Alert], suggestions: List[Suggestion], seq: int, weather: str,
+               idx: Optional[np.ndarray] = None) -> dict:
+    return {
+        "seq": seq,
+        "trains": pack_trains(table, seq, idx),
+        "alerts": pack_alerts(alerts),
+        "suggestions": pack_suggestions(suggestions),
+        "weather": weather,
+    }
@@ -0,0 +1,19 @@
+import os
+import sys
+
+# Tests import modules the way the app does, with backend/ as the root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+@pytest.fixture
+def write_tree():
+    """Writes a single-leaf tree ensemble (ml/export_trees.py layout): predicts 1 + 0.5 * leaf."""
+    def write(models_dir, name="delay_gb", leaf=4.0):
+        os.makedirs(models_dir, exist_ok=True)
+        np.savez(os.path.join(models_dir, f"{name}.npz"), kind="regressor", base=np.float64(1.0),
+                 scale=np.float64(0.5), n_features=np.int64(3), feature=np.array([-2], dtype=np.int32),
+                 threshold=np.array([-2.0]), left=np.array([-1]), right=np.array([-1]), value=np.array([leaf]),
+                 roots=np.array([0]), max_depth=np.int64(0))
+    return write
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+from simulation.alerts import AlertStore, alert_id
+from simulation.engine import SimulationEngine
+from simulation.models import Alert, AlertType
+
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+
+def _rear_end(gap_km: float) -> Alert:
+    return Alert(
+        id=alert_id("rear-end", ["A", "B"]),
+        type=AlertType.CRITICAL if gap_km < 1.0 else AlertType.MAJOR,
+        message=f"too close ({gap_km}km)",
+        time="12:00:00",
+        kind="rear-end",
+        train_ids=["A", "B"],
+    )
+
+def _ticks(store, detections):
+    # One update per tick; returns the event names per tick
+    return [[e.event for e in store.update(alerts, now=T0 + timedelta(seconds=i))]
+            for i, alerts in enumerate(detections)]
+
+def test_alert_id_is_stable_and_distinct():
+    assert alert_id("rear-end", ["A", "B"]) == alert_id("rear-end", ["A", "B"])
+    assert alert_id("rear-end", ["A", "B"]) != alert_id("rear-end", ["B", "A"])
+    assert alert_id("predicted-rear-end", ["A", "B"], "BG-ALER") != alert_id("predicted-rear-end", ["A", "B"])
+
+def test_hysteresis_raise_and_clear():
+    store = AlertStore(raise_after=2, clear_after=3)
+    alert = _rear_end(1.9)
+    assert _ticks(store, [[alert], [alert], [alert], [], [], []]) == [[], ["raised"], [], [], [], ["cleared"]]
+    assert store.active() == []
+
+def test_flicker_below_raise_after_is_silent():
+    store = AlertStore(raise_after=2)
+    assert _ticks(store, [[_rear_end(1.9)], [], [_rear_end(1.9)], []]) == [[], [], [], []]
+
+def test_critical_raises_immediately():
+    store = AlertStore(raise_after=5)
+    assert _ticks(store, [[_rear_end(0.5)]]) == [["raised"]]
+
+def test_severity_and_message_follow_detection_both_ways():
+    store = AlertStore(raise_after=1)
+    events = [store.update([_rear_end(gap)], now=T0 + timedelta(seconds=i)) for i, gap in enumerate([1.9, 0.5, 1.9, 1.5])]
+    assert [[e.event for e in tick] for tick in events] == [["raised"], ["updated"], ["updated"], []]
+    assert (events[1][0].previous_type, events[1][0].alert.type) == (AlertType.MAJOR, AlertType.CRITICAL)
+    assert (events[2][0].previous_type, events[2][0].alert.type) == (AlertType.CRITICAL, AlertType.MAJOR)
+    # De-escalated and refreshed: not stuck on the critical message
+    [active] = store.active()
+    assert (active.type, active.message) == (AlertType.MAJOR, "too close (1.5km)")
+    assert store.history()[0]["first_seen"] == T0.isoformat(timespec="seconds")
+
+class FlakyDB:
+    def __init__(self):
+        self.attempts = []
+
+    async def log_conflict(self, log):
+        self.attempts.append(log.event)
+        if len(self.attempts) == 1:
+            raise RuntimeError("database unavailable")
+
+def test_persistence_failure_does_not_drop_remaining_events():
+    db = FlakyDB()
+    engine = SimulationEngine(sio=None, db_service=db)
+    store = AlertStore(raise_after=1, clear_after=1)
+    events = store.update([_rear_end(1.9)]) + store.update([_rear_end(0.5)]) + store.update([])
+
+    async def main():
+        await engine._publish_alert_events(events)
+        assert len(engine._background) == 1
+        await asyncio.gather(*engine._background)
+
+    asyncio.run(main())
+    assert db.attempts == ["raised", "updated", "cleared"]
+    assert not engine._background
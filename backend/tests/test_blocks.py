@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from simulation.blocks import BlockIndex
+from simulation.models import Block, BlockStatus
+
+def _blocks():
+    # Gap between 20 and 25 km; given out of order
+    return [
+        Block(id="C", section="s", start_km=25.0, end_km=40.0, status=BlockStatus.MAINTENANCE),
+        Block(id="A", section="s", start_km=0.0, end_km=10.0, status=BlockStatus.FREE),
+        Block(id="B", section="s", start_km=10.0, end_km=20.0, status=BlockStatus.FREE),
+    ]
+
+def test_lookup_boundaries_and_gaps():
+    index = BlockIndex(_blocks())
+    assert [b.id for b in index.blocks] == ["A", "B", "C"]
+    cases = {0.0: "A", 5.0: "A", 10.0: "A", 10.001: "B", 20.0: "B", 22.0: None, 25.0: "C", 40.0: "C",
+             40.5: None, -1.0: None}
+    for km, expected in cases.items():
+        block = index.lookup(km)
+        assert (block.id if block else None) == expected, km
+    kms = np.array(list(cases))
+    assert index.lookup_many(kms).tolist() == [index.position(km) for km in cases]
+
+def test_empty_index_and_overlaps():
+    assert BlockIndex([]).lookup_many(np.array([1.0, 2.0])).tolist() == [-1, -1]
+    with pytest.raises(ValueError):
+        BlockIndex([Block(id="A", section="s", start_km=0.0, end_km=10.0, status=BlockStatus.FREE),
+                    Block(id="B", section="s", start_km=9.0, end_km=20.0, status=BlockStatus.FREE)])
+
+def test_incremental_occupancy():
+    index = BlockIndex(_blocks())
+    blocks = index.by_id
+    assert index.update_occupancy(["T1", "T2"], np.array([5.0, 7.0])) == ["A"]
+    assert blocks["A"].status == BlockStatus.OCCUPIED and blocks["A"].active_train_id == "T1"
+
+    # Only trains that crossed a boundary touch blocks
+    assert index.update_occupancy(["T1", "T2"], np.array([6.0, 8.0])) == []
+    assert index.update_occupancy(["T1", "T2"], np.array([12.0, 9.0])) == ["A", "B"]
+    assert blocks["A"].active_train_id == "T2" and blocks["B"].active_train_id == "T1"
+
+    # Into the gap and into a maintenance block: the block keeps its maintenance status
+    assert index.update_occupancy(["T1", "T2"], np.array([22.0, 30.0])) == ["A", "B", "C"]
+    assert blocks["A"].status == blocks["B"].status == BlockStatus.FREE
+    assert blocks["C"].status == BlockStatus.MAINTENANCE and index.occupants == {2: ["T2"]}
+
+def test_train_set_change_rebuilds_occupancy():
+    index = BlockIndex(_blocks())
+    index.update_occupancy(["T1", "T2"], np.array([5.0, 15.0]))
+    assert index.update_occupancy(["T3"], np.array([6.0])) == ["A", "B"]
+    assert index.occupants == {0: ["T3"]}
+    assert index.by_id["A"].active_train_id == "T3" and index.by_id["B"].status == BlockStatus.FREE
+
+def test_from_csv_spans_the_route():
+    index = BlockIndex.from_csv()
+    assert len(index) > 0 and index.starts[0] == 0.0
+    assert np.allclose(index.starts[1:], index.ends[:-1], atol=1e-3)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from simulation.models import Train, TrainStatus, TrainDirection, AlertType
+from simulation.conflict_detector import (
+    ConflictDetector, rear_end_alerts, head_on_alerts, predict_conflicts, predicted_alerts,
+)
+
+EB, WB = TrainDirection.EASTBOUND, TrainDirection.WESTBOUND
+
+def _trains(*specs):
+    # (distance, speed, direction)
+    return [Train(id=f"T{i}", name=f"Train {i}", speed=speed, distance=d, lat=0.0, lng=0.0,
+                  status=TrainStatus.ON_TIME, direction=direction)
+            for i, (d, speed, direction) in enumerate(specs)]
+
+def _sweep(trains, single_line=None):
+    route_ids = [t.route_id for t in trains]
+    direction = np.array([1 if t.direction == EB else -1 for t in trains], dtype=np.int8)
+    distance = np.array([t.distance for t in trains])
+    speed = np.array([t.speed for t in trains])
+    detector = ConflictDetector(single_line_sections=single_line)
+    return detector.sweep(route_ids, direction, distance), speed, direction, distance
+
+def test_rear_end_pairs_are_direction_aware():
+    # Eastbound T0 behind T1; westbound T3 behind T2 (westbound runs towards km 0)
+    trains = _trains((10.0, 80, EB), (11.5, 60, EB), (40.0, 80, WB), (40.5, 60, WB))
+    pairs, *_ = _sweep(trains, single_line={})
+    alerts = rear_end_alerts(trains, pairs)
+    assert sorted(a.train_ids for a in alerts) == [["T0", "T1"], ["T3", "T2"]]
+    assert {a.type for a in alerts} == {AlertType.MAJOR, AlertType.CRITICAL}
+
+def test_head_on_only_on_single_line_and_closing():
+    trains = _trains((60.0, 80, EB), (63.0, 80, WB), (10.0, 80, EB), (12.0, 80, WB), (70.0, 80, EB))
+    pairs, *_ = _sweep(trains, single_line={"SC-KZJ": [(50.0, 95.0)]})
+    # T2 / T3 are on double line; T4 has passed T1 (opening)
+    assert [a.train_ids for a in head_on_alerts(trains, pairs)] == [["T0", "T1"]]
+
+def test_stable_order_across_overtakes():
+    detector = ConflictDetector(single_line_sections={})
+    direction = np.ones(3, dtype=np.int8)
+    route_ids = ["SC-KZJ"] * 3
+    detector.sweep(route_ids, direction, np.array([1.0, 5.0, 9.0]))
+    pairs = detector.sweep(route_ids, direction, np.array([6.0, 5.0, 9.0]))
+    assert sorted(zip(pairs.follower.tolist(), pairs.leader.tolist())) == [(0, 2), (1, 0)]
+
+def _forecast(gap_km, follower_kmh, leader_kmh, horizon_s=600.0):
+    trains = _trains((10.0, follower_kmh, EB), (10.0 + gap_km, leader_kmh, EB))
+    pairs, speed, direction, distance = _sweep(trains, single_line={})
+    return trains, pairs, predict_conflicts(pairs, speed, direction, distance, horizon_s=horizon_s)
+
+def test_predicts_closing_pair_outside_braking_margin():
+    _, _, forecast = _forecast(3.5, 110, 40)
+    assert forecast.kind.tolist() == ["rear-end"]
+    assert forecast.time_s[0] == pytest.approx(29.1, abs=0.1)
+
+def test_closing_pair_inside_braking_margin_alerts_now():
+    # Gap is above the 2 km rear-end distance but within safe + braking distance:
+    # separation is already lost, so the forecast reports it at t = 0
+    trains, pairs, forecast = _forecast(2.5, 110, 40)
+    assert rear_end_alerts(trains, pairs) == []
+    assert forecast.time_s.tolist() == [0.0]
+    alerts = predicted_alerts(trains, forecast)
+    assert len(alerts) == 1 and alerts[0].type == AlertType.MAJOR and alerts[0].predicted_in_s == 0.0
+
+def test_opening_or_far_pairs_are_not_predicted():
+    assert len(_forecast(2.5, 40, 110)[2].time_s) == 0   # leader pulling away
+    assert len(_forecast(50.0, 110, 40, horizon_s=60)[2].time_s) == 0  # beyond the horizon
@@ -0,0 +1,82 @@
+import copy
+from simulation.delta import DeltaEncoder, ENTITY_COLLECTIONS
+
+def _state(trains, weather="clear"):
+    return {"trains": copy.deepcopy(trains), "alerts": [], "suggestions": [], "weather": weather}
+
+def _apply(client: dict, event: str, payload: dict) -> dict:
+    # What a dashboard does with state_update / state_delta
+    if event == "state_update":
+        return {**payload, **{name: {str(e["id"]): dict(e) for e in payload[name]} for name in ENTITY_COLLECTIONS}}
+    assert payload["base_seq"] == client["seq"]
+    client = copy.deepcopy(client)
+    for name in ENTITY_COLLECTIONS:
+        diff = payload.get(name)
+        if not diff:
+            continue
+        for entity in diff["added"]:
+            client[name][str(entity["id"])] = dict(entity)
+        for eid, fields in diff["changed"].items():
+            client[name][eid].update(fields)
+        for eid in diff["removed"]:
+            del client[name][eid]
+    client.update({k: v for k, v in payload.items() if k not in ENTITY_COLLECTIONS})
+    return client
+
+TRAINS = [{"id": "A", "speed": 60.0, "distance": 10.0}, {"id": "B", "speed": 80.0, "distance": 40.0}]
+
+def test_first_frame_is_a_keyframe_then_deltas():
+    encoder = DeltaEncoder(keyframe_interval=30)
+    event, frame = encoder.encode(_state(TRAINS))
+    assert event == "state_update" and frame["keyframe"] and frame["seq"] == 1
+    event, delta = encoder.encode(_state(TRAINS))
+    assert event == "state_delta"
+    assert delta == {"seq": 2, "base_seq": 1, "keyframe": False}
+
+def test_sub_tolerance_moves_are_held_back_without_accumulating_error():
+    encoder = DeltaEncoder()
+    encoder.encode(_state(TRAINS))
+    trains = copy.deepcopy(TRAINS)
+    sent = []
+    for _ in range(5):
+        trains[0]["distance"] += 0.0004 # below the 1 m tolerance per tick
+        _, delta = encoder.encode(_state(trains))
+        sent.append(delta.get("trains", {}).get("changed", {}).get("A", {}).get("distance"))
+    # Sent once the drift from what the client has exceeds the tolerance
+    assert sent[:2] == [None, None] and sent[2] is not None
+    assert abs(encoder.mirror["trains"]["A"]["distance"] - trains[0]["distance"]) <= 0.001
+
+def test_added_removed_and_scalars():
+    encoder = DeltaEncoder()
+    encoder.encode(_state(TRAINS))
+    _, delta = encoder.encode(_state([TRAINS[1], {"id": "C", "speed": 0.0, "distance": 5.0}], weather="rain"))
+    assert delta["trains"]["added"] == [{"id": "C", "speed": 0.0, "distance": 5.0}]
+    assert delta["trains"]["removed"] == ["A"]
+    assert delta["trains"]["changed"] == {}
+    assert delta["weather"] == "rain"
+
+def test_keyframe_interval_and_forced_keyframes():
+    encoder = DeltaEncoder(keyframe_interval=3)
+    events = [encoder.encode(_state(TRAINS))[0] for _ in range(7)]
+    assert events == ["state_update", "state_delta", "state_delta", "state_update",
+                      "state_delta", "state_delta", "state_update"]
+    assert encoder.encode(_state(TRAINS), force_keyframe=True)[0] == "state_update"
+
+def test_client_replaying_deltas_matches_the_mirror():
+    encoder = DeltaEncoder(keyframe_interval=10)
+    client = None
+    trains = copy.deepcopy(TRAINS)
+    for tick in range(25):
+        for train in trains:
+            train["distance"] += train["speed"] / 3600.0
+        if tick == 8:
+            trains.append({"id": "C", "speed": 50.0, "distance": 0.0})
+        if tick == 15:
+            trains.pop(0)
+        client = _apply(client, *encoder.encode(_state(trains, weather="fog" if tick > 12 else "clear")))
+        snapshot = encoder.snapshot()
+        assert client["seq"] == snapshot["seq"] == tick + 1
+        assert client["trains"] == {e["id"]: e for e in snapshot["trains"]}
+        assert client["weather"] == snapshot["weather"]
+        for train in trains:
+            assert abs(client["trains"][train["id"]]["distance"] - train["distance"]) <= 0.001
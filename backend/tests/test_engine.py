@@ -0,0 +1,37 @@
+from simulation.engine import SimulationEngine, OFF_BLOCK_SPEED_LIMIT
+from simulation.models import Train, TrainStatus
+from simulation.train_table import TrainTable
+from simulation.conflict_detector import check_overspeed
+
+def _engine(speeds_at_km):
+    engine = SimulationEngine(sio=None)
+    engine.table = TrainTable([
+        Train(id=f"T{i}", name=f"T{i}", speed=speed, distance=km, lat=0.0, lng=0.0, status=TrainStatus.ON_TIME)
+        for i, (km, speed) in enumerate(speeds_at_km)
+    ])
+    return engine
+
+def test_overspeed_uses_the_block_speed_limit():
+    blocks = _engine([]).block_index.blocks
+    mid = lambda b: (b.start_km + b.end_km) / 2
+    engine = _engine([(mid(blocks[0]), 70.0), (mid(blocks[1]), 110.0), (mid(blocks[1]), 130.0)])
+    first, second = engine.block_index.blocks[:2]
+    first.speed_limit, second.speed_limit = 60, 120
+
+    hits = {i: block for i, block in engine._overspeeding(1.0)}
+    assert set(hits) == {0, 2} # 110 km/h is fine in a 120 block (the old flat 100 limit flagged it)
+    assert hits[0].id == first.id and hits[0].speed_limit == 60
+    assert first.speed_limit == 60 # the live block is not modified
+
+    # Weather lowers every block's limit
+    hits = {i: block.speed_limit for i, block in engine._overspeeding(0.5)}
+    assert hits == {0: 30, 1: 60, 2: 60}
+    alert = check_overspeed(engine.table.view()[2], second.copy(update={"speed_limit": 60}))
+    assert alert.kind == "overspeed" and "(Limit: 60)" in alert.message
+
+def test_trains_outside_every_block_keep_the_flat_limit():
+    engine = _engine([])
+    end = engine.block_index.ends[-1]
+    engine = _engine([(end + 5.0, OFF_BLOCK_SPEED_LIMIT + 10.0), (end + 5.0, OFF_BLOCK_SPEED_LIMIT - 10.0)])
+    hits = {i: block for i, block in engine._overspeeding(1.0)}
+    assert set(hits) == {0} and hits[0].speed_limit == OFF_BLOCK_SPEED_LIMIT
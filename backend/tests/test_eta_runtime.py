@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import torch
+from ml.definitions import ETALSTM, ETA_ARCH, arch_from_state_dict
+from ml.eta_runtime import ETARuntime
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    torch.manual_seed(0)
+    model = ETALSTM(**ETA_ARCH)
+    path = tmp_path / "eta_lstm.pth"
+    torch.save(model.state_dict(), path)
+    return path, model
+
+def test_arch_round_trip():
+    assert arch_from_state_dict(ETALSTM(**ETA_ARCH).state_dict()) == ETA_ARCH
+
+def test_runtime_matches_eager_model(checkpoint):
+    path, model = checkpoint
+    X = np.array([[80.0, 40.0, 0.0, 9.0], [30.0, 5.0, 12.0, 23.0]])
+    with torch.no_grad():
+        expected = model(torch.tensor(X, dtype=torch.float32).reshape(-1, 1, 4)).reshape(-1).numpy()
+    assert np.allclose(ETARuntime(str(path)).predict(X), expected, atol=1e-5)
+
+def test_runtime_rejects_other_architectures(tmp_path):
+    path = tmp_path / "eta_lstm.pth"
+    torch.save(ETALSTM(hidden_size=32).state_dict(), path)
+    with pytest.raises(ValueError):
+        ETARuntime(str(path))
+
+def test_loading_does_not_change_torch_threads(checkpoint):
+    threads = torch.get_num_threads()
+    ETARuntime(str(checkpoint[0]))
+    assert torch.get_num_threads() == threads
@@ -0,0 +1,57 @@
+import asyncio
+import os
+from forecast_cache import ForecastCache
+
+class FakeInference:
+    def __init__(self):
+        self.calls = []
+
+    async def run(self, model, method, *args):
+        self.calls.append(method)
+        await asyncio.sleep(0.01) # Prophet is slow; concurrent callers overlap
+        if method == "predict_congestion":
+            return [{"hour": h} for h in range(args[0])]
+
+def _cache(tmp_path, inference, **kwargs):
+    model_path = tmp_path / "congestion.pkl"
+    model_path.write_text("v1")
+    return ForecastCache(inference, max_horizon=48, model_path=str(model_path), **kwargs), model_path
+
+def test_concurrent_cold_gets_compute_once(tmp_path):
+    inference = FakeInference()
+    cache, _ = _cache(tmp_path, inference)
+
+    async def main():
+        return await asyncio.gather(*[cache.get(hours=12) for _ in range(10)])
+
+    results = asyncio.run(main())
+    assert inference.calls == ["predict_congestion"]
+    assert all(len(r["forecast"]) == 12 for r in results)
+
+def test_invalidate_recomputes_once(tmp_path):
+    inference = FakeInference()
+    cache, _ = _cache(tmp_path, inference)
+
+    async def main():
+        await cache.get()
+        cache.invalidate()
+        await asyncio.gather(*[cache.get() for _ in range(5)])
+
+    asyncio.run(main())
+    assert inference.calls == ["predict_congestion"] * 2
+
+def test_model_change_reloads_then_serves_from_cache(tmp_path):
+    inference = FakeInference()
+    cache, model_path = _cache(tmp_path, inference)
+
+    async def main():
+        await cache.get()
+        stat = os.stat(model_path)
+        os.utime(model_path, (stat.st_atime, stat.st_mtime + 10))
+        await asyncio.gather(*[cache.get() for _ in range(3)])
+        return await cache.get(hours=500)
+
+    result = asyncio.run(main())
+    assert inference.calls == ["predict_congestion", "reload_congestion_model", "predict_congestion"]
+    assert len(result["forecast"]) == 48 # clamped to the precomputed horizon
+    assert cache.hits >= 1
@@ -0,0 +1,108 @@
+import asyncio
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from ml_service import MLService
+from inference import MicroBatcher, DeadlineScorer, InferenceExecutor
+
+class FakeExecutor:
+    """Stands in for InferenceExecutor: row sums as scores, records batch sizes."""
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.calls = []
+
+    async def run(self, model, method, X):
+        self.calls.append(np.asarray(X).shape)
+        if self.delay_s:
+            await asyncio.sleep(self.delay_s)
+        return np.asarray(X).sum(axis=1)
+
+def test_micro_batcher_coalesces_concurrent_rows():
+    executor = FakeExecutor()
+    batcher = MicroBatcher(executor, "delay", "predict_delay_batch", n_features=3)
+
+    async def main():
+        return await asyncio.gather(*[batcher.submit([i, 1, 1]) for i in range(10)])
+
+    assert asyncio.run(main()) == [i + 2.0 for i in range(10)]
+    assert executor.calls == [(10, 3)]
+    assert batcher.stats()["avg_batch_size"] == 10
+
+def test_malformed_row_only_fails_its_own_request():
+    executor = FakeExecutor()
+    batcher = MicroBatcher(executor, "delay", "predict_delay_batch", n_features=3)
+
+    async def main():
+        return await asyncio.gather(
+            batcher.submit([0, 1, 5]), batcher.submit(["abc", 1, 5]), batcher.submit([0, 1]),
+            batcher.submit(["2", 1, 5]), return_exceptions=True,
+        )
+
+    good, bad_value, short, coerced = asyncio.run(main())
+    assert good == 6.0 and coerced == 8.0
+    assert isinstance(bad_value, ValueError) and isinstance(short, ValueError)
+    assert executor.calls == [(2, 3)]
+
+def test_predict_batch_rejects_ragged_rows():
+    executor = InferenceExecutor(ml_service=None)
+    with pytest.raises(ValueError):
+        asyncio.run(executor.predict_batch("conflict", [[1, 2, 3], [1, 2]]))
+
+def test_deadline_scorer_serves_stale_scores_on_miss():
+    executor = FakeExecutor(delay_s=0.05)
+    scorer = DeadlineScorer(executor, "conflict", "predict_conflict_batch", deadline_s=0.01, default=-1.0)
+    X = np.array([[1.0, 2.0], [3.0, 4.0]])
+
+    async def main():
+        first = await scorer.score(X, ["a", "b"])    # misses the deadline: defaults, stale
+        await asyncio.sleep(0.06)
+        second = await scorer.score(X, ["a", "b"])   # harvests the first call
+        return first, second
+
+    (scores1, stale1), (scores2, stale2) = asyncio.run(main())
+    assert scores1.tolist() == [-1.0, -1.0] and stale1.all()
+    assert scores2.tolist() == [3.0, 7.0]
+    assert scorer.misses >= 1
+
+def test_deadline_scorer_cache_is_bounded():
+    executor = FakeExecutor()
+    scorer = DeadlineScorer(executor, "conflict", "predict_conflict_batch", deadline_s=1.0, max_keys=5)
+
+    async def main():
+        for tick in range(4):
+            keys = [(tick, i) for i in range(3)]
+            await scorer.score(np.ones((3, 2)), keys)
+
+    asyncio.run(main())
+    assert len(scorer.last) == 5
+    assert list(scorer.last)[-3:] == [(3, 0), (3, 1), (3, 2)]
+
+def test_predict_endpoints_reject_malformed_rows_with_422(tmp_path, write_tree):
+    import main
+    write_tree(str(tmp_path))
+    service = MLService(str(tmp_path))
+    previous = main.ml_service, main.inference
+    main.ml_service, main.inference = service, InferenceExecutor(service)
+    try:
+        client = TestClient(main.app)
+        ok = client.post("/ml/predict/delay", json={"weather": 0, "priority": 1, "current_delay": 5})
+        assert ok.status_code == 200 and ok.json()["predicted_delay"] == pytest.approx(3.0)
+        ok = client.post("/ml/predict/delay/batch", json={"rows": [{"weather": 0, "priority": 1, "current_delay": 5}]})
+        assert ok.status_code == 200 and ok.json()["predicted_delay"] == pytest.approx([3.0])
+
+        bad = [
+            ("/ml/predict/delay", {"weather": 0, "priority": 1}),                          # missing field
+            ("/ml/predict/delay", {"weather": "fog", "priority": 1, "current_delay": 5}),  # non-numeric
+            ("/ml/predict/eta", {"speed": [1, 2], "dist": 1, "delay": 0, "hour": 8}),
+            ("/ml/predict/conflict/batch", {"rows": [{"track_id": 1, "time_gap": 2}]}),
+            ("/ml/predict/conflict/batch", {"rows": [3]}),
+            ("/ml/predict/delay/batch", {"rows": "nope"}),
+            ("/ml/predict/eta/batch", {"rows": [{"speed": None, "dist": 1, "delay": 0, "hour": 8}]}),
+        ]
+        for url, body in bad:
+            response = client.post(url, json=body)
+            assert response.status_code == 422, (url, body, response.text)
+            assert response.json()["detail"]
+    finally:
+        main.inference.shutdown()
+        main.ml_service, main.inference = previous
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import os
+import pytest
+from fastapi.testclient import TestClient
+from ml_service import MLService, LoadState, MODEL_NAMES
+from model_registry import ModelRegistry, ACTIVE_FILE, MANIFEST_FILE
+
+def test_models_load_lazily_on_first_use(tmp_path, write_tree):
+    write_tree(str(tmp_path))
+    service = MLService(str(tmp_path))
+    assert all(status.state == LoadState.NOT_LOADED for status in service.status.values())
+    assert not service.is_ready()
+
+    assert service.predict_delay(0, 1, 5.0) == pytest.approx(3.0)
+    assert service.status["delay"].state == LoadState.READY
+    assert service.status["eta"].state == LoadState.NOT_LOADED # untouched models stay unloaded
+
+    service.warm_up()
+    assert service.is_ready()
+    assert {name for name, s in service.status.items() if s.state == LoadState.FAILED} == set(MODEL_NAMES) - {"delay"}
+    assert "not found" in service.status["conflict"].error
+
+def test_health_ready_is_503_until_models_settle(tmp_path, write_tree):
+    import main
+    write_tree(str(tmp_path))
+
+    class Engine:
+        running = True
+
+    service = MLService(str(tmp_path), version="v1")
+    previous = main.ml_service, main.simulation_engine
+    main.ml_service, main.simulation_engine = service, Engine()
+    try:
+        client = TestClient(main.app) # no lifespan: state is set by hand
+        response = client.get("/health/ready")
+        assert response.status_code == 503 and response.json()["ready"] is False
+        assert response.json()["models"]["delay"]["state"] == "not_loaded"
+        service.warm_up()
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        assert response.json()["ready"] is True and response.json()["model_version"] == "v1"
+        assert response.json()["models"]["delay"]["state"] == "ready"
+    finally:
+        main.ml_service, main.simulation_engine = previous
+
+def test_pinned_version_is_verified_on_first_load_not_on_open(tmp_path, monkeypatch, write_tree):
+    root = str(tmp_path)
+    write_tree(os.path.join(root, "v1"))
+    with open(os.path.join(root, "v1", MANIFEST_FILE), "w") as f:
+        json.dump({"files": {"delay_gb.npz": {"sha256": "0" * 64}}}, f) # altered after publishing
+    with open(os.path.join(root, ACTIVE_FILE), "w") as f:
+        f.write("v1")
+    registry = ModelRegistry(root)
+    checks = []
+    verify = registry.verify
+    monkeypatch.setattr(registry, "verify", lambda version: (checks.append(version.version), verify(version)))
+
+    service = registry.open()
+    assert checks == [] and registry.active == "v1"
+
+    # The warm-up thread pays for the checksums; a mismatch fails every model once
+    asyncio.run(asyncio.to_thread(service.warm_up))
+    assert checks == ["v1"]
+    assert service.is_ready()
+    assert all(s.state == LoadState.FAILED and "checksum mismatch" in s.error for s in service.status.values())
+    assert "v1" in registry.rejected
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+import pytest
+from model_registry import ModelRegistry, sha256_file, ACTIVE_FILE, MANIFEST_FILE
+
+def _publish(root, version, age_s=0, content=b"weights", sha=None):
+    # Same layout ml/train.py writes: <root>/<version>/ + manifest.json
+    path = os.path.join(root, version)
+    os.makedirs(path)
+    artifact = os.path.join(path, "notes.bin")
+    with open(artifact, "wb") as f:
+        f.write(content)
+    manifest = {
+        "created_at": (datetime(2026, 1, 1) + timedelta(seconds=age_s)).isoformat(),
+        "files": {"notes.bin": {"sha256": sha or sha256_file(artifact), "size": len(content)}},
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f)
+
+def _pinned(root):
+    with open(os.path.join(root, ACTIVE_FILE)) as f:
+        return f.read()
+
+def test_checksum_mismatch_is_rejected(tmp_path):
+    root = str(tmp_path)
+    _publish(root, "v1", sha="0" * 64)
+    registry = ModelRegistry(root)
+    registry.open()
+
+    with pytest.raises(ValueError, match="checksum mismatch"):
+        asyncio.run(registry.load("v1"))
+    assert registry.active is None and "v1" in registry.rejected
+    assert not os.path.exists(os.path.join(root, ACTIVE_FILE))
+
+def test_missing_artifact_and_unknown_version_are_rejected(tmp_path):
+    root = str(tmp_path)
+    _publish(root, "v1")
+    os.remove(os.path.join(root, "v1", "notes.bin"))
+    registry = ModelRegistry(root)
+    registry.open()
+    with pytest.raises(ValueError, match="missing artifact"):
+        asyncio.run(registry.load("v1"))
+    with pytest.raises(ValueError, match="Unknown model version"):
+        asyncio.run(registry.load("v9"))
+
+def test_load_swaps_and_pins_then_rolls_back(tmp_path):
+    root = str(tmp_path)
+    _publish(root, "v1", age_s=0)
+    _publish(root, "v2", age_s=60, content=b"better weights")
+    registry = ModelRegistry(root)
+    legacy = registry.open()
+    swapped = []
+    registry.on_swap(swapped.append)
+    assert [v.version for v in registry.versions()] == ["v1", "v2"]
+
+    async def scenario():
+        await registry.load("v1")
+        await registry.load("v2")
+        return await registry.rollback()
+
+    version = asyncio.run(scenario())
+    assert version.version == "v1"
+    assert registry.active == "v1" and registry.previous == "v2"
+    assert _pinned(root) == "v1"
+    assert [s.version for s in swapped] == ["v1", "v2", "v1"]
+    assert registry.service is swapped[-1] and registry.service is not legacy
+    assert registry.status()["pinned"] == "v1"
+
+def test_rollback_without_previous_version(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    registry.open()
+    with pytest.raises(ValueError, match="No previous"):
+        asyncio.run(registry.rollback())
+
+def test_open_uses_the_pinned_version(tmp_path):
+    root = str(tmp_path)
+    _publish(root, "v1")
+    with open(os.path.join(root, ACTIVE_FILE), "w") as f:
+        f.write("v1")
+    registry = ModelRegistry(root)
+    service = registry.open()
+    assert service.version == "v1" and registry.active == "v1"
+    assert service.models_dir == os.path.join(root, "v1")
@@ -0,0 +1,75 @@
+import asyncio
+import time
+import pytest
+from simulation.scheduler import TickScheduler, CatchUpPolicy
+
+async def _collect(scheduler, n, body_s=0.0):
+    ticks = []
+    async for tick in scheduler.ticks():
+        ticks.append(tick)
+        if body_s:
+            time.sleep(body_s) # blocking body, like a slow tick
+        if len(ticks) == n:
+            scheduler.stop()
+    return ticks
+
+def test_rejects_non_positive_rates():
+    with pytest.raises(ValueError):
+        TickScheduler(tick_interval=0)
+    with pytest.raises(ValueError):
+        TickScheduler(time_multiplier=-1)
+    with pytest.raises(ValueError):
+        TickScheduler().configure(time_multiplier=0)
+
+def test_time_multiplier_shortens_the_wall_period():
+    scheduler = TickScheduler(tick_interval=1.0, time_multiplier=50.0)
+    assert scheduler.period == pytest.approx(0.02)
+    start = time.monotonic()
+    ticks = asyncio.run(_collect(scheduler, 10))
+    elapsed = time.monotonic() - start
+    assert [t.seq for t in ticks] == list(range(10))
+    assert all(t.sim_dt == 1.0 for t in ticks)
+    assert ticks[-1].sim_time == pytest.approx(10.0)
+    # First tick fires immediately, then one period per tick
+    assert 9 * 0.02 <= elapsed < 9 * 0.02 + 0.15
+
+def test_deadlines_do_not_drift_with_body_time():
+    # Body takes half a period: absolute deadlines absorb it instead of adding it
+    scheduler = TickScheduler(tick_interval=1.0, time_multiplier=50.0)
+    start = time.monotonic()
+    asyncio.run(_collect(scheduler, 20, body_s=0.01))
+    elapsed = time.monotonic() - start
+    assert elapsed < 19 * 0.02 + 0.01 + 0.15
+    assert scheduler.stats.overruns == 0
+
+def test_skip_policy_folds_missed_ticks_into_sim_dt():
+    scheduler = TickScheduler(tick_interval=1.0, time_multiplier=100.0, policy=CatchUpPolicy.SKIP)
+    start = time.monotonic()
+    ticks = asyncio.run(_collect(scheduler, 6, body_s=0.035))
+    elapsed = time.monotonic() - start
+    assert any(t.sim_dt > 1.0 for t in ticks[1:])
+    assert scheduler.stats.skipped_ticks == sum(t.sim_dt - 1.0 for t in ticks)
+    assert scheduler.stats.overruns == 6
+    # Sim time stays locked to wall time (within a couple of periods)
+    assert ticks[-1].sim_time == pytest.approx((elapsed - 0.035) * 100.0, abs=4.0)
+
+def test_catch_up_policy_keeps_sim_dt_and_drops_beyond_budget():
+    scheduler = TickScheduler(tick_interval=1.0, time_multiplier=100.0, policy=CatchUpPolicy.CATCH_UP,
+                              max_catch_up_ticks=1)
+    ticks = asyncio.run(_collect(scheduler, 6, body_s=0.035))
+    assert all(t.sim_dt == 1.0 for t in ticks)
+    assert ticks[-1].sim_time == pytest.approx(6.0)
+    assert scheduler.stats.skipped_ticks > 0
+
+def test_fast_forward_is_unthrottled():
+    scheduler = TickScheduler(tick_interval=1.0, time_multiplier=1.0, fast_forward=True)
+    start = time.monotonic()
+    ticks = asyncio.run(_collect(scheduler, 200))
+    assert time.monotonic() - start < 0.5 # 200 simulated seconds, no waiting
+    assert ticks[-1].sim_time == pytest.approx(200.0)
+    assert all(t.lag == 0.0 for t in ticks)
+
+    async def slow_down():
+        scheduler.configure(fast_forward=False, time_multiplier=2.0)
+    asyncio.run(slow_down())
+    assert scheduler.stats.fast_forward is False and scheduler.stats.time_multiplier == 2.0
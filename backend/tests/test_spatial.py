@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+from simulation.spatial import GridIndex, Subscription
+
+def _brute_force(lat, lng, bbox):
+    south, west, north, east = bbox
+    return np.flatnonzero((lat >= south) & (lat <= north) & (lng >= west) & (lng <= east))
+
+@pytest.fixture
+def positions():
+    rng = np.random.default_rng(0)
+    return rng.uniform(-60, 60, 2000), rng.uniform(-170, 170, 2000)
+
+@pytest.mark.parametrize("bbox", [
+    (-90, -180, 90, 180),      # whole world
+    (10, 20, 30, 40),
+    (-5.3, -7.1, -5.0, -6.0),  # smaller than a cell
+    (70, 0, 80, 10),           # no trains
+])
+def test_query_matches_brute_force(positions, bbox):
+    lat, lng = positions
+    index = GridIndex()
+    index.rebuild(lat, lng)
+    assert np.array_equal(index.query(bbox), _brute_force(lat, lng, bbox))
+
+def test_world_bbox_only_touches_occupied_cells():
+    # Two trains, world-sized bbox: must not enumerate the ~26M empty cells
+    index = GridIndex(cell_deg=0.05)
+    index.rebuild(np.array([12.9, -33.8]), np.array([77.5, 151.2]))
+    assert index.query((-90, -180, 90, 180)).tolist() == [0, 1]
+
+def test_query_empty_index():
+    assert len(GridIndex().query((0, 0, 1, 1))) == 0
+
+@pytest.mark.parametrize("bbox", [
+    (10, 0, 5, 1),     # south > north
+    (0, 10, 1, 5),     # west > east
+    (-100, 0, 0, 1),   # latitude out of range
+    (0, 0, 1, 200),    # longitude out of range
+])
+def test_subscription_rejects_bad_bbox(bbox):
+    with pytest.raises(ValidationError):
+        Subscription(bbox=bbox)
+
+def test_subscription_select_filters_routes_and_trains():
+    index = GridIndex()
+    index.rebuild(np.array([1.0, 1.0, 1.0]), np.array([1.0, 1.0, 50.0]))
+    subscription = Subscription(bbox=(0, 0, 2, 2), route_ids=["R1"])
+    selected = subscription.select(index, ["T1", "T2", "T3"], ["R1", "R2", "R1"])
+    assert selected.tolist() == [0]
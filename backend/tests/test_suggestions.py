@@ -0,0 +1,69 @@
+import pytest
+from simulation import suggestions as rules
+from simulation.models import Train, Alert, AlertType, TrainStatus, Suggestion
+from simulation.suggestions import SuggestionEngine, generate_suggestions, alert_rule
+from simulation.train_table import TrainTable
+
+def _train(tid, status=TrainStatus.ON_TIME, speed=80.0):
+    return Train(id=tid, name=f"Train {tid}", speed=speed, distance=10.0, lat=0.0, lng=0.0, status=status)
+
+def _alert(aid, kind, train_ids, type=AlertType.CRITICAL, message="m"):
+    return Alert(id=aid, type=type, message=message, time="10:00:00", kind=kind, train_ids=train_ids)
+
+TRAINS = [_train("A"), _train("B"), _train("C", TrainStatus.DELAYED, 20.0), _train("D", TrainStatus.DELAYED, 0.0)]
+
+def test_rules_fire_in_alert_order_then_train_rules():
+    alerts = [_alert(2, "ml-conflict", ["A", "B"]), _alert(1, "rear-end", ["B", "A"]), _alert(3, "overspeed", ["A"])]
+    out = generate_suggestions(TRAINS, alerts)
+    assert [(s.rule, s.train_id, s.alert_id) for s in out] == [
+        ("reroute_to_loop", "A", 2), ("emergency_stop", "B", 1), ("apply_brakes", "A", 3), ("priority_pass", "C", None)]
+    assert out[1].id == "emergency-stop-1" and "Train B and Train A" in out[1].reason
+    assert "80%+" in out[0].reason
+
+def test_rules_for_a_kind_run_in_registration_order(monkeypatch):
+    monkeypatch.setattr(rules, "ALERT_RULES", {k: list(v) for k, v in rules.ALERT_RULES.items()})
+    monkeypatch.setattr(rules, "RULES", dict(rules.RULES))
+
+    @alert_rule("overspeed", min_severity=AlertType.MINOR)
+    def notify_driver(alert, trains):
+        return Suggestion(id=f"notify-{alert.id}", train_id=alert.train_ids[0], action="NOTIFY", reason="r",
+                          confidence=0.5)
+
+    out = generate_suggestions(TRAINS, [_alert(7, "overspeed", ["A"])])
+    assert [s.rule for s in out if s.alert_id == 7] == ["apply_brakes", "notify_driver"]
+    # Below apply_brakes' MAJOR threshold only the MINOR rule fires
+    out = generate_suggestions(TRAINS, [_alert(7, "overspeed", ["A"], type=AlertType.MINOR)])
+    assert [s.rule for s in out if s.alert_id == 7] == ["notify_driver"]
+
+def test_unknown_kinds_and_alerts_without_trains_get_nothing():
+    out = generate_suggestions(TRAINS, [_alert(1, "predicted-rear-end", ["A", "B"]), _alert(2, "rear-end", [])])
+    assert all(s.alert_id is None for s in out)
+
+def test_candidates_mask_limits_models_built_on_the_live_table(monkeypatch):
+    trains = [_train(f"T{i}") for i in range(50)] + [_train("SLOW", TrainStatus.DELAYED, 25.0)]
+    view = TrainTable(trains).view()
+    seen = []
+    rule = rules.RULES["priority_pass"]
+    monkeypatch.setattr(rule, "fn", lambda train: seen.append(train.id) or rules.priority_pass(train))
+
+    out = SuggestionEngine().generate(view, [])
+    assert seen == ["SLOW"] and view.built == 1
+    assert [s.id for s in out] == ["priority-pass-SLOW"]
+    # Same suggestions as the plain-list path, which checks every train
+    assert [s.id for s in generate_suggestions(trains, [])] == ["priority-pass-SLOW"]
+
+def test_unchanged_alerts_and_trains_reuse_their_suggestions():
+    engine = SuggestionEngine()
+    alert = _alert(1, "rear-end", ["B", "A"], message="gap 0.9 km")
+    first = engine.generate(TRAINS, [alert])
+    # New message text, same severity: same suggestion objects
+    second = engine.generate(TRAINS, [alert.copy(update={"message": "gap 0.8 km"})])
+    assert [id(s) for s in second] == [id(s) for s in first]
+    assert engine.generated == 2 and engine.reused == 2
+
+    # Severity change regenerates; a cleared alert drops its cache entry
+    third = engine.generate(TRAINS, [alert.copy(update={"type": AlertType.MAJOR})])
+    assert third[0] is not first[0] and third[0].id == first[0].id
+    engine.generate(TRAINS, [])
+    assert engine._by_alert == {}
+    assert len({s.id for s in first + second + third}) == 2 # de-duplicated IDs, no per-tick churn
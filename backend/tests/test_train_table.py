@@ -0,0 +1,65 @@
+import numpy as np
+from simulation.models import Train, TrainStatus, TrainDirection
+from simulation.train_table import TrainTable, TrainView, WEATHER_FACTORS
+from simulation.suggestions import SuggestionEngine
+from simulation.conflict_detector import ConflictDetector, rear_end_alerts
+
+def _train(i, distance, speed=60.0, status=TrainStatus.ON_TIME, direction=TrainDirection.EASTBOUND):
+    return Train(id=f"T{i}", name=f"Train {i}", speed=speed, distance=distance, lat=0.0, lng=0.0,
+                 status=status, direction=direction)
+
+def test_advance_moves_by_direction_and_skips_stopped_trains():
+    table = TrainTable([
+        _train(0, 10.0, speed=36.0),
+        _train(1, 50.0, speed=36.0, direction=TrainDirection.WESTBOUND),
+        _train(2, 20.0, speed=36.0, status=TrainStatus.DELAYED),
+    ])
+    table.advance(WEATHER_FACTORS["clear"], dt=100)
+    # 36 km/h for 100 s = 1 km
+    assert np.allclose(table.distance, [11.0, 49.0, 20.0])
+
+def test_weather_slows_trains():
+    table = TrainTable([_train(0, 10.0, speed=36.0)])
+    table.advance(WEATHER_FACTORS["storm"], dt=100)
+    assert np.isclose(table.distance[0], 10.5)
+
+def test_models_round_trip():
+    trains = [_train(0, 10.0), _train(1, 30.0, direction=TrainDirection.WESTBOUND, status=TrainStatus.DELAYED)]
+    models = TrainTable(trains).to_models()
+    assert [(t.id, t.distance, t.status, t.direction) for t in models] == \
+        [(t.id, t.distance, t.status, t.direction) for t in trains]
+
+def test_view_builds_models_lazily():
+    table = TrainTable([_train(i, 3.0 * i) for i in range(20)])
+    view = table.view()
+    assert view.built == 0
+    assert view[5].id == "T5" and view[-1].id == "T19"
+    assert view[5] is view[5]
+    assert view.by_id["T7"].distance == 21.0 and "T99" not in view.by_id
+    assert view.built == 3
+    assert [t.id for t in view] == table.ids
+
+def test_detection_only_builds_models_for_alerted_trains():
+    # Only T10 / T11 are closer than the rear-end distance
+    distances = [5.0 * i for i in range(20)]
+    distances[11] = distances[10] + 0.5
+    table = TrainTable([_train(i, d) for i, d in enumerate(distances)])
+    view = table.view()
+    pairs = ConflictDetector().sweep(table.route_ids, table.direction, table.distance)
+    alerts = rear_end_alerts(view, pairs)
+    assert [a.train_ids for a in alerts] == [["T10", "T11"]]
+    assert view.built == 2
+
+def test_train_rule_prefilter_matches_full_scan():
+    trains = [
+        _train(0, 10.0, speed=30.0, status=TrainStatus.DELAYED),  # crawling: priority pass
+        _train(1, 20.0, speed=0.0, status=TrainStatus.DELAYED),   # stopped
+        _train(2, 30.0, speed=30.0),                              # on time
+        _train(3, 40.0, speed=90.0, status=TrainStatus.DELAYED),  # too fast
+    ]
+    table = TrainTable(trains)
+    view = table.view()
+    lazy = SuggestionEngine().generate(view, [])
+    full = SuggestionEngine().generate(table.to_models(), [])
+    assert [s.id for s in lazy] == [s.id for s in full] == ["priority-pass-T0"]
+    assert view.built == 1
@@ -0,0 +1,40 @@
+import importlib.util
+import os
+import numpy as np
+import pytest
+from ml.tree_ensemble import TreeEnsemble
+
+sklearn_ensemble = pytest.importorskip("sklearn.ensemble")
+
+# ml/export_trees.py lives in the training tree (its own "ml" directory), so load it by path
+_spec = importlib.util.spec_from_file_location(
+    "export_trees", os.path.join(os.path.dirname(__file__), "..", "..", "ml", "export_trees.py"))
+export_trees = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(export_trees)
+
+def _data(seed=0, n=600):
+    # Same shapes as the delay / conflict features: a categorical-ish column and two continuous ones
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([rng.integers(0, 3, n), rng.integers(1, 4, n), rng.gamma(2.0, 10.0, n)]).astype(np.float64)
+    y = 3.0 * X[:, 0] + 0.5 * X[:, 2] + rng.normal(0, 2.0, n)
+    return X[:400], y[:400], X[400:], y[400:]
+
+def test_gradient_boosting_export_matches_sklearn(tmp_path):
+    X, y, X_test, _ = _data()
+    model = sklearn_ensemble.GradientBoostingRegressor(n_estimators=40, max_depth=3, random_state=0).fit(X, y)
+    path = str(tmp_path / "gb.npz")
+    export_trees.export_gbr(model, path)
+    ensemble = TreeEnsemble(path)
+    assert np.allclose(ensemble.predict(X_test), model.predict(X_test), rtol=0, atol=1e-9)
+    assert np.allclose(ensemble.predict(X_test[:1]), model.predict(X_test[:1]), rtol=0, atol=1e-9)
+    assert ensemble.predict(np.empty((0, 3))).shape == (0,)
+
+def test_random_forest_export_matches_sklearn(tmp_path):
+    X, y, X_test, _ = _data(seed=1)
+    labels = (y > np.median(y)).astype(int)
+    model = sklearn_ensemble.RandomForestClassifier(n_estimators=25, max_depth=6, random_state=0).fit(X, labels)
+    path = str(tmp_path / "rf.npz")
+    export_trees.export_rf(model, path)
+    ensemble = TreeEnsemble(path)
+    assert np.allclose(ensemble.predict_proba(X_test), model.predict_proba(X_test), rtol=0, atol=1e-9)
+    assert (ensemble.predict(X_test) == model.predict(X_test)).mean() > 0.99 # ties at exactly 0.5 may differ
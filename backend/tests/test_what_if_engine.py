@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from simulation.models import Train, Block, TrainStatus, TrainDirection
+from simulation.routes import MAX_ROUTE_KM
+from simulation.scenarios import ScenarioConfig
+from simulation.train_table import TrainTable
+from simulation.what_if_engine import WhatIfEngine, along_route
+from simulation.ensemble import EnsembleSimulation
+
+EB, WB = TrainDirection.EASTBOUND, TrainDirection.WESTBOUND
+M = MAX_ROUTE_KM
+
+# Mirror-symmetric block layout, so a westbound run is the mirror image of an eastbound one
+CUTS = [0.0, 20.0, 50.0, M / 2, M - 50.0, M - 20.0, M]
+LIMITS = [80, 100, 120, 120, 100, 80]
+BLOCKS = {f"B{i}": Block(id=f"B{i}", section="s", start_km=a, end_km=b, status="free", speed_limit=limit)
+          for i, (a, b, limit) in enumerate(zip(CUTS[:-1], CUTS[1:], LIMITS))}
+MIRROR = {f"B{i}": f"B{len(LIMITS) - 1 - i}" for i in range(len(LIMITS))}
+
+SPECS = [(10.0, 90.0), (14.0, 60.0), (30.0, 110.0), (55.0, 40.0), (61.0, 100.0), (90.0, 70.0), (120.0, 80.0)]
+
+def _train(tid, speed, distance, direction=EB):
+    return Train(id=tid, name=tid, speed=speed, distance=distance, lat=0.0, lng=0.0,
+                 status=TrainStatus.ON_TIME, direction=direction)
+
+def _trains(direction, specs=SPECS):
+    return {f"T{i}": Train(id=f"T{i}", name=f"Train {i}", speed=speed, lat=0.0, lng=0.0,
+                           distance=d if direction == EB else M - d, status=TrainStatus.ON_TIME, direction=direction)
+            for i, (d, speed) in enumerate(specs)}
+
+def _run(trains, mode="step", horizon=60, blocks=BLOCKS, **modifiers):
+    engine = WhatIfEngine(trains, blocks)
+    engine.apply_scenario(ScenarioConfig(name="t", mode=mode, simulation_horizon_minutes=horizon, modifiers=modifiers))
+    return engine, engine.run(horizon_minutes=horizon)
+
+def test_along_route_is_its_own_inverse():
+    km = np.array([0.0, 12.5, M])
+    direction = np.array([1, -1, -1])
+    assert np.allclose(along_route(km, direction), [0.0, M - 12.5, 0.0])
+    assert np.allclose(along_route(along_route(km, direction), direction), km)
+
+@pytest.mark.parametrize("mode", ["step", "event"])
+def test_westbound_trains_run_towards_km_zero(mode):
+    # Free running (no signals, no caps below the speed): matches the live table's advance
+    trains = {"W": _train("W", 60.0, 100.0, WB),
+              "E": _train("E", 60.0, 10.0, EB)}
+    _, result = _run(trains, mode=mode, horizon=30)
+    table = TrainTable(list(trains.values()))
+    table.advance(dt=30 * 60)
+    assert [t.distance for t in result.final_trains] == pytest.approx(table.distance.tolist())
+    assert [t.distance for t in result.final_trains] == pytest.approx([70.0, 40.0])
+
+@pytest.mark.parametrize("mode", ["step", "event"])
+def test_westbound_run_mirrors_eastbound(mode):
+    _, east = _run(_trains(EB), mode=mode, block_maintenance=["B2"])
+    _, west = _run(_trains(WB), mode=mode, block_maintenance=[MIRROR["B2"]])
+    assert [M - t.distance for t in west.final_trains] == pytest.approx([t.distance for t in east.final_trains])
+    assert west.max_delays == pytest.approx(east.max_delays)
+    assert len(west.predicted_conflicts) == len(east.predicted_conflicts)
+    for block, pct in east.block_utilization.items():
+        assert west.block_utilization[MIRROR[block]] == pytest.approx(pct)
+
+@pytest.mark.parametrize("direction", [EB, WB])
+def test_westbound_arrivals_stop_at_km_zero(direction):
+    trains = {"A": _train("A", 100.0, M - 5.0 if direction == EB else 5.0, direction)}
+    for mode in ("step", "event"):
+        engine, result = _run(trains, mode=mode, horizon=10)
+        [train] = result.final_trains
+        assert train.status == TrainStatus.STOPPED
+        assert train.distance == (M if direction == EB else 0.0)
+        assert engine.etas["A"] is not None
+
+def test_opposing_trains_do_not_signal_each_other():
+    # Head to head on a double line: neither is "ahead" of the other
+    trains = {"E": _train("E", 60.0, 60.0, EB),
+              "W": _train("W", 60.0, 61.0, WB)}
+    for mode in ("step", "event"):
+        _, result = _run(trains, mode=mode, horizon=10)
+        assert [t.distance for t in result.final_trains] == pytest.approx([70.0, 51.0])
+        assert all(d == 0 for d in result.max_delays.values())
+
+@pytest.mark.parametrize("direction", [EB, WB])
+def test_step_and_event_modes_agree(direction):
+    _, step = _run(_trains(direction), mode="step", weather="rain")
+    _, event = _run(_trains(direction), mode="event", weather="rain")
+    for a, b in zip(step.final_trains, event.final_trains):
+        assert a.distance == pytest.approx(b.distance, abs=1.0)
+        assert a.status == b.status
+    assert step.max_delays == pytest.approx(event.max_delays, abs=1.0)
+
+def test_maintenance_window_holds_then_releases():
+    trains = {"A": _train("A", 60.0, 15.0, EB)}
+    window = [{"block_id": "B1", "start_minute": 0, "end_minute": 20}]
+    for mode in ("step", "event"):
+        _, result = _run(trains, mode=mode, horizon=30, maintenance_windows=window)
+        # Runs 5 km to the B1 boundary, waits until minute 20, then 10 min at 60 km/h
+        assert result.final_trains[0].distance == pytest.approx(30.0, abs=0.2)
+        assert result.max_delays["A"] == pytest.approx(15.0, abs=0.5)
+
+def test_ensemble_is_reproducible_and_direction_aware():
+    # A westbound train standing at km 80 with a fast westbound follower behind it
+    # (higher km), and an eastbound train level with them: only the westbound pair
+    # can conflict, and only the follower is held at the signal
+    trains = {
+        "W1": _train("W1", 0.0, 80.0, WB),
+        "W2": _train("W2", 110.0, 86.0, WB),
+        "E1": _train("E1", 60.0, 81.0, EB),
+    }
+    config = ScenarioConfig(name="t", simulation_horizon_minutes=30, modifiers={})
+    runs = [EnsembleSimulation(trains, BLOCKS, config, realizations=200, seed=7, incident_rate_per_hour=0.0).run(30)
+            for _ in range(2)]
+    assert runs[0].delay_percentiles == runs[1].delay_percentiles
+    assert {tuple(sorted(c.train_ids)) for c in runs[0].conflict_probabilities} == {("W1", "W2")}
+    assert runs[0].delay_percentiles["W2"]["p50"] > 0
+    assert runs[0].delay_percentiles["E1"]["p50"] == 0
@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from simulation.models import Train, Block, TrainStatus
+from simulation.scenarios import ScenarioConfig
+from simulation.ensemble import EnsembleRequest
+from simulation.what_if_engine import WhatIfEngine
+from api.what_if import SlotStreamingResponse
+from what_if_jobs import WhatIfJobQueue, JobQueueFull, JobStatus
+
+TRAINS = {"A": Train(id="A", name="A", speed=60.0, distance=10.0, lat=0.0, lng=0.0, status=TrainStatus.ON_TIME)}
+BLOCKS = {"B0": Block(id="B0", section="s", start_km=0.0, end_km=50.0, status="free")}
+
+def _config(horizon=20):
+    return ScenarioConfig(name="t", simulation_horizon_minutes=horizon, modifiers={})
+
+class FakeSio:
+    def __init__(self):
+        self.events = []
+
+    async def emit(self, event, data):
+        self.events.append((event, data))
+
+async def _wait_finished(jobs, job_id, timeout=10.0):
+    for _ in range(int(timeout / 0.02)):
+        if jobs.get(job_id).status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED):
+            return jobs.get(job_id)
+        await asyncio.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+def test_job_runs_and_relays_progress():
+    sio = FakeSio()
+
+    async def scenario():
+        jobs = WhatIfJobQueue(sio, max_workers=1, max_queued=1, niceness=0)
+        try:
+            job = await jobs.submit(TRAINS, BLOCKS, _config(horizon=20))
+            job = await _wait_finished(jobs, job.id)
+            await asyncio.sleep(0.1) # let the relayed emits go out
+            return jobs, job
+        finally:
+            jobs.stop()
+
+    jobs, job = asyncio.run(scenario())
+    assert job.status == JobStatus.COMPLETED
+    assert jobs.result(job.id)["final_trains"][0]["distance"] == pytest.approx(30.0)
+    statuses = [data["status"] for _, data in sio.events]
+    assert statuses[0] == "queued" and statuses[-1] == "completed"
+    assert "running" in statuses # progress reports came through the relay thread
+    assert not jobs._tasks and not jobs._relay_thread.is_alive()
+
+def test_inline_runs_share_the_admission_cap():
+    async def scenario():
+        jobs = WhatIfJobQueue(max_workers=1, max_queued=1, niceness=0)
+        try:
+            result = await jobs.simulate(TRAINS, BLOCKS, _config())
+            ensemble = await jobs.ensemble(TRAINS, BLOCKS, EnsembleRequest(scenario=_config(), realizations=20, seed=1))
+            # A sweep holds one slot and a job the other: everything else is turned away
+            release = jobs.reserve()
+            job = await jobs.submit(TRAINS, BLOCKS, _config())
+            rejected = []
+            for call in (jobs.simulate(TRAINS, BLOCKS, _config()), jobs.submit(TRAINS, BLOCKS, _config())):
+                with pytest.raises(JobQueueFull):
+                    await call
+                rejected.append(jobs.stats()["rejected"])
+            with pytest.raises(JobQueueFull):
+                jobs.reserve()
+            stats = jobs.stats()
+            release()
+            release() # idempotent: the slot is only given back once
+            await _wait_finished(jobs, job.id)
+            return result, ensemble, rejected, stats, jobs.stats()
+        finally:
+            jobs.stop()
+
+    result, ensemble, rejected, full, after = asyncio.run(scenario())
+    engine = WhatIfEngine(TRAINS, BLOCKS)
+    engine.apply_scenario(_config())
+    assert result["final_trains"][0]["distance"] == engine.run(horizon_minutes=20).final_trains[0].distance
+    assert set(ensemble["delay_percentiles"]) == {"A"}
+    assert rejected == [1, 2]
+    assert full["inline"] == 1 and full["rejected"] == 3
+    assert after["inline"] == 0 and after["running"] + after["queued"] == 0
+
+def test_sweep_stream_gives_its_slot_back_when_the_body_never_starts():
+    jobs = WhatIfJobQueue(max_workers=1, max_queued=0)
+    started = []
+
+    async def lines():
+        started.append(True)
+        yield "x\n"
+
+    async def send(message):
+        raise OSError("client gone") # headers can't be sent
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def respond():
+        response = SlotStreamingResponse(lines(), jobs.reserve(), media_type="application/x-ndjson")
+        assert jobs.stats()["inline"] == 1
+        with pytest.raises(Exception):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+
+    asyncio.run(respond())
+    assert not started
+    assert jobs.stats()["inline"] == 0
+    jobs.reserve() # the slot is free again
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from simulation.models import Train, TrainStatus, TrainDirection, Alert, AlertType, Suggestion
+from simulation.train_table import TrainTable
+from simulation.wire import (HEADER, TRAIN_RECORD, TRAIN_STATUS_CODES, ALERT_FIELDS, SUGGESTION_FIELDS, pack_trains,
+                             unpack_trains, pack_alerts, pack_suggestions, pack_state, string_table)
+
+def _table():
+    trains = [
+        Train(id="12723", name="Telangana Exp", speed=87.34, distance=12.3456, lat=0.0, lng=0.0,
+              status=TrainStatus.ON_TIME),
+        Train(id="17010", name="Intercity", speed=0.0, distance=101.0004, lat=0.0, lng=0.0,
+              status=TrainStatus.STOPPED, direction=TrainDirection.WESTBOUND),
+        Train(id="07123", name="Special", speed=52.04, distance=0.0, lat=0.0, lng=0.0, status=TrainStatus.DELAYED),
+    ]
+    return TrainTable(trains)
+
+def test_round_trip_within_quantization():
+    table = _table()
+    buf = pack_trains(table, seq=42)
+    assert len(buf) == HEADER.size + len(table) * TRAIN_RECORD.itemsize
+    frame = unpack_trains(buf)
+    assert frame["seq"] == 42
+    assert frame["idx"].tolist() == [0, 1, 2]
+    assert np.abs(frame["lat"] - table.lat).max() <= 0.5e-6
+    assert np.abs(frame["lng"] - table.lng).max() <= 0.5e-6
+    assert np.abs(frame["speed"] - table.speed).max() <= 0.05
+    assert np.abs(frame["distance"] - table.distance).max() <= 0.0005
+    assert [TRAIN_STATUS_CODES[s] for s in frame["status"]] == ["on-time", "stopped", "delayed"]
+    assert frame["direction"].tolist() == [1, -1, 1]
+
+def test_subset_keeps_table_indices_and_string_table_resolves_them():
+    table = _table()
+    frame = unpack_trains(pack_trains(table, seq=1, idx=np.array([2, 0])))
+    names = string_table(table)
+    assert [names["ids"][i] for i in frame["idx"]] == ["07123", "12723"]
+    assert frame["speed"][0] == pytest.approx(52.0)
+
+def test_seq_wraps_and_bad_magic_is_rejected():
+    assert unpack_trains(pack_trains(_table(), seq=2 ** 32 + 5))["seq"] == 5
+    with pytest.raises(ValueError):
+        unpack_trains(b"JSON" + pack_trains(_table(), seq=1)[4:])
+
+def test_pack_state_uses_alert_type_codes():
+    alert = Alert(id=1, type=AlertType.CRITICAL, message="Head-on", time="10:00:00")
+    state = pack_state(_table(), [alert], [], seq=3, weather="rain")
+    assert isinstance(state["trains"], bytes) and state["weather"] == "rain"
+    code = state["alerts"][0][1]
+    assert string_table(_table())["alert_type_codes"][code] == AlertType.CRITICAL.value
+    assert pack_alerts([alert]) == state["alerts"]
+
+def test_eta_and_next_station_round_trip():
+    table = _table()
+    table.eta_min[:] = [42.37, np.nan, 0.0]
+    frame = unpack_trains(pack_trains(table, seq=1))
+    assert frame["eta"][0] == pytest.approx(42.4) and np.isnan(frame["eta"][1]) and frame["eta"][2] == 0.0
+    codes = string_table(table)["station_codes"]
+    for i, train in enumerate(table.to_models()):
+        assert codes[train.route_id][frame["next_station"][i]] == train.next_station_id
+
+def test_alerts_and_suggestions_carry_every_full_protocol_field():
+    alert = Alert(id=9, type=AlertType.MAJOR, message="Predicted rear-end", time="10:00:00", kind="predicted-rear-end",
+                  train_ids=["12723", "17010"], predicted_in_s=95.0, location_km=41.2, stale=True)
+    suggestion = Suggestion(id="s1", train_id="12723", action="HOLD", reason="r", confidence=0.8349, alert_id=9,
+                            rule="emergency_stop", explanation={"time_gap": 0.4})
+    [packed_alert] = pack_alerts([alert])
+    decoded = dict(zip(ALERT_FIELDS, packed_alert))
+    decoded["type"] = string_table(_table())["alert_type_codes"][decoded["type"]]
+    assert decoded == {**alert.dict(), "type": "major"}
+    [packed_suggestion] = pack_suggestions([suggestion])
+    assert dict(zip(SUGGESTION_FIELDS, packed_suggestion)) == {**suggestion.dict(), "confidence": 0.83}
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Set
+from pydantic import BaseModel
+from simulation.models import Train, Block
+from simulation.scenarios import ScenarioConfig
+from simulation.what_if_engine import WhatIfEngine
+from simulation.ensemble import EnsembleRequest, EnsembleSimulation
+
+# What-if job queue.
+# What-if runs are CPU-bound; run inline they freeze the live broadcast and every
+# other endpoint. Jobs go to a small process pool instead, with niced workers so
+# the live engine keeps priority. The synchronous /simulate and /ensemble runs go to
+# the same pool, and a streaming sweep holds a slot while it runs. Admission control
+# caps running + queued jobs plus those inline runs and rejects the rest (the
+# endpoint answers 429), so a burst of planner requests can't pile up unbounded work.
+# Workers report progress (simulated minutes, partial KPIs) through a manager queue;
+# one relay thread forwards it onto the event loop, where it goes out as Socket.IO
+# "what_if_job" events. Cancelling a queued job drops it; a running job stops at its
+# next progress report.
+
+WHAT_IF_WORKERS = max(1, min(2, (os.cpu_count() or 2) - 1))
+MAX_QUEUED_JOBS = 8
+KEEP_FINISHED_JOBS = 100
+WORKER_NICENESS = 10
+PROGRESS_EVERY_MIN = 5 # simulated minutes between progress reports
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+FINISHED = {JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED}
+
+class WhatIfJob(BaseModel):
+    id: str
+    name: str
+    status: JobStatus = JobStatus.QUEUED
+    horizon_minutes: int
+    submitted_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    progress: dict = {}
+    error: Optional[str] = None
+
+class JobQueueFull(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+# --- Worker side ---
+_progress_queue = None
+_cancelled = None
+
+def _init_job_worker(progress_queue, cancelled, niceness: int):
+    global _progress_queue, _cancelled
+    _progress_queue = progress_queue
+    _cancelled = cancelled
+    try:
+        os.nice(niceness) # the live engine runs in the parent; yield the CPU to it
+    except (AttributeError, OSError):
+        pass
+
+def _run_job(job_id: str, trains: Dict[str, Train], blocks: Dict[str, Block], config: ScenarioConfig) -> dict:
+    def report(progress: dict):
+        if job_id in _cancelled:
+            raise JobCancelled(job_id)
+        _progress_queue.put((job_id, progress))
+
+    report({"simulated_min": 0, "horizon_min": config.simulation_horizon_minutes})
+    engine = WhatIfEngine(trains, blocks)
+    engine.apply_scenario(config)
+    engine.progress = report
+    engine.progress_every_min = PROGRESS_EVERY_MIN
+    result = engine.run(horizon_minutes=config.simulation_horizon_minutes)
+    return json.loads(result.json())
+
+def _run_simulation(trains: Dict[str, Train], blocks: Dict[str, Block], config: ScenarioConfig) -> dict:
+    engine = WhatIfEngine(trains, blocks)
+    engine.apply_scenario(config)
+    return json.loads(engine.run(horizon_minutes=config.simulation_horizon_minutes).json())
+
+def _run_ensemble(trains: Dict[str, Train], blocks: Dict[str, Block], ensemble: EnsembleRequest) -> dict:
+    simulation = EnsembleSimulation(
+        trains, blocks, ensemble.scenario, realizations=ensemble.realizations, seed=ensemble.seed,
+        incident_rate_per_hour=ensemble.incident_rate_per_hour,
+    )
+    return json.loads(simulation.run(ensemble.scenario.simulation_horizon_minutes, ensemble.percentiles).json())
+
+def _snapshot(trains: Dict[str, Train], blocks: Dict[str, Block]):
+    # Copied on the loop: the pool pickles arguments later, from its feeder thread
+    return {tid: t.copy() for tid, t in trains.items()}, {bid: b.copy() for bid, b in blocks.items()}
+
+# --- Event loop side ---
+class WhatIfJobQueue:
+    def __init__(self, sio=None, max_workers: int = WHAT_IF_WORKERS, max_queued: int = MAX_QUEUED_JOBS,
+                 keep_finished: int = KEEP_FINISHED_JOBS, niceness: int = WORKER_NICENESS):
+        self.sio = sio
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self.niceness = niceness
+        self.jobs: "OrderedDict[str, WhatIfJob]" = OrderedDict()
+        self.rejected = 0
+        self.inline = 0 # /simulate, /ensemble and sweeps currently holding a slot
+        self._results: Dict[str, dict] = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._manager = None
+        self._progress = None
+        self._cancelled = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._relay_thread: Optional[threading.Thread] = None
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._manager = multiprocessing.Manager()
+            self._progress = self._manager.Queue()
+            self._cancelled = self._manager.dict()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_init_job_worker,
+                initargs=(self._progress, self._cancelled, self.niceness),
+            )
+            self._relay_thread = threading.Thread(
+                target=self._relay_progress, args=(self._progress, asyncio.get_running_loop()),
+                name="what-if-progress", daemon=True,
+            )
+            self._relay_thread.start()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def active(self) -> List[WhatIfJob]:
+        return [job for job in self.jobs.values() if job.status not in FINISHED]
+
+    def _admit(self):
+        if len(self.active()) + self.inline >= self.max_workers + self.max_queued:
+            self.rejected += 1
+            raise JobQueueFull(f"What-if queue is full ({self.max_workers} running, {self.max_queued} queued)")
+
+    def reserve(self) -> Callable[[], None]:
+        """
+        Take a slot for work run outside the pool (a sweep); raises JobQueueFull.
+        Returns the function that gives it back; calling it more than once is a no-op.
+        """
+        self._admit()
+        self.inline += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.inline -= 1
+        return release
+
+    async def submit(self, trains: Dict[str, Train], blocks: Dict[str, Block], config: ScenarioConfig) -> WhatIfJob:
+        """Raises JobQueueFull when the queue is at capacity."""
+        self._admit()
+        self._ensure_pool()
+
+        job = WhatIfJob(id=uuid.uuid4().hex[:12], name=config.name, horizon_minutes=config.simulation_horizon_minutes,
+                        submitted_at=datetime.now())
+        self.jobs[job.id] = job
+        # Snapshot of the live state at submission; the worker copies it again
+        trains, blocks = _snapshot(trains, blocks)
+        future = asyncio.get_running_loop().run_in_executor(self._pool, _run_job, job.id, trains, blocks, config)
+        self._futures[job.id] = future
+        self._spawn(self._watch(job, future))
+        await self._emit(job)
+        return job
+
+    async def _execute(self, fn, trains: Dict[str, Train], blocks: Dict[str, Block], *args) -> dict:
+        # Run to completion on the pool (no job record), counted against the same cap
+        release = self.reserve()
+        try:
+            self._ensure_pool()
+            trains, blocks = _snapshot(trains, blocks)
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, trains, blocks, *args)
+        finally:
+            release()
+
+    async def simulate(self, trains: Dict[str, Train], blocks: Dict[str, Block], config: ScenarioConfig) -> dict:
+        """SimulationResult as JSON; raises JobQueueFull when the queue is at capacity."""
+        return await self._execute(_run_simulation, trains, blocks, config)
+
+    async def ensemble(self, trains: Dict[str, Train], blocks: Dict[str, Block], ensemble: EnsembleRequest) -> dict:
+        """EnsembleResult as JSON; raises JobQueueFull when the queue is at capacity."""
+        return await self._execute(_run_ensemble, trains, blocks, ensemble)
+
+    async def _watch(self, job: WhatIfJob, future: asyncio.Future):
+        try:
+            self._results[job.id] = await future
+            job.status = JobStatus.COMPLETED
+            # Progress reports still in the relay queue are dropped once the job is done
+            job.progress = {**job.progress, "simulated_min": job.horizon_minutes, "horizon_min": job.horizon_minutes}
+        except (asyncio.CancelledError, JobCancelled):
+            job.status = JobStatus.CANCELLED
+        except Exception as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e) or type(e).__name__
+        job.finished_at = datetime.now()
+        self._futures.pop(job.id, None)
+        if self._cancelled is not None:
+            self._cancelled.pop(job.id, None)
+        await self._emit(job)
+        self._evict()
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
+            self._results.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[WhatIfJob]:
+        return self.jobs.get(job_id)
+
+    def result(self, job_id: str) -> Optional[dict]:
+        return self._results.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[WhatIfJob]:
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        # A running worker sees the flag at its next progress report
+        self._cancelled[job_id] = True
+        if job.status == JobStatus.QUEUED and self._futures[job_id].cancel():
+            job.status = JobStatus.CANCELLED
+            job.finished_at = datetime.now()
+        return job
+
+    async def _emit(self, job: WhatIfJob):
+        if self.sio:
+            await self.sio.emit("what_if_job", json.loads(job.json()))
+
+    def _relay_progress(self, progress_queue, loop: asyncio.AbstractEventLoop):
+        # Relay thread: blocks on the manager queue and hands reports to the loop
+        while True:
+            try:
+                item = progress_queue.get()
+            except (EOFError, OSError):
+                return # manager shut down
+            if item is None:
+                return # stop()
+            try:
+                loop.call_soon_threadsafe(self._on_progress, *item)
+            except RuntimeError:
+                return # loop closed
+
+    def _on_progress(self, job_id: str, progress: dict):
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return
+        if job.status == JobStatus.QUEUED:
+            job.status = JobStatus.RUNNING
+            job.started_at = datetime.now()
+        job.progress = progress
+        self._spawn(self._emit(job))
+
+    def stats(self) -> dict:
+        active = self.active()
+        return {
+            "running": sum(j.status == JobStatus.RUNNING for j in active),
+            "queued": sum(j.status == JobStatus.QUEUED for j in active),
+            "capacity": self.max_workers + self.max_queued,
+            "inline": self.inline,
+            "workers": self.max_workers,
+            "rejected": self.rejected,
+        }
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._progress.put(None) # wakes the relay thread
+            self._relay_thread.join(timeout=1.0)
+            self._manager.shutdown()
+            self._pool = None
+        for task in self._tasks:
+            task.cancel()
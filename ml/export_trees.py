@@ -0,0 +1,59 @@
+import numpy as np
+
+# Flattens trained sklearn tree ensembles into contiguous node arrays (.npz) that the
+# backend evaluates with plain NumPy (backend/ml/tree_ensemble.py), so serving
+# predictions needs no sklearn import.
+#
+# Layout: all trees' nodes concatenated; `roots` holds each tree's first node and
+# children are global node indices (-1 at leaves). `value` is the per-node output:
+# the regression value for GBR trees, the positive-class probability for RF trees.
+# prediction = base + scale * sum(value[leaf] over trees)
+
+def _flatten(trees, leaf_values):
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    depth = 0
+    for tree, leaf_value in zip(trees, leaf_values):
+        roots.append(offset)
+        children_left = tree.children_left.astype(np.int64)
+        children_right = tree.children_right.astype(np.int64)
+        feature.append(tree.feature.astype(np.int32))
+        threshold.append(tree.threshold.astype(np.float64))
+        left.append(np.where(children_left >= 0, children_left + offset, -1))
+        right.append(np.where(children_right >= 0, children_right + offset, -1))
+        value.append(leaf_value.astype(np.float64))
+        offset += tree.node_count
+        depth = max(depth, tree.max_depth)
+    return {
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left),
+        "right": np.concatenate(right),
+        "value": np.concatenate(value),
+        "roots": np.array(roots, dtype=np.int64),
+        "max_depth": np.int64(depth),
+    }
+
+def export_gbr(model, path: str):
+    """GradientBoostingRegressor -> npz. base is the init estimator's constant."""
+    trees = [est.tree_ for est in model.estimators_[:, 0]]
+    arrays = _flatten(trees, [t.value[:, 0, 0] for t in trees])
+    if model.init_ == "zero":
+        base = 0.0
+    else:
+        base = float(np.ravel(model.init_.predict(np.zeros((1, model.n_features_in_))))[0])
+    np.savez(path, kind="regressor", base=np.float64(base), scale=np.float64(model.learning_rate),
+             n_features=np.int64(model.n_features_in_), **arrays)
+
+def export_rf(model, path: str, positive_class=1):
+    """RandomForestClassifier -> npz of positive-class probabilities (mean over trees)."""
+    col = list(model.classes_).index(positive_class)
+    trees = [est.tree_ for est in model.estimators_]
+    probs = []
+    for t in trees:
+        counts = t.value[:, 0, :]
+        totals = counts.sum(axis=1)
+        probs.append(counts[:, col] / np.where(totals == 0, 1, totals))
+    arrays = _flatten(trees, probs)
+    np.savez(path, kind="classifier", base=np.float64(0.0), scale=np.float64(1.0 / len(trees)),
+             n_features=np.int64(model.n_features_in_), **arrays)
@@ -3,17 +3,25 @@ import numpy as np
 import torch
 import joblib
 import os
+import sys
 import json
+import hashlib
+import sklearn
+from datetime import datetime
 from sklearn.ensemble import GradientBoostingRegressor, RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from prophet import Prophet
 import shap
-from definitions import ETALSTM
+from export_trees import export_gbr, export_rf
+# The ETA architecture is defined once, in backend/ml/definitions.py (the runtime checks
+# checkpoints against it)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from ml.definitions import ETALSTM
 
 MODELS_DIR = "ml/models"
 DATA_DIR = "datasets"
 
-def train_eta_model():
+def train_eta_model(models_dir=MODELS_DIR):
     print("Training ETA LSTM Model...")
     df = pd.read_csv(f"{DATA_DIR}/historical_movements.csv")
     
@@ -43,10 +51,10 @@ def train_eta_model():
         loss.backward()
         optimizer.step()
         
-    torch.save(model.state_dict(), f"{MODELS_DIR}/eta_lstm.pth")
+    torch.save(model.state_dict(), f"{models_dir}/eta_lstm.pth")
     print("ETA Model Saved.")
 
-def train_delay_model():
+def train_delay_model(models_dir=MODELS_DIR):
     print("Training Delay Prediction Model (XGBoost/GBR)...")
     df = pd.read_csv(f"{DATA_DIR}/historical_movements.csv")
     
@@ -60,16 +68,18 @@ def train_delay_model():
     model = GradientBoostingRegressor(n_estimators=100)
     model.fit(X, y)
     
-    joblib.dump(model, f"{MODELS_DIR}/delay_gb.pkl")
+    joblib.dump(model, f"{models_dir}/delay_gb.pkl")
+    # Flattened node arrays for the backend's NumPy evaluator
+    export_gbr(model, f"{models_dir}/delay_gb.npz")
     print("Delay Model Saved.")
     
     # Train SHAP Explainer for Delay Model
     print("Training SHAP Explainer for Delay Model...")
     explainer = shap.Explainer(model, X)
-    joblib.dump(explainer, f"{MODELS_DIR}/delay_shap.pkl")
+    joblib.dump(explainer, f"{models_dir}/delay_shap.pkl")
     print("Delay SHAP Explainer Saved.")
 
-def train_conflict_model():
+def train_conflict_model(models_dir=MODELS_DIR):
     print("Training Conflict Probability Model (Random Forest)...")
     df = pd.read_csv(f"{DATA_DIR}/conflict_cases.csv")
     
@@ -79,17 +89,18 @@ def train_conflict_model():
     model = RandomForestClassifier(n_estimators=50)
     model.fit(X, y)
     
-    joblib.dump(model, f"{MODELS_DIR}/conflict_rf.pkl")
+    joblib.dump(model, f"{models_dir}/conflict_rf.pkl")
+    export_rf(model, f"{models_dir}/conflict_rf.npz")
     print("Conflict Model Saved.")
     
     # Train SHAP Explainer for Conflict Model
     print("Training SHAP Explainer for Conflict Model...")
     # TreeExplainer is better for RF
     explainer = shap.TreeExplainer(model)
-    joblib.dump(explainer, f"{MODELS_DIR}/conflict_shap.pkl")
+    joblib.dump(explainer, f"{models_dir}/conflict_shap.pkl")
     print("Conflict SHAP Explainer Saved.")
 
-def train_congestion_model():
+def train_congestion_model(models_dir=MODELS_DIR):
     print("Training Congestion Forecasting Model (Prophet)...")
     df = pd.read_csv(f"{DATA_DIR}/historical_movements.csv")
     
@@ -111,15 +122,51 @@ def train_congestion_model():
     
     # Save Prophet model
     # joblib works for Prophet objects in recent versions
-    joblib.dump(model, f"{MODELS_DIR}/congestion_prophet.pkl")
+    joblib.dump(model, f"{models_dir}/congestion_prophet.pkl")
     print("Congestion Model Saved.")
 
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def publish_version(version_dir):
+    # Manifest with a checksum per artifact; the backend verifies it before loading
+    files = {
+        name: {"sha256": _sha256(os.path.join(version_dir, name)), "bytes": os.path.getsize(os.path.join(version_dir, name))}
+        for name in sorted(os.listdir(version_dir))
+        if name != "manifest.json"
+    }
+    manifest = {
+        "version": os.path.basename(version_dir),
+        "created_at": datetime.now().isoformat(),
+        "files": files,
+        "metadata": {
+            "torch": torch.__version__,
+            "sklearn": sklearn.__version__,
+            "datasets": sorted(os.listdir(DATA_DIR)),
+        },
+    }
+    with open(os.path.join(version_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Point ACTIVE at the new version (atomic rename); running backends hot-reload it
+    active = os.path.join(MODELS_DIR, "ACTIVE")
+    with open(f"{active}.tmp", "w") as f:
+        f.write(manifest["version"])
+    os.replace(f"{active}.tmp", active)
+    print(f"Published model version {manifest['version']}")
+
 if __name__ == "__main__":
-    if not os.path.exists(MODELS_DIR):
-        os.makedirs(MODELS_DIR)
-        
-    train_eta_model()
-    train_delay_model()
-    train_conflict_model()
-    train_congestion_model()
+    # Each run writes a new versioned directory: ml/models/<version>/
+    version_dir = os.path.join(MODELS_DIR, datetime.now().strftime("v%Y%m%d-%H%M%S"))
+    os.makedirs(version_dir)
+
+    train_eta_model(version_dir)
+    train_delay_model(version_dir)
+    train_conflict_model(version_dir)
+    train_congestion_model(version_dir)
+    publish_version(version_dir)
 